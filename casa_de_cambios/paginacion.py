@@ -0,0 +1,236 @@
+# casa_de_cambios/paginacion.py
+"""
+Paginación por cursor (*keyset*) para listados históricos grandes.
+
+En lugar de ``OFFSET`` + ``COUNT(*)`` en cada página, cada página se pide a
+partir de los valores de ordenamiento de la última fila vista
+(``WHERE (fecha, id) < (%s, %s) ORDER BY fecha DESC, id DESC LIMIT n``), de modo
+que la página N cuesta lo mismo que la primera si existe un índice sobre las
+columnas de orden. Los cursores son opacos (firmados) y el total puede ser
+estimado por el planificador en lugar de contado.
+"""
+import json
+from urllib.parse import urlencode
+
+from django.core import signing
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+_SALT = 'casa_de_cambios.paginacion'
+
+# Motores que comparan filas completas: (a, b) < (x, y).
+_COMPARACION_DE_FILAS = {'postgresql', 'sqlite', 'mysql'}
+
+
+class PaginaKeyset:
+    """
+    Una página de resultados paginados por cursor.
+
+    :param object_list: Filas de la página, en el orden pedido.
+    :type object_list: list
+    :param cursor_siguiente: Cursor de la página siguiente o ``None``.
+    :type cursor_siguiente: str | None
+    :param cursor_anterior: Cursor de la página anterior o ``None``.
+    :type cursor_anterior: str | None
+    :param total: Total de filas (exacto o estimado) o ``None``.
+    :type total: int | None
+    :param total_estimado: Indica si ``total`` es una estimación.
+    :type total_estimado: bool
+    """
+
+    def __init__(self, object_list, cursor_siguiente, cursor_anterior, total=None, total_estimado=False):
+        self.object_list = object_list
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.total = total
+        self.total_estimado = total_estimado
+        self.url_siguiente = None
+        self.url_anterior = None
+
+    @property
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _campos(orden):
+    return [(campo.lstrip('-'), campo.startswith('-')) for campo in orden]
+
+
+def _codificar(modelo, orden, fila, direccion):
+    valores = [
+        modelo._meta.get_field(nombre).value_to_string(fila)
+        for nombre, _ in _campos(orden)
+    ]
+    return signing.dumps({'v': valores, 'd': direccion}, salt=_SALT, compress=True)
+
+
+def _decodificar(modelo, orden, cursor):
+    datos = signing.loads(cursor, salt=_SALT)
+    campos = _campos(orden)
+    if len(datos['v']) != len(campos) or datos['d'] not in ('s', 'a'):
+        raise signing.BadSignature('cursor incompatible')
+    valores = [
+        modelo._meta.get_field(nombre).to_python(valor)
+        for (nombre, _), valor in zip(campos, datos['v'])
+    ]
+    return valores, datos['d']
+
+
+def _despues_de(queryset, orden, valores, hacia_atras):
+    """
+    Condición "fila posterior al cursor" para un orden compuesto.
+
+    Si todos los campos van en el mismo sentido se compara la fila entera,
+    ``(a, b) > (va, vb)`` (``<`` si el orden es descendente), que PostgreSQL
+    resuelve con un único rango sobre el índice de las columnas de orden. Con
+    sentidos mezclados, o en motores sin comparación de filas, se expande a
+    ``a > va OR (a = va AND b > vb) OR ...``.
+    """
+    campos = _campos(orden)
+    conexion = connections[queryset.db]
+    sentidos = {desc for _, desc in campos}
+    if len(sentidos) == 1 and conexion.vendor in _COMPARACION_DE_FILAS:
+        opts = queryset.model._meta
+        qn = conexion.ops.quote_name
+        columnas, params = [], []
+        for (nombre, _), valor in zip(campos, valores):
+            campo = opts.get_field(nombre)
+            columnas.append(f'{qn(opts.db_table)}.{qn(campo.column)}')
+            params.append(campo.get_db_prep_value(valor, conexion))
+        operador = '<' if sentidos.pop() != hacia_atras else '>'
+        return RawSQL(
+            f"({', '.join(columnas)}) {operador} ({', '.join(['%s'] * len(params))})",
+            params,
+            output_field=BooleanField(),
+        )
+
+    condicion = Q()
+    iguales = Q()
+    for (nombre, desc), valor in zip(campos, valores):
+        menor = desc != hacia_atras
+        paso = Q(**{f'{nombre}__{"lt" if menor else "gt"}': valor})
+        condicion |= iguales & paso
+        iguales &= Q(**{nombre: valor})
+    return condicion
+
+
+def _invertir(orden):
+    return [campo[1:] if campo.startswith('-') else f'-{campo}' for campo in orden]
+
+
+def estimar_total(queryset, umbral=1000):
+    """
+    Total de filas de un queryset sin ``COUNT(*)`` sobre tablas grandes.
+
+    En PostgreSQL se usa la estimación del planificador (``EXPLAIN``); si es
+    menor que ``umbral`` se cuenta exacto, ya que es barato. En otros motores
+    se cuenta siempre.
+
+    :return: ``(total, es_estimado)``
+    :rtype: tuple
+    """
+    queryset = queryset.order_by()
+    conexion = connections[queryset.db]
+    if conexion.vendor == 'postgresql':
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:  # queryset.none()
+            return 0, False
+        with conexion.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimado = int(plan[0]['Plan']['Plan Rows'])
+        if estimado >= umbral:
+            return estimado, True
+    return queryset.count(), False
+
+
+def paginar_keyset(queryset, orden, cursor=None, por_pagina=20, contar='estimado'):
+    """
+    Devuelve una página de ``queryset`` ordenado por ``orden`` a partir de ``cursor``.
+
+    ``orden`` debe identificar unívocamente cada fila (terminar en ``id`` o
+    ``-id``) y coincidir con un índice para que el costo sea constante.
+
+    :param queryset: Queryset ya filtrado.
+    :type queryset: django.db.models.QuerySet
+    :param orden: Campos de orden, p. ej. ``['-fecha', '-id']``.
+    :type orden: list
+    :param cursor: Cursor opaco recibido de una página anterior; inválido = primera página.
+    :type cursor: str | None
+    :param por_pagina: Filas por página.
+    :type por_pagina: int
+    :param contar: ``'estimado'``, ``'exacto'`` o ``None`` para no contar.
+    :type contar: str | None
+    :rtype: PaginaKeyset
+    """
+    modelo = queryset.model
+    valores, direccion = None, 's'
+    if cursor:
+        try:
+            valores, direccion = _decodificar(modelo, orden, cursor)
+        except (signing.BadSignature, ValueError, TypeError, KeyError):
+            valores, direccion = None, 's'
+
+    hacia_atras = direccion == 'a'
+    qs = queryset.order_by(*(_invertir(orden) if hacia_atras else orden))
+    if valores is not None:
+        qs = qs.filter(_despues_de(qs, orden, valores, hacia_atras))
+
+    filas = list(qs[:por_pagina + 1])
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if hacia_atras:
+        filas.reverse()
+
+    # Hacia adelante, hay página anterior si se vino con cursor; hacia atrás,
+    # siempre hay página siguiente (la que se acaba de dejar).
+    if hacia_atras:
+        hay_siguiente, hay_anterior = True, hay_mas
+    else:
+        hay_siguiente, hay_anterior = hay_mas, valores is not None
+
+    siguiente = anterior = None
+    if filas:
+        if hay_siguiente:
+            siguiente = _codificar(modelo, orden, filas[-1], 's')
+        if hay_anterior:
+            anterior = _codificar(modelo, orden, filas[0], 'a')
+
+    total, estimado = None, False
+    if contar == 'estimado':
+        total, estimado = estimar_total(queryset)
+    elif contar == 'exacto':
+        total = queryset.count()
+
+    return PaginaKeyset(filas, siguiente, anterior, total, estimado)
+
+
+def paginar_request(request, queryset, orden, por_pagina=20, contar='estimado'):
+    """
+    Atajo para vistas: toma el cursor de ``?cursor=`` y arma las URLs de
+    navegación conservando el resto de los parámetros GET (filtros).
+
+    :rtype: PaginaKeyset
+    """
+    pagina = paginar_keyset(queryset, orden, request.GET.get('cursor'), por_pagina, contar)
+    params = {k: v for k, v in request.GET.items() if k != 'cursor'}
+    if pagina.cursor_siguiente:
+        pagina.url_siguiente = '?' + urlencode({**params, 'cursor': pagina.cursor_siguiente})
+    if pagina.cursor_anterior:
+        pagina.url_anterior = '?' + urlencode({**params, 'cursor': pagina.cursor_anterior})
+    return pagina
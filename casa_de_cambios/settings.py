@@ -66,7 +66,6 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'roles.context_processors.grupo_usuario',
                 'roles.context_processors.grupos_context',
-                'simulador.context_processors.simulador_context',
             ],
         },
     },
@@ -182,3 +181,59 @@ LOGGING = {
 
 TIME_ZONE = 'America/Asuncion'
 USE_TZ = True
+
+
+# Segundos que un worker puede servir el snapshot de cotizaciones sin
+# reconstruirlo (divisas.cache). Dentro del mismo proceso se invalida al
+# guardar tasas, cotizaciones o descuentos.
+COTIZACIONES_SNAPSHOT_TTL = 60
+
+# Segundos que un resultado de simulación puede confirmarse antes de exigir
+# una nueva simulación (ver divisas.tokens).
+COTIZACION_TOKEN_MAX_AGE = 15 * 60
+
+# Antigüedad máxima (segundos) del snapshot con la que se validan tokens sin
+# consultar la base; pasado ese tiempo se confirma la época contra
+# CotizacionVigente para no aceptar un precio que otro worker ya reemplazó.
+COTIZACION_TOKEN_TOLERANCIA = 5
+
+# Segundos que una reserva de cotización mantiene la tasa bloqueada para crear
+# la transacción (transacciones.models.ReservaCotizacion). Una tasa nueva de la
+# divisa expira las reservas activas antes.
+COTIZACION_RESERVA_SEGUNDOS = 120
+
+# Días que se conservan las reservas consumidas antes de purgarlas
+# (ReservaCotizacion.purgar, comando purgar_reservas).
+COTIZACION_RESERVA_RETENCION_DIAS = 7
+
+# Máximo de líneas por solicitud en la API de simulación por lote.
+SIMULADOR_LOTE_MAX = 5000
+
+# Segundos que la sesión reutiliza el segmento resuelto del cliente
+# (clientes.services.resolver_segmento). Los cambios de cliente, asignación o
+# segmento lo invalidan antes en todos los procesos: la versión que se compara
+# vive en la base (clientes.models.VersionSegmentos), no en la caché local.
+SEGMENTO_SESION_TTL = 300
+
+# Resultados de simulación memoizados por proceso (simulador.cache): cantidad
+# máxima de entradas y segundos de vida. Una cotización nueva los invalida.
+SIMULADOR_CACHE_MAXIMO = 4096
+SIMULADOR_CACHE_TTL = 30
+
+# Segundos que el navegador puede reutilizar /simulador/quotes.json sin
+# revalidar (luego revalida con ETag).
+SIMULADOR_COTIZACIONES_MAX_AGE = 30
+
+# Telemetría de cotización y límites (casa_de_cambios.telemetria): backend que
+# recibe spans, contadores y eventos (BackendLog, BackendMemoria o
+# BackendPrometheus) y fracción de eventos de depuración registrados (0 a 1).
+TELEMETRIA_BACKEND = 'casa_de_cambios.telemetria.BackendLog'
+TELEMETRIA_MUESTREO_EVENTOS = 0.01
+
+# Números de transacción reservados por proceso en cada viaje a la secuencia
+# de PostgreSQL (transacciones.numeracion).
+TRANSACCION_NUMERO_BLOQUE = 100
+
+# Máximo de transacciones por solicitud en el cambio de estado masivo
+# (transacciones.views.cambiar_estado_masivo).
+TRANSACCIONES_CAMBIO_MASIVO_MAX = 2000
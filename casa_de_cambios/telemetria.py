@@ -0,0 +1,274 @@
+# casa_de_cambios/telemetria.py
+"""
+Telemetría de los caminos calientes de cotización y límites.
+
+Reemplaza los ``print()`` de depuración por tres primitivas baratas:
+
+* :func:`medir` — *span* de tiempo (``with medir('simulacion.calculo'):``).
+* :func:`contar` — contador con etiquetas.
+* :func:`evento` — evento de depuración muestreado con
+  ``TELEMETRIA_MUESTREO_EVENTOS`` (0 los descarta sin llamar al backend).
+
+Lo medido se entrega a un backend intercambiable, elegido con
+``TELEMETRIA_BACKEND`` (ruta de importación):
+
+* :class:`BackendLog` — registros estructurados en el logger
+  ``casa_de_cambios.telemetria`` (nivel DEBUG: sin costo si está apagado).
+* :class:`BackendMemoria` — acumula todo en memoria; para tests.
+* :class:`BackendPrometheus` — agrega contadores y sumas de tiempos y los
+  exporta en formato de texto de Prometheus (ver
+  :func:`simulador.views.metricas_telemetria`).
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted(etiquetas.items()))
+
+
+class Backend:
+    """
+    Interfaz de un backend de telemetría. Las implementaciones deben ser
+    seguras entre hilos: se llaman desde los workers sin sincronización.
+    """
+
+    def span(self, nombre, segundos, etiquetas):
+        """Registra la duración de un *span*."""
+
+    def contador(self, nombre, valor, etiquetas):
+        """Incrementa un contador."""
+
+    def evento(self, nombre, datos):
+        """Registra un evento de depuración (ya muestreado)."""
+
+    def exportar(self):
+        """
+        Representación textual de lo acumulado, si el backend la tiene.
+
+        :rtype: str
+        """
+        return ''
+
+
+class BackendLog(Backend):
+    """Emite cada medición como registro estructurado (``extra``) en nivel DEBUG."""
+
+    def span(self, nombre, segundos, etiquetas):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('span %s %.3fms', nombre, segundos * 1000,
+                         extra={'telemetria': {'tipo': 'span', 'nombre': nombre,
+                                               'ms': segundos * 1000, **etiquetas}})
+
+    def contador(self, nombre, valor, etiquetas):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('contador %s +%s', nombre, valor,
+                         extra={'telemetria': {'tipo': 'contador', 'nombre': nombre,
+                                               'valor': valor, **etiquetas}})
+
+    def evento(self, nombre, datos):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('evento %s %s', nombre, datos,
+                         extra={'telemetria': {'tipo': 'evento', 'nombre': nombre, **datos}})
+
+
+class BackendMemoria(Backend):
+    """
+    Acumula spans, contadores y eventos en memoria.
+
+    ``spans`` y ``eventos`` son listas de ``(nombre, datos)``; ``contadores``
+    mapea ``(nombre, etiquetas)`` al total.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Descarta todo lo acumulado."""
+        with self._lock:
+            self.spans = []
+            self.eventos = []
+            self.contadores = defaultdict(int)
+
+    def span(self, nombre, segundos, etiquetas):
+        with self._lock:
+            self.spans.append((nombre, {'segundos': segundos, **etiquetas}))
+
+    def contador(self, nombre, valor, etiquetas):
+        with self._lock:
+            self.contadores[_clave(nombre, etiquetas)] += valor
+
+    def evento(self, nombre, datos):
+        with self._lock:
+            self.eventos.append((nombre, datos))
+
+    def nombres_spans(self):
+        """
+        Nombres de los spans registrados, en orden.
+
+        :rtype: list
+        """
+        with self._lock:
+            return [nombre for nombre, _ in self.spans]
+
+    def total(self, nombre, **etiquetas):
+        """
+        Total de un contador (0 si nunca se incrementó).
+
+        :rtype: int
+        """
+        with self._lock:
+            return self.contadores.get(_clave(nombre, etiquetas), 0)
+
+
+class BackendPrometheus(Backend):
+    """
+    Agrega contadores y spans (cantidad y suma de segundos) por etiquetas y
+    los exporta en el formato de texto de Prometheus. Los eventos se ignoran.
+
+    :param prefijo: Prefijo de los nombres de métrica.
+    :type prefijo: str
+    """
+
+    def __init__(self, prefijo='casa_de_cambios'):
+        self.prefijo = prefijo
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(float)
+        self._spans = defaultdict(lambda: [0, 0.0])
+
+    def span(self, nombre, segundos, etiquetas):
+        with self._lock:
+            acumulado = self._spans[_clave(nombre, etiquetas)]
+            acumulado[0] += 1
+            acumulado[1] += segundos
+
+    def contador(self, nombre, valor, etiquetas):
+        with self._lock:
+            self._contadores[_clave(nombre, etiquetas)] += valor
+
+    def _metrica(self, nombre):
+        return f"{self.prefijo}_{nombre.replace('.', '_').replace('-', '_')}"
+
+    @staticmethod
+    def _etiquetas(etiquetas):
+        if not etiquetas:
+            return ''
+        pares = ','.join(
+            '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for k, v in etiquetas
+        )
+        return '{' + pares + '}'
+
+    def exportar(self):
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            spans = sorted((clave, tuple(valor)) for clave, valor in self._spans.items())
+
+        lineas, tipos = [], set()
+        for (nombre, etiquetas), valor in contadores:
+            metrica = self._metrica(nombre) + '_total'
+            if metrica not in tipos:
+                tipos.add(metrica)
+                lineas.append(f'# TYPE {metrica} counter')
+            lineas.append(f'{metrica}{self._etiquetas(etiquetas)} {valor:g}')
+        for (nombre, etiquetas), (cantidad, suma) in spans:
+            metrica = self._metrica(nombre) + '_segundos'
+            if metrica not in tipos:
+                tipos.add(metrica)
+                lineas.append(f'# TYPE {metrica} summary')
+            lineas.append(f'{metrica}_count{self._etiquetas(etiquetas)} {cantidad}')
+            lineas.append(f'{metrica}_sum{self._etiquetas(etiquetas)} {suma:.6f}')
+        return '\n'.join(lineas) + '\n' if lineas else ''
+
+
+_lock = threading.Lock()
+_backend = None
+
+
+def backend():
+    """
+    Backend del proceso, creado desde ``TELEMETRIA_BACKEND`` la primera vez
+    que se usa.
+
+    :rtype: Backend
+    """
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                ruta = getattr(settings, 'TELEMETRIA_BACKEND', 'casa_de_cambios.telemetria.BackendLog')
+                _backend = import_string(ruta)()
+    return _backend
+
+
+def usar_backend(nuevo):
+    """
+    Reemplaza el backend del proceso (``None`` vuelve al configurado).
+
+    :param nuevo: Backend a usar.
+    :type nuevo: Backend | None
+    :return: El backend anterior.
+    :rtype: Backend | None
+    """
+    global _backend
+    with _lock:
+        anterior, _backend = _backend, nuevo
+    return anterior
+
+
+@contextmanager
+def medir(nombre, **etiquetas):
+    """
+    Mide la duración del bloque y la registra como *span*, aun si el bloque
+    lanza una excepción (en ese caso con la etiqueta ``error``).
+
+    :param nombre: Nombre del span, con puntos (``simulacion.calculo``).
+    :type nombre: str
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        etiquetas['error'] = type(e).__name__
+        raise
+    finally:
+        backend().span(nombre, time.perf_counter() - inicio, etiquetas)
+
+
+def contar(nombre, valor=1, **etiquetas):
+    """
+    Incrementa un contador.
+
+    :param nombre: Nombre del contador.
+    :type nombre: str
+    :param valor: Incremento.
+    :type valor: int
+    """
+    backend().contador(nombre, valor, etiquetas)
+
+
+def evento(nombre, **datos):
+    """
+    Registra un evento de depuración con probabilidad
+    ``TELEMETRIA_MUESTREO_EVENTOS`` (entre 0 y 1).
+
+    :param nombre: Nombre del evento.
+    :type nombre: str
+    :return: Si el evento fue registrado.
+    :rtype: bool
+    """
+    muestreo = getattr(settings, 'TELEMETRIA_MUESTREO_EVENTOS', 0)
+    if muestreo <= 0 or (muestreo < 1 and random.random() >= muestreo):
+        return False
+    backend().evento(nombre, datos)
+    return True
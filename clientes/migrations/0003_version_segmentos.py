@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionSegmentos',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Versión de Segmentos',
+                'verbose_name_plural': 'Versión de Segmentos',
+            },
+        ),
+    ]
@@ -348,4 +348,23 @@ class LimiteMensual(models.Model):
         ordering = ["-mes"]
 
     def __str__(self):
-        return f"Límite Mensual {self.mes.strftime('%B %Y')}: {self.monto}"
\ No newline at end of file
+        return f"Límite Mensual {self.mes.strftime('%B %Y')}: {self.monto}"
+
+class VersionSegmentos(models.Model):
+    """
+    Fila única con la versión de clientes, asignaciones y segmentos que usan
+    las sesiones para invalidar el segmento resuelto (ver
+    :func:`clientes.services.version_segmentos`). Vive en la base, y no en la
+    caché del proceso, para que la invalidación llegue a todos los workers.
+    """
+    UNICA = 1
+
+    id = models.PositiveSmallIntegerField(primary_key=True, default=UNICA)
+    valor = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Versión de Segmentos'
+        verbose_name_plural = 'Versión de Segmentos'
+
+    def __str__(self):
+        return f"Segmentos v{self.valor}"
@@ -1,10 +1,16 @@
 # clientes/services.py
 
+import time as _time
+
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Sum
-from clientes.models import LimiteDiario, LimiteMensual
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from clientes.models import LimiteDiario, LimiteMensual, AsignacionCliente, Cliente, Segmento, VersionSegmentos
 from datetime import datetime, time # <<-- IMPORTAR datetime y time
+from casa_de_cambios.telemetria import contar, evento, medir
 
+@medir('limites.verificar')
 def verificar_limites(cliente, monto, transaccion_a_excluir=None):
     hoy = timezone.localdate()
 
@@ -31,13 +37,10 @@ def verificar_limites(cliente, monto, transaccion_a_excluir=None):
             fecha_creacion__gte=inicio_del_dia
         ).aggregate(total=Sum("monto_destino"))["total"] or 0
         
-        print(">>> [Límite diario]")
-        print(f"    Limite: {limite_diario.monto}")
-        print(f"    Monto previo (sin la excl.): {total_hoy}")
-        print(f"    Monto nuevo: {monto}")
-        print(f"    Total si apruebo: {total_hoy + monto}")
+        evento('limites.diario', limite=limite_diario.monto, previo=total_hoy, nuevo=monto)
 
         if total_hoy + monto > limite_diario.monto:
+            contar('limites.rechazos', tipo='diario')
             return False, f"Supera el límite diario de {limite_diario.monto}"
 
     # --- Límite mensual ---\r\n
@@ -60,15 +63,111 @@ def verificar_limites(cliente, monto, transaccion_a_excluir=None):
             fecha_creacion__gte=inicio_del_mes
         ).aggregate(total=Sum("monto_destino"))["total"] or 0
         
-        print(">>> [Límite mensual]")
-        print(f"    Limite: {limite_mensual.monto}")
-        print(f"    Monto previo (sin la excl.): {total_mes}")
-        print(f"    Monto nuevo: {monto}")
-        print(f"    Total si apruebo: {total_mes + monto}")
+        evento('limites.mensual', limite=limite_mensual.monto, previo=total_mes, nuevo=monto)
 
         if total_mes + monto > limite_mensual.monto:
+            contar('limites.rechazos', tipo='mensual')
             return False, f"Supera el límite mensual de {limite_mensual.monto}"
     
     # ... (rest of the code)
 
-    return True, None # Si todo pasa
\ No newline at end of file
+    return True, None # Si todo pasa
+
+# ------------------------------------------------------------------
+# Resolución de segmento con caché en sesión
+# ------------------------------------------------------------------
+_SESION_SEGMENTO = 'segmento_resuelto'
+
+
+def version_segmentos():
+    """
+    Versión global de clientes/asignaciones/segmentos. Cambia cada vez que
+    :func:`invalidar_segmentos` se ejecuta (ver ``clientes.signals``). Se lee
+    de la base (una consulta por clave primaria) para que todos los procesos
+    vean la misma.
+
+    :rtype: int
+    """
+    return (VersionSegmentos.objects.filter(pk=VersionSegmentos.UNICA)
+            .values_list('valor', flat=True).first() or 0)
+
+
+def invalidar_segmentos():
+    """Invalida todos los segmentos resueltos guardados en sesiones."""
+    fila = VersionSegmentos.objects.filter(pk=VersionSegmentos.UNICA)
+    if not fila.update(valor=F('valor') + 1):
+        try:
+            with transaction.atomic():
+                VersionSegmentos.objects.create(pk=VersionSegmentos.UNICA, valor=1)
+        except IntegrityError:
+            # Otra solicitud creó la fila entre el UPDATE y el INSERT
+            fila.update(valor=F('valor') + 1)
+
+
+def _resolver_segmento_db(session, user):
+    cliente_id = session.get("cliente_id")
+    if cliente_id:
+        cliente = (Cliente.objects.select_related('segmento')
+                   .filter(id=cliente_id, esta_activo=True).first())
+        if cliente and cliente.segmento:
+            return cliente.segmento
+
+    if user.is_authenticated:
+        asignacion = (AsignacionCliente.objects.select_related("cliente__segmento")
+                      .filter(usuario=user).first())
+        if asignacion and asignacion.cliente and asignacion.cliente.segmento:
+            return asignacion.cliente.segmento
+
+    segmento, _ = Segmento.objects.get_or_create(name="general")
+    return segmento
+
+
+@medir('segmento.resolver')
+def resolver_segmento(session, user):
+    """
+    Determina el segmento del cliente: cliente activo en sesión, primera
+    asignación del usuario o, por defecto, el segmento 'general'.
+
+    Para usuarios autenticados el resultado se guarda en la sesión junto con
+    el cliente, el usuario y la versión de :func:`version_segmentos`; mientras
+    nada de eso cambie (y no pasen ``SEGMENTO_SESION_TTL`` segundos) el
+    segmento sale del snapshot de cotizaciones en memoria, sin consultas. A
+    los anónimos se les resuelve sin tocar la sesión.
+
+    :param session: Sesión del request.
+    :param user: Usuario del request.
+    :rtype: clientes.models.Segmento
+    """
+    from divisas.cache import obtener_snapshot
+
+    if not user.is_authenticated:
+        # Sin sesión de usuario no se escribe nada: guardar el segmento
+        # crearía una fila de sesión por cada visitante anónimo.
+        return _resolver_segmento_db(session, user)
+
+    cliente_id = session.get("cliente_id")
+    usuario_id = user.pk
+    version = version_segmentos()
+    ttl = getattr(settings, 'SEGMENTO_SESION_TTL', 300)
+
+    guardado = session.get(_SESION_SEGMENTO)
+    if (guardado
+            and guardado.get('cliente_id') == cliente_id
+            and guardado.get('usuario_id') == usuario_id
+            and guardado.get('version') == version
+            and _time.time() - guardado.get('t', 0) < ttl):
+        segmento = obtener_snapshot().segmentos.get(guardado['segmento_id'])
+        if segmento is not None:
+            contar('segmento.sesion', resultado='acierto')
+            return segmento
+
+    contar('segmento.sesion', resultado='fallo')
+    segmento = _resolver_segmento_db(session, user)
+    session[_SESION_SEGMENTO] = {
+        'cliente_id': cliente_id,
+        'usuario_id': usuario_id,
+        'segmento_id': segmento.id,
+        'version': version,
+        't': _time.time(),
+    }
+    return segmento
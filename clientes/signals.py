@@ -1,9 +1,9 @@
 # clientes/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from clientes.models import Segmento, Descuento
-from divisas.models import Divisa, TasaCambio
-from divisas.services import generar_cotizaciones_por_segmento
+from clientes.models import Segmento, Descuento, Cliente, AsignacionCliente
+from clientes.services import invalidar_segmentos
+from divisas.services import recalcular_cotizaciones_segmentos
 
 
 @receiver(post_save, sender=Segmento)
@@ -17,20 +17,29 @@ def generar_cotizaciones_para_segmento_nuevo(sender, instance, created, **kwargs
 
     usuario = None  # o asignar un usuario de sistema si corresponde
 
-    for divisa in Divisa.objects.filter(is_active=True):
-        tasa = TasaCambio.objects.filter(divisa=divisa).order_by('-fecha').first()
-        if tasa:
-            generar_cotizaciones_por_segmento(divisa, tasa, usuario)
+    recalcular_cotizaciones_segmentos([instance], usuario)
 
 
 @receiver(post_save, sender=Descuento)
 def regenerar_cotizaciones_si_descuento_cambia(sender, instance, created, **kwargs):
     """
-    Cuando se crea o edita un Descuento, regenerar cotizaciones para el segmento afectado.
+    Cuando se crea o edita un Descuento, regenerar cotizaciones sólo para el
+    segmento afectado.
     """
     usuario = None  # igual que arriba
 
-    for divisa in Divisa.objects.filter(is_active=True):
-        tasa = TasaCambio.objects.filter(divisa=divisa).order_by('-fecha').first()
-        if tasa:
-            generar_cotizaciones_por_segmento(divisa, tasa, usuario)
+    recalcular_cotizaciones_segmentos([instance.segmento_id], usuario)
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_save, sender=AsignacionCliente)
+@receiver(post_delete, sender=AsignacionCliente)
+@receiver(post_save, sender=Segmento)
+@receiver(post_delete, sender=Segmento)
+def invalidar_segmentos_en_sesion(sender, **kwargs):
+    """
+    Cuando cambia el segmento de un cliente, sus asignaciones o los segmentos,
+    invalida los segmentos resueltos guardados en las sesiones.
+    """
+    invalidar_segmentos()
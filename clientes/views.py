@@ -1336,6 +1336,30 @@ def get_medio_acreditacion_seleccionado(request):
     """
     return request.session.get("medio_seleccionado")
 
+def totales_por_medio(request, operacion, medios):
+    """
+    Guaraníes a pagar con cada medio para recibir las divisas de la compra en
+    sesión (ver :func:`simulador.services.cotizar_inverso`). Sólo se usa en la
+    selección del medio de pago de una compra.
+
+    :return: Una ``CotizacionInversa`` (o ``None`` si no se puede cotizar) por medio.
+    :rtype: list
+    """
+    from simulador.services import SolicitudSimulacion, SimulacionError, cotizar_inverso
+    from .services import resolver_segmento
+
+    try:
+        solicitud = SolicitudSimulacion(
+            tipo_operacion='compra',
+            monto=Decimal(operacion['monto_divisa']),
+            moneda=operacion.get('divisa'),
+        )
+        opciones = cotizar_inverso(solicitud, resolver_segmento(request.session, request.user), medios)
+    except (KeyError, InvalidOperation, SimulacionError):
+        return [None] * len(medios)
+    por_medio = {opcion.medio_id: opcion for opcion in opciones}
+    return [por_medio.get(medio.pk) for medio in medios]
+
 # clientes/views.py
 
 class SeleccionarMedioPagoView(LoginRequiredMixin, View):
@@ -1348,18 +1372,24 @@ class SeleccionarMedioPagoView(LoginRequiredMixin, View):
             messages.warning(request, 'Debe seleccionar un cliente primero.')
             return redirect('clientes:seleccionar_cliente')
 
-        medios_activos = ClienteMedioDePago.objects.filter(
+        medios_activos = list(ClienteMedioDePago.objects.filter(
             cliente=cliente,
             es_activo=True
         ).select_related('medio_de_pago').prefetch_related(
             'medio_de_pago__campos'
-        ).order_by('-es_principal', '-fecha_actualizacion')
+        ).order_by('-es_principal', '-fecha_actualizacion'))
+
+        # Total a pagar con cada medio (comisión incluida), en un solo cálculo
+        operacion = request.session.get('operacion') or {}
+        if operacion.get('tipo') == 'compra' and medios_activos:
+            for medio, total in zip(medios_activos, totales_por_medio(request, operacion, medios_activos)):
+                medio.total_pago = total
 
         context = {
             'cliente': cliente,
             'medios_activos': medios_activos,
             'medio_seleccionado': request.session.get('medio_pago_seleccionado'),
-            'total_medios': medios_activos.count()
+            'total_medios': len(medios_activos)
         }
         return render(request, self.template_name, context)
 
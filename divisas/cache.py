@@ -0,0 +1,155 @@
+# divisas/cache.py
+"""
+Snapshot en memoria de las cotizaciones vigentes.
+
+El simulador, los visualizadores de tasas y la página de inicio muestran la
+última :class:`~divisas.models.CotizacionSegmento` de cada par
+(segmento, divisa). En lugar de reconstruir esa vista en cada request, se
+mantiene una foto inmutable por proceso que sólo se reconstruye cuando se
+guarda una tasa, una cotización o un descuento (ver ``divisas.signals``).
+
+La lectura no toma ningún lock: se lee la referencia global y, si es válida,
+se usa tal cual. Sólo la reconstrucción está serializada.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_snapshot = None
+_version = 0
+
+
+class SnapshotCotizaciones:
+    """
+    Foto inmutable de las cotizaciones vigentes.
+
+    :param version: Número de versión, creciente en cada reconstrucción.
+    :type version: int
+    :param divisas: Divisas activas ordenadas por código.
+    :type divisas: list
+    :param segmentos: Segmentos indexados por id.
+    :type segmentos: dict
+    :param cotizaciones: ``{segmento_id: {codigo_divisa: CotizacionSegmento}}``.
+    :type cotizaciones: dict
+
+    ``epoca`` es el id más alto entre las cotizaciones vigentes: crece con cada
+    publicación y, a diferencia de ``version``, es el mismo en todos los
+    procesos que vean la misma base.
+    """
+
+    def __init__(self, version, divisas, segmentos, cotizaciones):
+        self.version = version
+        self.divisas = divisas
+        self.segmentos = segmentos
+        self.cotizaciones = cotizaciones
+        self.epoca = max(
+            (cot.pk for del_segmento in cotizaciones.values() for cot in del_segmento.values()),
+            default=0,
+        )
+        self.creado = time.monotonic()
+        self._derivados = {}
+
+    def cotizacion(self, segmento_id, divisa_code):
+        """Retorna la cotización vigente del par o ``None``."""
+        return self.cotizaciones.get(segmento_id, {}).get(divisa_code)
+
+    def derivado(self, clave, fabrica):
+        """
+        Memoiza una estructura derivada de este snapshot (p. ej. el JSON del
+        simulador). Se calcula una vez por versión y muere con el snapshot.
+
+        :param clave: Nombre de la estructura derivada.
+        :type clave: str
+        :param fabrica: Callable que recibe el snapshot y construye el valor.
+        :type fabrica: callable
+        """
+        try:
+            return self._derivados[clave]
+        except KeyError:
+            valor = self._derivados[clave] = fabrica(self)
+            return valor
+
+    def por_segmento(self, segmento_id):
+        """
+        Arma la estructura ``divisas_data`` de los visualizadores para un segmento.
+
+        :return: Lista de ``{'divisa': Divisa, 'cotizaciones': [CotizacionSegmento]}``.
+        :rtype: list
+        """
+        del_segmento = self.cotizaciones.get(segmento_id, {})
+        data = []
+        for divisa in self.divisas:
+            cot = del_segmento.get(divisa.code)
+            data.append({
+                'divisa': divisa,
+                'cotizaciones': [cot] if cot else [],
+            })
+        return data
+
+    def todas(self):
+        """
+        Arma ``divisas_data`` con las cotizaciones de todos los segmentos
+        (vista administrativa).
+        """
+        data = []
+        for divisa in self.divisas:
+            cotizaciones = [
+                self.cotizaciones[seg_id][divisa.code]
+                for seg_id in sorted(self.cotizaciones)
+                if divisa.code in self.cotizaciones[seg_id]
+            ]
+            data.append({'divisa': divisa, 'cotizaciones': cotizaciones})
+        return data
+
+
+def _ttl():
+    # En despliegues con varios procesos, cada worker tiene su propio snapshot;
+    # el TTL acota cuánto puede tardar en ver una tasa publicada por otro worker.
+    return getattr(settings, 'COTIZACIONES_SNAPSHOT_TTL', 60)
+
+
+def _vigente(snap):
+    return snap is not None and (time.monotonic() - snap.creado) < _ttl()
+
+
+def _construir(version):
+    from clientes.models import Segmento
+    from .models import Divisa
+    from .services import matriz_cotizaciones
+
+    divisas = list(Divisa.objects.filter(is_active=True).order_by('code'))
+    segmentos = {s.id: s for s in Segmento.objects.all()}
+
+    cotizaciones = {seg_id: {} for seg_id in segmentos}
+    cotizaciones.update(matriz_cotizaciones())
+
+    return SnapshotCotizaciones(version, divisas, segmentos, cotizaciones)
+
+
+def obtener_snapshot():
+    """
+    Retorna el snapshot vigente, reconstruyéndolo si fue invalidado o venció.
+
+    :rtype: SnapshotCotizaciones
+    """
+    global _snapshot, _version
+    snap = _snapshot
+    if _vigente(snap):
+        return snap
+
+    with _lock:
+        snap = _snapshot
+        if not _vigente(snap):
+            _version += 1
+            snap = _construir(_version)
+            _snapshot = snap
+    return snap
+
+
+def invalidar_snapshot():
+    """Descarta el snapshot actual; el próximo lector lo reconstruye."""
+    global _snapshot
+    with _lock:
+        _snapshot = None
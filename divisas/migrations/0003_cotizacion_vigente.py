@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_vigentes(apps, schema_editor):
+    """Carga la última cotización de cada (divisa, segmento) del histórico."""
+    CotizacionSegmento = apps.get_model('divisas', 'CotizacionSegmento')
+    CotizacionVigente = apps.get_model('divisas', 'CotizacionVigente')
+
+    ultimas = {}
+    for cot in CotizacionSegmento.objects.order_by('fecha', 'id').iterator():
+        ultimas[(cot.divisa_id, cot.segmento_id)] = cot
+
+    CotizacionVigente.objects.bulk_create([
+        CotizacionVigente(
+            divisa_id=cot.divisa_id,
+            segmento_id=cot.segmento_id,
+            cotizacion_id=cot.id,
+            fecha=cot.fecha,
+        )
+        for cot in ultimas.values()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0002_initial'),
+        ('divisas', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotizacionVigente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('cotizacion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='vigencia', to='divisas.cotizacionsegmento')),
+                ('divisa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cotizaciones_vigentes', to='divisas.divisa')),
+                ('segmento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cotizaciones_vigentes', to='clientes.segmento')),
+            ],
+            options={
+                'verbose_name': 'Cotización vigente',
+                'verbose_name_plural': 'Cotizaciones vigentes',
+                'constraints': [models.UniqueConstraint(fields=('divisa', 'segmento'), name='uniq_cotizacion_vigente')],
+            },
+        ),
+        migrations.RunPython(poblar_vigentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _inicio(fecha, periodo):
+    local = timezone.localtime(fecha)
+    if periodo == 'hora':
+        return local.replace(minute=0, second=0, microsecond=0)
+    if periodo == 'dia':
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def poblar_resumenes(apps, schema_editor):
+    """Arma los resúmenes OHLC a partir del histórico de tasas existente."""
+    TasaCambio = apps.get_model('divisas', 'TasaCambio')
+    TasaCambioResumen = apps.get_model('divisas', 'TasaCambioResumen')
+
+    resumenes = {}
+    for tasa in TasaCambio.objects.order_by('fecha', 'id').iterator():
+        precio = tasa.precio_base
+        for periodo in ('hora', 'dia', 'mes'):
+            clave = (tasa.divisa_id, periodo, _inicio(tasa.fecha, periodo))
+            r = resumenes.get(clave)
+            if r is None:
+                resumenes[clave] = TasaCambioResumen(
+                    divisa_id=clave[0], periodo=periodo, inicio=clave[2],
+                    apertura=precio, maximo=precio, minimo=precio, cierre=precio, cantidad=1,
+                )
+            else:
+                r.maximo = max(r.maximo, precio)
+                r.minimo = min(r.minimo, precio)
+                r.cierre = precio
+                r.cantidad += 1
+
+    TasaCambioResumen.objects.bulk_create(resumenes.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('divisas', '0003_cotizacion_vigente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TasaCambioResumen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('hora', 'Hora'), ('dia', 'Día'), ('mes', 'Mes')], max_length=4)),
+                ('inicio', models.DateTimeField()),
+                ('apertura', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('maximo', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('minimo', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('cierre', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('divisa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='divisas.divisa')),
+            ],
+            options={
+                'verbose_name': 'Resumen de tasas',
+                'verbose_name_plural': 'Resúmenes de tasas',
+                'ordering': ['divisa', 'periodo', 'inicio'],
+                'constraints': [models.UniqueConstraint(fields=('divisa', 'periodo', 'inicio'), name='uniq_resumen_tasa')],
+            },
+        ),
+        migrations.RunPython(poblar_resumenes, migrations.RunPython.noop),
+    ]
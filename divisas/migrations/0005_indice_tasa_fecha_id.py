@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('divisas', '0004_tasa_cambio_resumen'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tasacambio',
+            index=models.Index(fields=['fecha', 'id'], name='tasa_fecha_id_idx'),
+        ),
+    ]
@@ -1,7 +1,8 @@
 #divisas
-from django.db import models
-from django.db.models import Q
-from django.db.models.functions import Upper
+from django.db import connection, models, transaction, IntegrityError
+from django.db.models import Q, F, Value
+from django.db.models.functions import Upper, Greatest, Least
+from django.utils import timezone
 from decimal import Decimal, ROUND_HALF_UP
 from django.db import models
 from django.contrib.auth import get_user_model
@@ -30,9 +31,15 @@ class CotizacionSegmentoQuerySet(models.QuerySet):
     def recientes(self):
         return self.order_by('-fecha')
 
+    def vigentes(self):
+        """Cotizaciones marcadas como vigentes en :class:`CotizacionVigente`."""
+        return self.filter(vigencia__isnull=False)
+
     def ultima_para(self, divisa, segmento):
-        return (self.filter(divisa=divisa, segmento=segmento)
-                    .order_by('-fecha')
+        # Búsqueda por la clave única (divisa, segmento) de CotizacionVigente;
+        # no depende del tamaño del historial.
+        return (self.filter(vigencia__divisa=divisa, vigencia__segmento=segmento)
+                    .select_related('divisa')
                     .first())
 
 
@@ -214,7 +221,188 @@ class TasaCambio(models.Model):
         verbose_name = 'Tasa de Cambio'
         verbose_name_plural = 'Tasas de Cambio'
         ordering = ['-fecha']
-        indexes = [models.Index(fields=['divisa', 'fecha'])]
+        indexes = [
+            models.Index(fields=['divisa', 'fecha']),
+            # Histórico global paginado por cursor (fecha, id)
+            models.Index(fields=['fecha', 'id'], name='tasa_fecha_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.divisa.code} - {self.fecha}: {self.precio_base} (Compra:{self.comision_compra}, Venta:{self.comision_venta})"
+
+
+
+class CotizacionVigente(models.Model):
+    """
+    Puntero a la cotización vigente de una divisa para un segmento.
+
+    Hay una sola fila por par (divisa, segmento), que se actualiza en la misma
+    transacción en que se generan las cotizaciones. El historial de
+    :class:`CotizacionSegmento` sigue siendo de sólo inserción para auditoría;
+    las lecturas de precio actual usan esta tabla.
+
+    :param divisa: Divisa cotizada.
+    :type divisa: Divisa
+    :param segmento: Segmento de cliente.
+    :type segmento: clientes.Segmento
+    :param cotizacion: Última cotización publicada para el par.
+    :type cotizacion: CotizacionSegmento
+    :param fecha: Fecha de la cotización vigente.
+    :type fecha: datetime
+    """
+    divisa = models.ForeignKey(Divisa, on_delete=models.CASCADE, related_name='cotizaciones_vigentes')
+    segmento = models.ForeignKey('clientes.Segmento', on_delete=models.CASCADE, related_name='cotizaciones_vigentes')
+    cotizacion = models.OneToOneField(CotizacionSegmento, on_delete=models.CASCADE, related_name='vigencia')
+    fecha = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Cotización vigente'
+        verbose_name_plural = 'Cotizaciones vigentes'
+        constraints = [
+            models.UniqueConstraint(fields=['divisa', 'segmento'], name='uniq_cotizacion_vigente'),
+        ]
+
+    @classmethod
+    def actualizar(cls, cotizaciones):
+        """
+        Marca las cotizaciones dadas como vigentes (upsert por divisa y segmento).
+
+        El upsert sólo reemplaza la fila existente si la cotización entrante es
+        más nueva (por ``fecha`` y, a igual fecha, por id): si dos publicaciones
+        confirman en orden inverso, la más vieja no pisa a la vigente.
+
+        :param cotizaciones: Cotizaciones ya guardadas (con pk).
+        :type cotizaciones: list
+        """
+        cotizaciones = list(cotizaciones)
+        if not cotizaciones:
+            return
+        opts = cls._meta
+        qn = connection.ops.quote_name
+        tabla = qn(opts.db_table)
+        columnas = [qn(opts.get_field(nombre).column) for nombre in ('divisa', 'segmento', 'cotizacion', 'fecha')]
+        divisa, segmento, cotizacion, fecha = columnas
+        campo_fecha = opts.get_field('fecha')
+        valores = []
+        for c in cotizaciones:
+            valores += [c.divisa_id, c.segmento_id, c.pk, campo_fecha.get_db_prep_value(c.fecha, connection)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {tabla} ({', '.join(columnas)})
+                VALUES {', '.join(['(%s, %s, %s, %s)'] * len(cotizaciones))}
+                ON CONFLICT ({divisa}, {segmento}) DO UPDATE
+                   SET {cotizacion} = EXCLUDED.{cotizacion}, {fecha} = EXCLUDED.{fecha}
+                 WHERE EXCLUDED.{fecha} > {tabla}.{fecha}
+                    OR (EXCLUDED.{fecha} = {tabla}.{fecha} AND EXCLUDED.{cotizacion} > {tabla}.{cotizacion})
+                """,
+                valores,
+            )
+
+    def __str__(self):
+        return f"{self.divisa.code} / {self.segmento.name} → {self.cotizacion_id}"
+
+
+class TasaCambioResumen(models.Model):
+    """
+    Resumen OHLC (apertura, máximo, mínimo, cierre) del precio base de una
+    divisa por hora, día o mes.
+
+    Se mantiene de forma incremental al registrar cada :class:`TasaCambio`
+    (ver ``divisas.signals``), de modo que los gráficos e históricos de rangos
+    largos leen unas pocas filas por período en lugar de todas las tasas.
+
+    :param divisa: Divisa resumida.
+    :type divisa: Divisa
+    :param periodo: Granularidad: ``hora``, ``dia`` o ``mes``.
+    :type periodo: str
+    :param inicio: Comienzo del período (hora local).
+    :type inicio: datetime
+    :param apertura: Primer precio base del período.
+    :type apertura: Decimal
+    :param maximo: Precio base máximo del período.
+    :type maximo: Decimal
+    :param minimo: Precio base mínimo del período.
+    :type minimo: Decimal
+    :param cierre: Último precio base del período.
+    :type cierre: Decimal
+    :param cantidad: Cantidad de tasas registradas en el período.
+    :type cantidad: int
+    """
+    PERIODOS = [
+        ('hora', 'Hora'),
+        ('dia', 'Día'),
+        ('mes', 'Mes'),
+    ]
+
+    divisa = models.ForeignKey(Divisa, on_delete=models.CASCADE, related_name='resumenes')
+    periodo = models.CharField(max_length=4, choices=PERIODOS)
+    inicio = models.DateTimeField()
+
+    apertura = models.DecimalField(max_digits=20, decimal_places=8)
+    maximo = models.DecimalField(max_digits=20, decimal_places=8)
+    minimo = models.DecimalField(max_digits=20, decimal_places=8)
+    cierre = models.DecimalField(max_digits=20, decimal_places=8)
+    cantidad = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Resumen de tasas'
+        verbose_name_plural = 'Resúmenes de tasas'
+        ordering = ['divisa', 'periodo', 'inicio']
+        constraints = [
+            models.UniqueConstraint(fields=['divisa', 'periodo', 'inicio'], name='uniq_resumen_tasa'),
+        ]
+
+    @staticmethod
+    def inicio_de(fecha, periodo):
+        """
+        Trunca una fecha al comienzo de su período, en hora local.
+
+        :param fecha: Fecha a truncar.
+        :type fecha: datetime
+        :param periodo: ``hora``, ``dia`` o ``mes``.
+        :type periodo: str
+        :rtype: datetime
+        """
+        local = timezone.localtime(fecha)
+        if periodo == 'hora':
+            return local.replace(minute=0, second=0, microsecond=0)
+        if periodo == 'dia':
+            return local.replace(hour=0, minute=0, second=0, microsecond=0)
+        return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def registrar(cls, tasa):
+        """
+        Incorpora una tasa a los resúmenes de sus tres períodos.
+
+        La actualización es un ``UPDATE`` condicional con ``GREATEST``/``LEAST``
+        sobre la fila del período; si todavía no existe se crea, y si otro
+        proceso la creó en paralelo se reintenta el ``UPDATE``.
+
+        :param tasa: Tasa recién registrada.
+        :type tasa: TasaCambio
+        """
+        precio = tasa.precio_base
+        for periodo, _ in cls.PERIODOS:
+            inicio = cls.inicio_de(tasa.fecha, periodo)
+            filtro = cls.objects.filter(divisa_id=tasa.divisa_id, periodo=periodo, inicio=inicio)
+            cambios = {
+                'maximo': Greatest(F('maximo'), Value(precio)),
+                'minimo': Least(F('minimo'), Value(precio)),
+                'cierre': precio,
+                'cantidad': F('cantidad') + 1,
+            }
+            if filtro.update(**cambios):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        divisa_id=tasa.divisa_id, periodo=periodo, inicio=inicio,
+                        apertura=precio, maximo=precio, minimo=precio, cierre=precio, cantidad=1,
+                    )
+            except IntegrityError:
+                filtro.update(**cambios)
+
+    def __str__(self):
+        return f"{self.divisa.code} {self.periodo} {self.inicio:%Y-%m-%d %H:%M}: {self.cierre}"
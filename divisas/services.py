@@ -2,19 +2,25 @@
 from decimal import Decimal
 from django.db import transaction
 from django.db.models import OuterRef, Subquery
-from .models import CotizacionSegmento, TasaCambio, Divisa
+from .models import CotizacionSegmento, CotizacionVigente, TasaCambio, Divisa
 from clientes.models import Segmento, Descuento
+from .signals import cotizaciones_publicadas
 
 @transaction.atomic
 def generar_cotizaciones_por_segmento(divisa: Divisa, tasa: TasaCambio, usuario):
     """
     Genera una fila por cada Segmento con snapshot de PB/comisiones y % descuento.
     'usuario' DEBE venir del request.user para llenar creado_por.
+
+    Las filas se calculan en memoria y se insertan con un único INSERT
+    multi-fila; luego se emite una sola señal ``cotizaciones_publicadas``
+    para toda la publicación (``bulk_create`` no dispara ``post_save``).
     """
     # trae % de descuento por segmento (si no existe -> 0)
     descuentos = Descuento.objects.filter(segmento=OuterRef('pk')).values('porcentaje_descuento')[:1]
     segmentos = Segmento.objects.all().annotate(pct_desc=Subquery(descuentos))
 
+    items = []
     for seg in segmentos:
         pct = seg.pct_desc or Decimal('0')
         item = CotizacionSegmento(
@@ -27,11 +33,215 @@ def generar_cotizaciones_por_segmento(divisa: Divisa, tasa: TasaCambio, usuario)
             creado_por=usuario,
         )
         item.calcular_valores()
-        item.save()
+        items.append(item)
+
+    return _publicar([(divisa, tasa, items)])
+
+
+def _publicar(lotes):
+    """
+    Inserta con un único INSERT multi-fila las cotizaciones de uno o más lotes
+    ``(divisa, tasa, items)``, actualiza :class:`CotizacionVigente` y emite una
+    señal ``cotizaciones_publicadas`` por lote.
+    """
+    items = [item for _, _, del_lote in lotes for item in del_lote]
+    creadas = CotizacionSegmento.objects.bulk_create(items)
+    CotizacionVigente.actualizar(creadas)
+
+    inicio = 0
+    for divisa, tasa, del_lote in lotes:
+        publicadas = creadas[inicio:inicio + len(del_lote)]
+        inicio += len(del_lote)
+        cotizaciones_publicadas.send(
+            sender=CotizacionSegmento,
+            divisa=divisa,
+            tasa=tasa,
+            cotizaciones=publicadas,
+        )
+    return creadas
+
+
+@transaction.atomic
+def recalcular_cotizaciones_segmentos(segmentos, usuario=None):
+    """
+    Recalcula las cotizaciones de todas las divisas activas sólo para los
+    segmentos indicados (alta de un segmento o cambio de su descuento).
+
+    La última tasa de cada divisa activa y el % de descuento de cada segmento
+    se leen con una consulta cada uno; la grilla divisa × segmento se calcula
+    en memoria con la misma cuantización que
+    :meth:`CotizacionSegmento.calcular_valores` y se escribe de una vez.
+
+    :param segmentos: Segmentos afectados (instancias o ids).
+    :type segmentos: list
+    :param usuario: Usuario que se registra en ``creado_por`` (opcional).
+    :return: Cotizaciones creadas.
+    :rtype: list
+    """
+    ids = [getattr(seg, 'pk', seg) for seg in segmentos]
+    descuentos = Descuento.objects.filter(segmento=OuterRef('pk')).values('porcentaje_descuento')[:1]
+    segs = list(Segmento.objects.filter(pk__in=ids).annotate(pct_desc=Subquery(descuentos)))
+    if not segs:
+        return []
+
+    ultima = TasaCambio.objects.filter(divisa=OuterRef('divisa')).order_by('-fecha', '-id').values('pk')[:1]
+    tasas = (TasaCambio.objects
+             .filter(divisa__is_active=True, pk=Subquery(ultima))
+             .select_related('divisa'))
+
+    lotes = []
+    for tasa in tasas:
+        items = []
+        for seg in segs:
+            item = CotizacionSegmento(
+                divisa=tasa.divisa,
+                segmento=seg,
+                precio_base=tasa.precio_base,
+                comision_compra=tasa.comision_compra,
+                comision_venta=tasa.comision_venta,
+                porcentaje_descuento=seg.pct_desc or Decimal('0'),
+                creado_por=usuario,
+            )
+            item.calcular_valores()
+            items.append(item)
+        lotes.append((tasa.divisa, tasa, items))
+
+    if not lotes:
+        return []
+    return _publicar(lotes)
 
 def ultimas_por_segmento(divisa, hasta=None):
-    qs = CotizacionSegmento.objects.filter(divisa=divisa)
-    if hasta is not None:
-        qs = qs.filter(fecha__lte=hasta)
+    if hasta is None:
+        # Precio actual: se lee de CotizacionVigente (una fila por segmento)
+        return CotizacionSegmento.objects.vigentes().filter(divisa=divisa).order_by('segmento_id')
+    qs = CotizacionSegmento.objects.filter(divisa=divisa, fecha__lte=hasta)
     qs = qs.order_by('segmento_id', '-fecha', '-id').distinct('segmento_id')
-    return qs
\ No newline at end of file
+    return qs
+
+def matriz_cotizaciones(segmento=None):
+    """
+    Devuelve la matriz divisa × segmento de cotizaciones vigentes en una sola
+    consulta, con ``divisa`` y ``segmento`` ya cargados.
+
+    :param segmento: Si se indica, la consulta se restringe a ese segmento en SQL.
+    :type segmento: clientes.models.Segmento | int | None
+    :return: ``{segmento_id: {codigo_divisa: CotizacionSegmento}}`` sólo con divisas activas.
+    :rtype: dict
+    """
+    qs = (CotizacionSegmento.objects.vigentes()
+          .filter(divisa__is_active=True)
+          .select_related('divisa', 'segmento'))
+    if segmento is not None:
+        qs = qs.filter(segmento=segmento)
+
+    matriz = {}
+    for cot in qs:
+        matriz.setdefault(cot.segmento_id, {})[cot.divisa.code] = cot
+    return matriz
+
+
+def reducir_lttb(puntos, umbral):
+    """
+    Reduce una serie con el algoritmo *Largest-Triangle-Three-Buckets*.
+
+    Conserva el primer y el último punto y, de cada balde intermedio, el punto
+    que forma el triángulo de mayor área con el elegido en el balde anterior y
+    el promedio del siguiente. Mantiene la forma visual de la serie (picos y
+    valles) con muchos menos puntos.
+
+    :param puntos: Serie ordenada de tuplas ``(x, y, dato)``; ``x`` e ``y`` numéricos.
+    :type puntos: list
+    :param umbral: Cantidad máxima de puntos a devolver (>= 3).
+    :type umbral: int
+    :return: Sub-lista de ``puntos``.
+    :rtype: list
+    """
+    n = len(puntos)
+    if umbral >= n or umbral < 3:
+        return list(puntos)
+
+    muestreo = [puntos[0]]
+    ancho = (n - 2) / (umbral - 2)
+    a = 0
+    for i in range(umbral - 2):
+        # Promedio del balde siguiente
+        ini_sig = int((i + 1) * ancho) + 1
+        fin_sig = min(int((i + 2) * ancho) + 1, n)
+        siguiente = puntos[ini_sig:fin_sig]
+        prom_x = sum(p[0] for p in siguiente) / len(siguiente)
+        prom_y = sum(p[1] for p in siguiente) / len(siguiente)
+
+        # Punto del balde actual con el triángulo más grande
+        ini = int(i * ancho) + 1
+        fin = int((i + 1) * ancho) + 1
+        ax, ay = puntos[a][0], puntos[a][1]
+        mayor, elegido = -1, ini
+        for j in range(ini, fin):
+            area = abs((ax - prom_x) * (puntos[j][1] - ay) - (ax - puntos[j][0]) * (prom_y - ay))
+            if area > mayor:
+                mayor, elegido = area, j
+        muestreo.append(puntos[elegido])
+        a = elegido
+
+    muestreo.append(puntos[-1])
+    return muestreo
+
+
+def serie_tasas(divisa, inicio=None, fin=None, puntos=500, periodo=None):
+    """
+    Serie de precio base de una divisa para gráficos, reducida a ``puntos``.
+
+    Si no se fuerza ``periodo``, se elige la fuente más fina que no exceda
+    unas pocas veces ``puntos`` filas: tasas crudas, o los resúmenes
+    :class:`TasaCambioResumen` por hora, día o mes. Sobre esa fuente se aplica
+    :func:`reducir_lttb` usando el cierre de cada período.
+
+    :param divisa: Divisa de la serie.
+    :type divisa: Divisa
+    :param inicio: Fecha/hora inicial (inclusive).
+    :type inicio: datetime | None
+    :param fin: Fecha/hora final (inclusive).
+    :type fin: datetime | None
+    :param puntos: Cantidad máxima de puntos.
+    :type puntos: int
+    :param periodo: ``hora``, ``dia`` o ``mes`` para forzar un resumen.
+    :type periodo: str | None
+    :return: ``(resolucion, lista de dicts)``; los puntos de resúmenes incluyen OHLC.
+    :rtype: tuple
+    """
+    from .models import TasaCambioResumen
+
+    limite = puntos * 4
+    tasas = TasaCambio.objects.filter(divisa=divisa)
+    if inicio:
+        tasas = tasas.filter(fecha__gte=inicio)
+    if fin:
+        tasas = tasas.filter(fecha__lte=fin)
+
+    if periodo is None and tasas.count() <= limite:
+        filas = tasas.order_by('fecha', 'id').values_list('fecha', 'precio_base')
+        serie = [(f.timestamp(), float(p), {'fecha': f.isoformat(), 'valor': float(p)}) for f, p in filas]
+        return 'tasa', [p[2] for p in reducir_lttb(serie, puntos)]
+
+    candidatos = [periodo] if periodo else ['hora', 'dia', 'mes']
+    for nivel in candidatos:
+        resumenes = TasaCambioResumen.objects.filter(divisa=divisa, periodo=nivel)
+        if inicio:
+            resumenes = resumenes.filter(inicio__gte=TasaCambioResumen.inicio_de(inicio, nivel))
+        if fin:
+            resumenes = resumenes.filter(inicio__lte=fin)
+        if nivel == candidatos[-1] or resumenes.count() <= limite:
+            break
+
+    serie = [
+        (r.inicio.timestamp(), float(r.cierre), {
+            'fecha': r.inicio.isoformat(),
+            'valor': float(r.cierre),
+            'apertura': float(r.apertura),
+            'maximo': float(r.maximo),
+            'minimo': float(r.minimo),
+            'cantidad': r.cantidad,
+        })
+        for r in resumenes.order_by('inicio')
+    ]
+    return nivel, [p[2] for p in reducir_lttb(serie, puntos)]
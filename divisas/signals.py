@@ -1,16 +1,24 @@
 #divisas
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import TasaCambio
-from .services import generar_cotizaciones_por_segmento
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+from .models import TasaCambio, TasaCambioResumen, CotizacionSegmento, CotizacionVigente, Divisa
+from .cache import invalidar_snapshot
+from clientes.models import Descuento, Segmento
 from django.db import transaction
 from django.contrib.auth import get_user_model
 
+# Se emite una vez por publicación de tasa (divisa, tasa), con todas las
+# CotizacionSegmento creadas en bloque. Argumentos: divisa, tasa, cotizaciones.
+cotizaciones_publicadas = Signal()
+
+
 @receiver(post_save, sender=TasaCambio)
 def crear_cotizaciones_segmento(sender, instance, created, **kwargs):
     if not created:
         return
     
+    from .services import generar_cotizaciones_por_segmento
+
     # Obtener un usuario por defecto (puede ser el primer superusuario)
     User = get_user_model()
     try:
@@ -24,4 +32,44 @@ def crear_cotizaciones_segmento(sender, instance, created, **kwargs):
             tasa=instance,
             usuario=usuario_default  # Usar un usuario por defecto
         )
-    )
\ No newline at end of file
+    )
+
+
+@receiver(post_save, sender=TasaCambio)
+def actualizar_resumen_tasas(sender, instance, created, **kwargs):
+    """Incorpora la tasa nueva a los resúmenes OHLC por hora, día y mes."""
+    if created:
+        TasaCambioResumen.registrar(instance)
+
+
+@receiver(post_save, sender=CotizacionSegmento)
+def actualizar_cotizacion_vigente(sender, instance, created, **kwargs):
+    """
+    Mantiene CotizacionVigente al guardar una cotización individual (la
+    generación en bloque la actualiza directamente en el servicio).
+    """
+    if created:
+        CotizacionVigente.actualizar([instance])
+
+
+@receiver(post_save, sender=TasaCambio)
+@receiver(post_save, sender=CotizacionSegmento)
+@receiver(post_save, sender=Descuento)
+@receiver(post_save, sender=Divisa)
+@receiver(post_save, sender=Segmento)
+@receiver(post_delete, sender=TasaCambio)
+@receiver(post_delete, sender=CotizacionSegmento)
+@receiver(post_delete, sender=Descuento)
+@receiver(post_delete, sender=Divisa)
+@receiver(post_delete, sender=Segmento)
+@receiver(cotizaciones_publicadas)
+def invalidar_snapshot_cotizaciones(sender, **kwargs):
+    """
+    Descarta el snapshot de cotizaciones cuando cambia algo que lo compone.
+
+    Se invalida de inmediato (para que el mismo proceso vea el cambio) y otra
+    vez al confirmar la transacción, por si otro hilo reconstruyó el snapshot
+    con datos todavía sin confirmar.
+    """
+    invalidar_snapshot()
+    transaction.on_commit(invalidar_snapshot)
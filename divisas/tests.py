@@ -134,6 +134,27 @@ class DivisasServicesTest(TestCase):
         print(f"Total generados: {count}")
         self.assertGreater(count, 0, "❌ No se generaron cotizaciones")
 
+    def test_generar_cotizaciones_una_senal_por_publicacion(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_generar_cotizaciones_una_senal_por_publicacion")
+        from divisas.signals import cotizaciones_publicadas
+        Segmento.objects.create(name="vip")
+        Segmento.objects.create(name="corporativo")
+        eventos = []
+
+        def capturar(sender, divisa, tasa, cotizaciones, **kwargs):
+            eventos.append((divisa, tasa, len(cotizaciones)))
+
+        cotizaciones_publicadas.connect(capturar)
+        try:
+            creadas = generar_cotizaciones_por_segmento(self.divisa, self.tasa, self.user)
+        finally:
+            cotizaciones_publicadas.disconnect(capturar)
+        print(f"Eventos: {eventos}")
+        self.assertEqual(len(creadas), 3, "❌ No se generó una fila por segmento")
+        self.assertEqual(eventos, [(self.divisa, self.tasa, 3)], "❌ Se esperaba un único evento por publicación")
+        self.assertTrue(all(c.pk for c in creadas), "❌ Las filas insertadas en bloque no tienen pk")
+
     def test_ultimas_por_segmento_retorna_unico(self):
         print("\n================================================================================")
         print("Ejecutando: test_ultimas_por_segmento_retorna_unico")
@@ -151,6 +172,77 @@ class DivisasServicesTest(TestCase):
         print(f"Cantidad obtenida con filtro hasta ahora: {futuros.count()}")
         self.assertTrue(all(c.fecha <= timezone.now() for c in futuros), "❌ Cotizaciones con fecha posterior")
 
+    def test_cotizacion_vigente_apunta_a_la_ultima(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_cotizacion_vigente_apunta_a_la_ultima")
+        from divisas.models import CotizacionVigente
+        generar_cotizaciones_por_segmento(self.divisa, self.tasa, self.user)
+        nuevas = generar_cotizaciones_por_segmento(self.divisa, self.tasa, self.user)
+        vigentes = CotizacionVigente.objects.filter(divisa=self.divisa)
+        print(f"Filas vigentes: {vigentes.count()}")
+        self.assertEqual(vigentes.count(), 1, "❌ Debe existir una sola fila vigente por par")
+        ultima = CotizacionSegmento.objects.ultima_para(self.divisa, self.seg)
+        self.assertEqual(ultima.pk, nuevas[0].pk, "❌ La cotización vigente no es la última publicada")
+
+    def test_cotizacion_vigente_no_retrocede_fuera_de_orden(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_cotizacion_vigente_no_retrocede_fuera_de_orden")
+        from datetime import timedelta
+        from divisas.models import CotizacionVigente
+        vieja = generar_cotizaciones_por_segmento(self.divisa, self.tasa, self.user)[0]
+        nueva = generar_cotizaciones_por_segmento(self.divisa, self.tasa, self.user)[0]
+        vieja.fecha = nueva.fecha - timedelta(minutes=1)
+        CotizacionSegmento.objects.filter(pk=vieja.pk).update(fecha=vieja.fecha)
+        # La publicación más vieja confirma después de la nueva.
+        CotizacionVigente.actualizar([nueva])
+        CotizacionVigente.actualizar([vieja])
+        vigente = CotizacionVigente.objects.get(divisa=self.divisa, segmento=self.seg)
+        print(f"Vigente: {vigente.cotizacion_id} (vieja={vieja.pk}, nueva={nueva.pk})")
+        self.assertEqual(vigente.cotizacion_id, nueva.pk, "❌ Una publicación vieja pisó a la vigente")
+        self.assertEqual(vigente.fecha, nueva.fecha)
+
+    def test_matriz_cotizaciones_filtra_segmento(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_matriz_cotizaciones_filtra_segmento")
+        from divisas.services import matriz_cotizaciones
+        vip = Segmento.objects.create(name="vip")
+        Divisa.objects.filter(pk=self.divisa.pk).update(is_active=True)
+        eur = Divisa.objects.create(code="EUR", nombre="Euro", is_active=True)
+        generar_cotizaciones_por_segmento(self.divisa, self.tasa, self.user)
+        generar_cotizaciones_por_segmento(eur, self.tasa, self.user)
+        with self.assertNumQueries(1):
+            matriz = matriz_cotizaciones()
+            codigos = {seg: sorted(cots) for seg, cots in matriz.items()}
+            nombres = [c.segmento.name for cots in matriz.values() for c in cots.values()]
+        print(f"Matriz: {codigos}")
+        self.assertEqual(codigos, {self.seg.id: ["EUR", "USD"], vip.id: ["EUR", "USD"]}, "❌ Matriz incompleta")
+        self.assertEqual(len(nombres), 4)
+        solo_vip = matriz_cotizaciones(segmento=vip)
+        self.assertEqual(list(solo_vip), [vip.id], "❌ El filtro de segmento no se aplicó")
+
+    def test_cambio_descuento_recalcula_solo_su_segmento(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_cambio_descuento_recalcula_solo_su_segmento")
+        from clientes.models import Descuento
+        Divisa.objects.filter(pk=self.divisa.pk).update(is_active=True)
+        eur = Divisa.objects.create(code="EUR", nombre="Euro", is_active=True)
+        TasaCambio.objects.create(divisa=eur, precio_base=Decimal("8000"),
+                                  comision_compra=Decimal("100"), comision_venta=Decimal("200"))
+        vip = Segmento.objects.create(name="vip")
+        antes = CotizacionSegmento.objects.filter(segmento=self.seg).count()
+
+        Descuento.objects.create(segmento=vip, porcentaje_descuento=Decimal("50"))
+
+        del_vip = CotizacionSegmento.objects.vigentes().filter(segmento=vip).select_related("divisa")
+        print(f"Cotizaciones vigentes vip: {[(c.divisa.code, c.valor_venta_unit) for c in del_vip]}")
+        self.assertEqual(CotizacionSegmento.objects.filter(segmento=self.seg).count(), antes,
+                         "❌ Se recalcularon segmentos no afectados")
+        eur_vip = del_vip.get(divisa=eur)
+        self.assertEqual(eur_vip.porcentaje_descuento, Decimal("50"))
+        self.assertEqual(eur_vip.valor_venta_unit, Decimal("8100.00000000"), "❌ Venta mal calculada")
+        self.assertEqual(eur_vip.valor_compra_unit, Decimal("7950.00000000"), "❌ Compra mal calculada")
+        self.assertEqual(del_vip.count(), 2, "❌ Falta alguna divisa activa en el segmento")
+
 
 # ============================================================
 # SIGNALS
@@ -214,3 +306,307 @@ class DivisasViewsTest(TestCase):
         print(f"Status: {resp.status_code}, Keys en contexto: {list(resp.context.keys())}")
         self.assertEqual(resp.status_code, 200, "❌ visualizador_tasas no devolvió 200")
         self.assertIn("divisas_data", resp.context, "❌ El contexto no contiene 'divisas_data'")
+
+    def test_visualizador_admin_consultas_constantes(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_visualizador_admin_consultas_constantes")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from divisas.cache import invalidar_snapshot
+        tasa = TasaCambio.objects.create(divisa=self.divisa, precio_base=Decimal("7000"))
+        generar_cotizaciones_por_segmento(self.divisa, tasa, self.user)
+        url = reverse("divisas:visualizador_tasas_admin")
+
+        def contar():
+            invalidar_snapshot()
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            return len(ctx.captured_queries)
+
+        con_una = contar()
+        for code in ("EUR", "BRL", "ARS"):
+            divisa = Divisa.objects.create(code=code, nombre=code, is_active=True)
+            generar_cotizaciones_por_segmento(divisa, tasa, self.user)
+        con_cuatro = contar()
+        print(f"Consultas con 1 divisa: {con_una}, con 4 divisas: {con_cuatro}")
+        self.assertEqual(con_una, con_cuatro, "❌ Las consultas crecen con la cantidad de divisas")
+
+
+# ============================================================
+# SNAPSHOT DE COTIZACIONES
+# ============================================================
+class DivisasSnapshotTest(TestCase):
+    def setUp(self):
+        self.divisa = Divisa.objects.create(code="USD", nombre="Dólar", is_active=True)
+        self.seg = Segmento.objects.create(name="general")
+
+    def _cotizar(self, precio_base):
+        return CotizacionSegmento.objects.create(
+            divisa=self.divisa,
+            segmento=self.seg,
+            precio_base=Decimal(precio_base),
+            comision_compra=Decimal("10"),
+            comision_venta=Decimal("10"),
+        )
+
+    def test_snapshot_reutiliza_sin_consultas(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_snapshot_reutiliza_sin_consultas")
+        from divisas.cache import obtener_snapshot
+        self._cotizar("7000")
+        snap = obtener_snapshot()
+        with self.assertNumQueries(0):
+            otro = obtener_snapshot()
+        print(f"Versión: {snap.version}")
+        self.assertIs(snap, otro, "❌ El snapshot se reconstruyó sin cambios")
+        self.assertEqual(snap.cotizacion(self.seg.id, "USD").precio_base, Decimal("7000"))
+
+    def test_snapshot_se_invalida_al_guardar_cotizacion(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_snapshot_se_invalida_al_guardar_cotizacion")
+        from divisas.cache import obtener_snapshot
+        self._cotizar("7000")
+        antes = obtener_snapshot()
+        nueva = self._cotizar("7100")
+        despues = obtener_snapshot()
+        print(f"Versión antes={antes.version}, después={despues.version}")
+        self.assertGreater(despues.version, antes.version, "❌ La versión no aumentó")
+        self.assertEqual(despues.cotizacion(self.seg.id, "USD").pk, nueva.pk)
+        data = despues.por_segmento(self.seg.id)
+        self.assertEqual(data[0]["cotizaciones"], [nueva], "❌ por_segmento no devuelve la última")
+
+    def test_snapshot_se_invalida_al_borrar_tasa(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_snapshot_se_invalida_al_borrar_tasa")
+        from divisas.cache import obtener_snapshot
+        self._cotizar("7000")
+        tasa = TasaCambio.objects.create(
+            divisa=self.divisa, precio_base=Decimal("7000"),
+            comision_compra=Decimal("10"), comision_venta=Decimal("10"),
+        )
+        antes = obtener_snapshot()
+        tasa.delete()
+        despues = obtener_snapshot()
+        print(f"Versión antes={antes.version}, después={despues.version}")
+        self.assertIsNot(despues, antes, "❌ El snapshot sobrevivió al borrado de la tasa")
+
+
+# ============================================================
+# TOKENS DE COTIZACIÓN
+# ============================================================
+class DivisasTokensTest(TestCase):
+    def setUp(self):
+        self.divisa = Divisa.objects.create(code="USD", nombre="Dólar", is_active=True)
+        self.eur = Divisa.objects.create(code="EUR", nombre="Euro", is_active=True)
+        self.seg = Segmento.objects.create(name="general")
+
+    def _cotizar(self, divisa, venta):
+        return CotizacionSegmento.objects.create(
+            divisa=divisa,
+            segmento=self.seg,
+            precio_base=Decimal("7000"),
+            comision_compra=Decimal("100"),
+            comision_venta=Decimal("100"),
+            valor_compra_unit=Decimal("6900"),
+            valor_venta_unit=Decimal(venta),
+        )
+
+    def test_token_vigente_sin_consultas(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_token_vigente_sin_consultas")
+        from divisas.tokens import firmar_cotizacion, verificar_cotizacion
+        cot = self._cotizar(self.divisa, "7100")
+        token = firmar_cotizacion(cot, "compra", cot.valor_venta_unit)
+        with self.assertNumQueries(0):
+            vigente, motivo = verificar_cotizacion(token, "USD")
+        print(f"Vigente: {vigente}")
+        self.assertTrue(vigente, f"❌ Token rechazado: {motivo}")
+
+    def test_token_rechazado_si_cambia_el_precio(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_token_rechazado_si_cambia_el_precio")
+        from divisas.tokens import firmar_cotizacion, verificar_cotizacion
+        cot = self._cotizar(self.divisa, "7100")
+        token = firmar_cotizacion(cot, "compra", cot.valor_venta_unit)
+
+        self._cotizar(self.eur, "8000")
+        self.assertTrue(verificar_cotizacion(token, "USD")[0], "❌ Otra divisa no debe invalidar el token")
+        self._cotizar(self.divisa, "7100")
+        self.assertTrue(verificar_cotizacion(token, "USD")[0], "❌ Mismo precio no debe invalidar el token")
+        self._cotizar(self.divisa, "7200")
+        vigente, motivo = verificar_cotizacion(token, "USD")
+        print(f"Vigente: {vigente}, motivo: {motivo}")
+        self.assertFalse(vigente, "❌ Se aceptó un precio desactualizado")
+
+    def test_token_rechazado_con_snapshot_viejo(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_token_rechazado_con_snapshot_viejo")
+        from django.test import override_settings
+        from divisas import cache
+        from divisas.tokens import firmar_cotizacion, verificar_cotizacion
+        cot = self._cotizar(self.divisa, "7100")
+        token = firmar_cotizacion(cot, "compra", cot.valor_venta_unit)
+
+        # Otro worker publica un precio nuevo; este proceso conserva su snapshot
+        viejo = cache.obtener_snapshot()
+        self._cotizar(self.divisa, "7200")
+        cache._snapshot = viejo
+
+        with override_settings(COTIZACION_TOKEN_TOLERANCIA=0):
+            vigente, motivo = verificar_cotizacion(token, "USD")
+        print(f"Vigente: {vigente}, motivo: {motivo}")
+        self.assertFalse(vigente, "❌ Un snapshot viejo no debería validar un precio reemplazado")
+
+    def test_token_alterado_o_de_otra_divisa(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_token_alterado_o_de_otra_divisa")
+        from divisas.tokens import firmar_cotizacion, verificar_cotizacion
+        cot = self._cotizar(self.divisa, "7100")
+        token = firmar_cotizacion(cot, "compra", cot.valor_venta_unit)
+        self.assertFalse(verificar_cotizacion(token[:-2] + "xx", "USD")[0], "❌ Se aceptó un token alterado")
+        self.assertFalse(verificar_cotizacion(token, "EUR")[0], "❌ Se aceptó un token de otra divisa")
+        self.assertFalse(verificar_cotizacion(None)[0], "❌ Se aceptó una operación sin token")
+
+
+# ============================================================
+# RESÚMENES OHLC Y SERIES
+# ============================================================
+class DivisasResumenTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester", "t@t.com", "123")
+        self.divisa = Divisa.objects.create(code="USD", nombre="Dólar", is_active=True)
+
+    def test_resumen_ohlc_incremental(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_resumen_ohlc_incremental")
+        from divisas.models import TasaCambioResumen
+        for precio in ("7000", "7300", "6900", "7100"):
+            TasaCambio.objects.create(divisa=self.divisa, precio_base=Decimal(precio))
+        dia = TasaCambioResumen.objects.get(divisa=self.divisa, periodo="dia")
+        print(f"OHLC día: {dia.apertura}/{dia.maximo}/{dia.minimo}/{dia.cierre} n={dia.cantidad}")
+        self.assertEqual(
+            (dia.apertura, dia.maximo, dia.minimo, dia.cierre, dia.cantidad),
+            (Decimal("7000"), Decimal("7300"), Decimal("6900"), Decimal("7100"), 4),
+            "❌ Resumen OHLC incorrecto",
+        )
+        self.assertEqual(TasaCambioResumen.objects.filter(divisa=self.divisa).count(), 3,
+                         "❌ Debe haber un resumen por hora, día y mes")
+
+    def test_reducir_lttb_conserva_extremos(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_reducir_lttb_conserva_extremos")
+        from divisas.services import reducir_lttb
+        serie = [(x, 0.0, x) for x in range(1000)]
+        serie[500] = (500, 100.0, 500)
+        reducida = reducir_lttb(serie, 50)
+        print(f"Puntos: {len(reducida)}")
+        self.assertEqual(len(reducida), 50, "❌ Cantidad de puntos incorrecta")
+        self.assertEqual((reducida[0][2], reducida[-1][2]), (0, 999), "❌ No conserva primer y último punto")
+        self.assertIn(500, [p[2] for p in reducida], "❌ Se perdió el pico de la serie")
+
+    def test_serie_json(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_serie_json")
+        for precio in ("7000", "7100", "7200"):
+            TasaCambio.objects.create(divisa=self.divisa, precio_base=Decimal(precio))
+        self.client.force_login(self.user)
+        url = reverse("divisas:tasas_serie", kwargs={"divisa_id": self.divisa.id})
+
+        crudo = self.client.get(url).json()
+        diario = self.client.get(url, {"periodo": "dia"}).json()
+        print(f"Crudo: {crudo['resolucion']} {len(crudo['puntos'])}, diario: {diario['puntos']}")
+        self.assertEqual(crudo["resolucion"], "tasa")
+        self.assertEqual([p["valor"] for p in crudo["puntos"]], [7000.0, 7100.0, 7200.0])
+        self.assertEqual(diario["puntos"][0]["maximo"], 7200.0, "❌ El resumen diario no trae OHLC")
+        self.assertEqual(self.client.get(url, {"periodo": "anio"}).status_code, 400)
+
+
+# ============================================================
+# PAGINACIÓN POR CURSOR
+# ============================================================
+class DivisasPaginacionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester", "t@t.com", "123")
+        self.client.force_login(self.user)
+        self.divisa = Divisa.objects.create(code="USD", nombre="Dólar", is_active=True)
+        for i in range(45):
+            TasaCambio.objects.create(divisa=self.divisa, precio_base=Decimal(7000 + i))
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_recorre_todas_las_paginas_sin_repetir")
+        from casa_de_cambios.paginacion import paginar_keyset
+        qs = TasaCambio.objects.filter(divisa=self.divisa)
+        vistos, cursor, paginas = [], None, []
+        while True:
+            pagina = paginar_keyset(qs, ["-fecha", "-id"], cursor, por_pagina=20)
+            paginas.append(pagina)
+            vistos.extend(t.id for t in pagina)
+            if not pagina.has_next:
+                break
+            cursor = pagina.cursor_siguiente
+        print(f"Páginas: {[len(p) for p in paginas]}, total: {paginas[0].total}")
+        esperado = list(qs.order_by("-fecha", "-id").values_list("id", flat=True))
+        self.assertEqual(vistos, esperado, "❌ El recorrido por cursor no coincide con el orden completo")
+        self.assertEqual(paginas[0].total, 45)
+
+        volver = paginar_keyset(qs, ["-fecha", "-id"], paginas[-1].cursor_anterior, por_pagina=20)
+        self.assertEqual([t.id for t in volver], [t.id for t in paginas[1]], "❌ La página anterior no coincide")
+
+    def test_cursor_compara_la_fila_completa(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_cursor_compara_la_fila_completa")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from casa_de_cambios.paginacion import paginar_keyset
+        qs = TasaCambio.objects.filter(divisa=self.divisa)
+        primera = paginar_keyset(qs, ["-fecha", "-id"], por_pagina=20, contar=None)
+        with CaptureQueriesContext(connection) as consultas:
+            paginar_keyset(qs, ["-fecha", "-id"], primera.cursor_siguiente, por_pagina=20, contar=None)
+        sql = consultas.captured_queries[-1]["sql"]
+        print(f"SQL: {sql}")
+        self.assertRegex(sql, r'\("divisas_tasacambio"\."fecha", "divisas_tasacambio"\."id"\) < \(',
+                         "❌ El cursor no usa la comparación de filas (fecha, id)")
+
+    def test_pagina_profunda_mismas_consultas(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_pagina_profunda_mismas_consultas")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse("divisas:tasas", kwargs={"divisa_id": self.divisa.id})
+        with CaptureQueriesContext(connection) as primera:
+            resp = self.client.get(url)
+        en_primera = len(primera.captured_queries)
+        siguiente = resp.context["pagina"].url_siguiente
+        with CaptureQueriesContext(connection) as segunda:
+            resp2 = self.client.get(url + siguiente)
+        en_segunda = len(segunda.captured_queries)
+        print(f"Consultas página 1: {en_primera}, página 2: {en_segunda}")
+        self.assertEqual(en_primera, en_segunda, "❌ La página 2 cuesta más que la 1")
+        self.assertEqual(len(resp2.context["tasas"]), 20)
+        self.assertEqual(self.client.get(url, {"cursor": "basura"}).status_code, 200,
+                         "❌ Un cursor inválido debe volver a la primera página")
+        glob = self.client.get(reverse("divisas:tasas_global"), {"divisa": "USD"})
+        self.assertEqual(len(glob.context["tasas"]), 20, "❌ El histórico global no pagina por cursor")
+
+    def test_historico_global_navegable(self):
+        print("\n================================================================================")
+        print("Ejecutando: test_historico_global_navegable")
+        from django.utils.html import escape
+        url = reverse("divisas:tasas_global")
+        resp = self.client.get(url, {"divisa": "USD"})
+        vistos = []
+        while True:
+            pagina = resp.context["pagina"]
+            vistos.extend(t.id for t in pagina)
+            for tasa in pagina:
+                self.assertContains(resp, f"{tasa.precio_base:.2f}")
+            if not pagina.has_next:
+                break
+            self.assertContains(resp, escape(pagina.url_siguiente), msg_prefix="❌ Falta el enlace a la página siguiente")
+            resp = self.client.get(url + pagina.url_siguiente)
+        print(f"Tasas recorridas: {len(vistos)}")
+        esperado = list(TasaCambio.objects.order_by("fecha", "id").values_list("id", flat=True))
+        self.assertEqual(vistos, esperado, "❌ El histórico global no llega a todas las tasas")
+        self.assertContains(resp, escape(resp.context["pagina"].url_anterior))
@@ -0,0 +1,126 @@
+# divisas/tokens.py
+"""
+Tokens firmados de cotización.
+
+Cada resultado de simulación lleva un token con la época de cotizaciones, el
+segmento, la divisa y la tasa aplicada. Al crear la transacción el token se
+valida contra el snapshot en memoria (``divisas.cache``), sin volver a
+consultar la base mientras el snapshot sea reciente: si la cotización cambió
+desde la simulación, la operación se rechaza en lugar de crearse pendiente y
+cancelarse después.
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Max
+
+from .cache import obtener_snapshot, invalidar_snapshot
+
+_SALT = 'divisas.cotizacion'
+
+
+def _max_age():
+    return getattr(settings, 'COTIZACION_TOKEN_MAX_AGE', 15 * 60)
+
+
+def _tolerancia():
+    return getattr(settings, 'COTIZACION_TOKEN_TOLERANCIA', 5)
+
+
+def _al_dia(snapshot):
+    """
+    Indica si ``snapshot`` sigue reflejando la última publicación. Un snapshot
+    de menos de ``COTIZACION_TOKEN_TOLERANCIA`` segundos se acepta sin más;
+    uno más viejo puede no haber visto una tasa publicada por otro worker, así
+    que su época se compara con la de la base (máximo id de
+    :class:`~divisas.models.CotizacionVigente`, una consulta sobre su índice).
+    """
+    if time.monotonic() - snapshot.creado < _tolerancia():
+        return True
+    from .models import CotizacionVigente
+
+    epoca = (CotizacionVigente.objects.filter(divisa__is_active=True)
+             .aggregate(epoca=Max('cotizacion_id'))['epoca'] or 0)
+    return epoca == snapshot.epoca
+
+
+def _tasa_de(cotizacion, tipo_operacion):
+    # Compra del cliente -> el negocio vende; venta del cliente -> el negocio compra
+    if tipo_operacion == 'compra':
+        return cotizacion.valor_venta_unit
+    return cotizacion.valor_compra_unit
+
+
+def firmar_cotizacion(cotizacion, tipo_operacion, tasa):
+    """
+    Genera el token de la cotización usada en una simulación.
+
+    :param cotizacion: Cotización aplicada.
+    :type cotizacion: divisas.models.CotizacionSegmento
+    :param tipo_operacion: ``'compra'`` o ``'venta'``.
+    :type tipo_operacion: str
+    :param tasa: Tasa aplicada en la simulación.
+    :type tasa: Decimal
+    :return: Token firmado.
+    :rtype: str
+    """
+    datos = {
+        'e': obtener_snapshot().epoca,
+        'c': cotizacion.pk,
+        's': cotizacion.segmento_id,
+        'd': cotizacion.divisa.code,
+        'o': tipo_operacion,
+        't': str(tasa),
+    }
+    return signing.dumps(datos, salt=_SALT, compress=True)
+
+
+def verificar_cotizacion(token, divisa_code=None):
+    """
+    Verifica que el precio de un token siga vigente.
+
+    Si la época no cambió (y el snapshot está al día, ver :func:`_al_dia`),
+    el token es válido sin más. Si cambió, se compara la tasa del token con la
+    cotización vigente del mismo par (segmento, divisa): una publicación de
+    otra divisa, o una nueva con el mismo precio, no invalida la operación.
+
+    :param token: Token generado por :func:`firmar_cotizacion`.
+    :type token: str
+    :param divisa_code: Si se indica, el token debe ser de esta divisa.
+    :type divisa_code: str
+    :return: ``(vigente, motivo)``; ``motivo`` es vacío si es vigente.
+    :rtype: tuple
+    """
+    if not token:
+        return False, 'La operación no tiene una cotización asociada. Vuelva a simularla.'
+    try:
+        datos = signing.loads(token, salt=_SALT, max_age=_max_age())
+    except signing.SignatureExpired:
+        return False, 'La cotización expiró. Vuelva a simular la operación.'
+    except signing.BadSignature:
+        return False, 'La cotización de la operación no es válida.'
+
+    if divisa_code and datos['d'] != divisa_code:
+        return False, 'La cotización no corresponde a la divisa de la operación.'
+
+    snapshot = obtener_snapshot()
+    if not _al_dia(snapshot):
+        # Otro proceso publicó después de construir este snapshot
+        invalidar_snapshot()
+        snapshot = obtener_snapshot()
+    if datos['e'] == snapshot.epoca:
+        return True, ''
+
+    actual = snapshot.cotizacion(datos['s'], datos['d'])
+    if actual is None or actual.pk < datos['c']:
+        # Este proceso todavía no vio la publicación que originó el token
+        invalidar_snapshot()
+        actual = obtener_snapshot().cotizacion(datos['s'], datos['d'])
+
+    if actual is not None and (
+        actual.pk == datos['c'] or _tasa_de(actual, datos['o']) == Decimal(datos['t'])
+    ):
+        return True, ''
+    return False, 'La cotización cambió desde la simulación. Vuelva a simular la operación.'
@@ -17,6 +17,8 @@ urlpatterns = [
     # Tasas por divisa
     path('<int:divisa_id>/tasas/', TasaCambioListView.as_view(), name='tasas'),
     path('<int:divisa_id>/tasas/nueva/', TasaCambioCreateView.as_view(), name='tasa_nueva'),
+    # Serie reducida para gráficos (JSON)
+    path('<int:divisa_id>/tasas/serie.json', views.serie_tasas_json, name='tasas_serie'),
 
     # Tabla histórica global (filtros por divisa y fechas)
     path('tasas/', TasaCambioAllListView.as_view(), name='tasas_global'),
@@ -10,13 +10,15 @@ from .forms import DivisaForm, TasaCambioForm, VentaDivisaForm
 from django.db.models import Max
 from django.db.models import OuterRef, Subquery
 from django.contrib.auth.decorators import login_required
+from casa_de_cambios.paginacion import paginar_request
 #Visualización tasas inicio
 from divisas.services import ultimas_por_segmento
 from divisas.models import Divisa
-from simulador.views import calcular_simulacion_api
+from clientes.services import resolver_segmento
+from simulador.services import (
+    SolicitudSimulacion, SimulacionError, calcular_simulacion, reservar_cotizacion,
+)
 from django.http import JsonResponse
-import json
-from django.test import RequestFactory
 from clientes.views import get_medio_acreditacion_seleccionado, get_medio_pago_seleccionado
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 import logging
@@ -126,7 +128,7 @@ class TasaCambioListView(LoginRequiredMixin, ListView):
     model = TasaCambio
     template_name = 'divisas/tasa_list.html'
     context_object_name = 'tasas'
-    paginate_by = 20
+    por_pagina = 20
 
     def get_queryset(self):
         """
@@ -152,6 +154,10 @@ class TasaCambioListView(LoginRequiredMixin, ListView):
         """
         ctx = super().get_context_data(**kwargs)
         ctx['divisa'] = get_object_or_404(Divisa, pk=self.kwargs['divisa_id'])
+        # Paginación por cursor sobre el índice (divisa, fecha)
+        pagina = paginar_request(self.request, self.object_list, ['-fecha', '-id'], self.por_pagina)
+        ctx['pagina'] = pagina
+        ctx['tasas'] = pagina.object_list
         return ctx
 
 
@@ -206,7 +212,7 @@ class TasaCambioAllListView(LoginRequiredMixin, ListView):
     model = TasaCambio
     template_name = 'tasa_list_global.html'
     context_object_name = 'tasas'
-    paginate_by = 20
+    por_pagina = 20
 
     def get_queryset(self):
         """
@@ -240,6 +246,10 @@ class TasaCambioAllListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
+        # Paginación por cursor sobre el índice (fecha, id)
+        pagina = paginar_request(self.request, self.object_list, ['fecha', 'id'], self.por_pagina)
+        ctx['pagina'] = pagina
+        ctx['tasas'] = pagina.object_list
         ctx['divisas'] = Divisa.objects.order_by('code')
         # Mantener valores del filtro en el form
         ctx['f_divisa'] = self.request.GET.get('divisa', '')
@@ -248,51 +258,76 @@ class TasaCambioAllListView(LoginRequiredMixin, ListView):
         return ctx
 
 
+def _parsear_fecha(valor, fin_del_dia=False):
+    """Acepta ``YYYY-MM-DD`` o fecha/hora ISO; devuelve un datetime aware o ``None``."""
+    from datetime import datetime, time
+    from django.utils import timezone
+    from django.utils.dateparse import parse_date, parse_datetime
+
+    if not valor:
+        return None
+    dt = parse_datetime(valor)
+    if dt is None:
+        d = parse_date(valor)
+        if d is None:
+            raise ValueError(valor)
+        dt = datetime.combine(d, time.max if fin_del_dia else time.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+@login_required
+def serie_tasas_json(request, divisa_id):
+    """
+    Serie histórica del precio base de una divisa, reducida para gráficos.
+
+    Parámetros GET opcionales: ``inicio`` y ``fin`` (fecha u ISO), ``puntos``
+    (máximo a devolver, por defecto 500) y ``periodo`` (``hora``, ``dia`` o
+    ``mes`` para forzar los resúmenes OHLC). Ver
+    :func:`divisas.services.serie_tasas`.
+
+    :param divisa_id: ID de la divisa.
+    :type divisa_id: int
+    :rtype: django.http.JsonResponse
+    """
+    from .services import serie_tasas
+
+    divisa = get_object_or_404(Divisa, pk=divisa_id)
+    periodo = request.GET.get('periodo') or None
+    try:
+        inicio = _parsear_fecha(request.GET.get('inicio'))
+        fin = _parsear_fecha(request.GET.get('fin'), fin_del_dia=True)
+        puntos = min(max(int(request.GET.get('puntos', 500)), 3), 5000)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros de fecha o puntos inválidos.'}, status=400)
+    if periodo not in (None, 'hora', 'dia', 'mes'):
+        return JsonResponse({'error': 'Período inválido.'}, status=400)
+
+    resolucion, serie = serie_tasas(divisa, inicio, fin, puntos, periodo)
+    return JsonResponse({
+        'divisa': divisa.code,
+        'resolucion': resolucion,
+        'puntos': serie,
+    })
+
+
 
 
 
 def visualizador_tasas(request):
     """
     Muestra las tasas de cambio actuales filtradas por el cliente activo en la sesión.
-    Si no hay cliente activo, usa el segmento 'general'.
+    Si no hay cliente activo, usa el de la primera asignación del usuario o el
+    segmento 'general' (ver :func:`clientes.services.resolver_segmento`).
     """
-    from clientes.models import Cliente, Segmento
-    from .services import ultimas_por_segmento
+    from .cache import obtener_snapshot
 
-    segmento_activo = None
+    # 1. Segmento del cliente activo (o asignación, o 'general'), cacheado en sesión
+    segmento_activo = resolver_segmento(request.session, request.user)
 
-    # 1. Detectar cliente activo en la sesión
-    cliente_id = request.session.get("cliente_id")
-
-    if cliente_id:
-        try:
-            cliente = Cliente.objects.get(id=cliente_id, esta_activo=True)
-            segmento_activo = cliente.segmento
-        except Cliente.DoesNotExist:
-            pass
-
-    # 2. Si no hay cliente activo, usar segmento "general"
-    if not segmento_activo:
-        segmento_activo, _ = Segmento.objects.get_or_create(name="general")
-
-    # 3. Obtener divisas activas
-    divisas_activas = Divisa.objects.filter(is_active=True).order_by("code")
-    divisas_data = []
-
-    for divisa in divisas_activas:
-        # Obtener las últimas cotizaciones
-        ultimas_cotizaciones = ultimas_por_segmento(divisa)
-
-        # Filtrar SOLO el segmento activo
-        cotizaciones_segmento = [
-            cot for cot in ultimas_cotizaciones
-            if cot.segmento == segmento_activo
-        ]
-
-        divisas_data.append({
-            "divisa": divisa,
-            "cotizaciones": cotizaciones_segmento
-        })
+    # 3. Cotizaciones vigentes del segmento activo para cada divisa activa
+    divisas_data = obtener_snapshot().por_segmento(segmento_activo.id)
 
     return render(request, "visualizador.html", {
         "divisas_data": divisas_data,
@@ -311,19 +346,10 @@ def visualizador_tasas_admin(request):
     Vista administrativa que muestra todas las cotizaciones de todos los segmentos.
     Solo accesible para staff y superusuarios.
     """
-    from .services import ultimas_por_segmento
-    
-    divisas_activas = Divisa.objects.filter(is_active=True).order_by('code')
-    divisas_data = []
-    
-    for divisa in divisas_activas:
-        # Obtener las últimas cotizaciones para esta divisa (todos los segmentos)
-        ultimas_cotizaciones = ultimas_por_segmento(divisa)
-        
-        divisas_data.append({
-            'divisa': divisa,
-            'cotizaciones': list(ultimas_cotizaciones)
-        })
+    from .cache import obtener_snapshot
+
+    # Últimas cotizaciones de cada divisa activa (todos los segmentos)
+    divisas_data = obtener_snapshot().todas()
     
     return render(request, 'visualizador_admin.html', {
         'divisas_data': divisas_data,
@@ -353,31 +379,17 @@ class VentaDivisaView(LoginRequiredMixin, FormView):
         divisa = form.cleaned_data['divisa']
         monto = form.cleaned_data['monto']
 
-        payload = {
-            "tipo_operacion": "venta",
-            "monto": str(monto),  # ya es str
-            "moneda": divisa.code
-        }
-
-        rf = RequestFactory()
-        post_req = rf.post(
-            '/simulador/calcular/',
-            data=json.dumps(payload),
-            content_type='application/json'
-        )
-        post_req.session = self.request.session
-        post_req.user = self.request.user
-
-        resp = calcular_simulacion_api(post_req)
         try:
-            data = json.loads(resp.content)
-        except Exception:
-            form.add_error(None, "Error interno al comunicarse con el simulador.")
+            segmento = resolver_segmento(self.request.session, self.request.user)
+            solicitud = SolicitudSimulacion(tipo_operacion="venta", monto=monto, moneda=divisa.code)
+            resultado = calcular_simulacion(solicitud, segmento)
+        except SimulacionError as e:
+            form.add_error(None, str(e))
             return self.form_invalid(form)
 
-        if not data.get("success"):
-            form.add_error(None, data.get("error", "Error en la simulación"))
-            return self.form_invalid(form)
+        # 🔹 Bloquear la tasa simulada hasta crear la transacción
+        data = resultado.como_dict()
+        data["reserva_id"] = str(reservar_cotizacion(solicitud, resultado, self.request.user).pk)
 
         # 🔹 Convertir Decimals antes de guardar
         self.request.session['venta_resultado'] = decimal_to_str(data)
@@ -410,6 +422,8 @@ class VentaConfirmacionView(LoginRequiredMixin, TemplateView):
             "monto_guaranies": str(redondear(resultado.get("monto_resultado"), 0)),
             "tasa_cambio": str(redondear(resultado.get("tasa_aplicada"), 2)),
             "comision": resultado.get("comision_aplicada"),
+            "token_cotizacion": resultado.get("token_cotizacion"),
+            "reserva_id": resultado.get("reserva_id"),
         }
         request.session["operacion"] = operacion
         request.session.modified = True
@@ -579,31 +593,17 @@ class CompraDivisaView(LoginRequiredMixin, FormView):
         divisa = form.cleaned_data['divisa']
         monto = form.cleaned_data['monto']
 
-        payload = {
-            "tipo_operacion": "compra",
-            "monto": str(monto),  # Monto en guaraníes
-            "moneda": divisa.code
-        }
-
-        rf = RequestFactory()
-        post_req = rf.post(
-            '/simulador/calcular/',
-            data=json.dumps(payload),
-            content_type='application/json'
-        )
-        post_req.session = self.request.session
-        post_req.user = self.request.user
-
-        resp = calcular_simulacion_api(post_req)
         try:
-            data = json.loads(resp.content)
-        except Exception:
-            form.add_error(None, "Error interno al comunicarse con el simulador.")
+            segmento = resolver_segmento(self.request.session, self.request.user)
+            solicitud = SolicitudSimulacion(tipo_operacion="compra", monto=monto, moneda=divisa.code)  # Monto en guaraníes
+            resultado = calcular_simulacion(solicitud, segmento)
+        except SimulacionError as e:
+            form.add_error(None, str(e))
             return self.form_invalid(form)
+        data = resultado.como_dict()
 
-        if not data.get("success"):
-            form.add_error(None, data.get("error", "Error en la simulación"))
-            return self.form_invalid(form)
+        # 🔹 Bloquear la tasa simulada hasta crear la transacción
+        data["reserva_id"] = str(reservar_cotizacion(solicitud, resultado, self.request.user).pk)
 
         # Convertir Decimals antes de guardar
         # Redondear valores sensibles
@@ -647,6 +647,8 @@ class CompraConfirmacionView(LoginRequiredMixin, TemplateView):
             "monto_divisa": str(redondear(resultado.get("monto_resultado"), 2)),
             "tasa_cambio": str(redondear(resultado.get("tasa_aplicada"), 2)),
             "comision": resultado.get("comision_aplicada"),
+            "token_cotizacion": resultado.get("token_cotizacion"),
+            "reserva_id": resultado.get("reserva_id"),
         }
         request.session["operacion"] = operacion
         request.session.modified = True
@@ -9,7 +9,9 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from divisas.models import Divisa, TasaCambio
 from django.db.models import OuterRef, Subquery
-from divisas.services import ultimas_por_segmento
+from divisas.cache import obtener_snapshot
+from simulador.context_processors import simulador_context
+from clientes.services import resolver_segmento
 # interfaz/views.py
 from django.http import JsonResponse
 from django.template.loader import render_to_string
@@ -29,7 +31,7 @@ def inicio(request):
 
     if cliente_id:
         try:
-            cliente_activo = Cliente.objects.get(id=cliente_id, esta_activo=True)
+            cliente_activo = Cliente.objects.select_related("segmento").get(id=cliente_id, esta_activo=True)
         except Cliente.DoesNotExist:
             cliente_activo = None
 
@@ -40,23 +42,15 @@ def inicio(request):
             cliente_activo = asignaciones.first().cliente
             request.session['cliente_id'] = cliente_activo.id
 
-    # Si aún no hay cliente, usamos segmento "general" (creamos si no existe)
+    # Si aún no hay cliente, el mismo segmento que usa el simulador (cacheado en sesión)
     segmento_obj = None
     if cliente_activo and cliente_activo.segmento:
         segmento_obj = cliente_activo.segmento
     else:
-        segmento_obj, _ = Segmento.objects.get_or_create(name="general")
+        segmento_obj = resolver_segmento(request.session, request.user)
 
     # ---------- construir divisas_data para la plantilla ----------
-    divisas_activas = Divisa.objects.filter(is_active=True).order_by('code')
-    divisas_data = []
-    for divisa in divisas_activas:
-        ultimas = ultimas_por_segmento(divisa)   # retorna queryset de CotizacionSegmento (últimas por segmento)
-        cotizaciones = [c for c in ultimas if c.segmento_id == getattr(segmento_obj, 'id', None)]
-        divisas_data.append({
-            'divisa': divisa,
-            'cotizaciones': cotizaciones
-        })
+    divisas_data = obtener_snapshot().por_segmento(getattr(segmento_obj, 'id', None))
 
     # también pasar lista de clientes asignados para que el usuario pueda elegir si tiene >1
     clientes_asignados = []
@@ -78,6 +72,8 @@ def inicio(request):
         "clientes_asignados": clientes_asignados,
         "mostrar_alerta_sin_clientes": mostrar_alerta_sin_clientes,  # <--- CAMBIO
     }
+    # inicio.html incluye el simulador
+    context.update(simulador_context(request))
     return render(request, "inicio.html", context)
 
 def contacto(request):
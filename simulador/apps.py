@@ -5,3 +5,6 @@ from django.apps import AppConfig
 class SimuladorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'simulador'
+
+    def ready(self):
+        import simulador.signals
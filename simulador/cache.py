@@ -0,0 +1,132 @@
+# simulador/cache.py
+"""
+Caché en memoria de resultados de simulación.
+
+El simulador envía una solicitud por cada tecla en el campo de monto, y la
+mayoría repite la misma combinación (segmento, divisa, operación, monto). Los
+resultados se memoizan por proceso en un LRU acotado con vencimiento, con la
+época de cotizaciones (``SnapshotCotizaciones.epoca``) como parte de la clave:
+cuando se publica una cotización nueva cambia la época y la caché se vacía.
+
+Los contadores (aciertos, fallos, desalojos) permiten dimensionarla; ver
+:func:`simulador.views.estadisticas_cache_api`.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class CacheResultados:
+    """
+    LRU acotado con vencimiento por entrada y contadores de uso.
+
+    :param maximo: Cantidad máxima de entradas.
+    :type maximo: int
+    :param ttl: Segundos que vive cada entrada.
+    :type ttl: float
+    """
+
+    def __init__(self, maximo, ttl):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._epoca = None
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.vencidos = 0
+        self.vaciados = 0
+
+    def _cambiar_epoca(self, epoca):
+        if epoca != self._epoca:
+            if self._datos:
+                self.vaciados += 1
+            self._datos.clear()
+            self._epoca = epoca
+
+    def obtener(self, epoca, clave):
+        """
+        Retorna el valor memoizado para ``clave`` en ``epoca`` o ``None``.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            self._cambiar_epoca(epoca)
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                vence, valor = entrada
+                if vence > ahora:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._datos[clave]
+                self.vencidos += 1
+            self.fallos += 1
+            return None
+
+    def guardar(self, epoca, clave, valor):
+        """Memoiza ``valor``; desaloja la entrada menos usada si se llenó."""
+        with self._lock:
+            self._cambiar_epoca(epoca)
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def vaciar(self):
+        """Descarta todas las entradas (los contadores se conservan)."""
+        with self._lock:
+            self._datos.clear()
+            self._epoca = None
+
+    def estadisticas(self):
+        """
+        Contadores de uso de la caché.
+
+        :rtype: dict
+        """
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._datos),
+                'maximo': self.maximo,
+                'ttl': self.ttl,
+                'epoca': self._epoca,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else 0.0,
+                'desalojos': self.desalojos,
+                'vencidos': self.vencidos,
+                'vaciados': self.vaciados,
+            }
+
+
+_lock = threading.Lock()
+_resultados = None
+
+
+def cache_resultados():
+    """
+    Caché de resultados del proceso, creada con ``SIMULADOR_CACHE_MAXIMO`` y
+    ``SIMULADOR_CACHE_TTL`` la primera vez que se usa.
+
+    :rtype: CacheResultados
+    """
+    global _resultados
+    if _resultados is None:
+        with _lock:
+            if _resultados is None:
+                _resultados = CacheResultados(
+                    getattr(settings, 'SIMULADOR_CACHE_MAXIMO', 4096),
+                    getattr(settings, 'SIMULADOR_CACHE_TTL', 30),
+                )
+    return _resultados
+
+
+def vaciar_resultados():
+    """Descarta los resultados memoizados del proceso."""
+    if _resultados is not None:
+        _resultados.vaciar()
@@ -1,15 +1,11 @@
 # simulador/context_processors.py
 import json
-from decimal import Decimal
-from divisas.models import Divisa, CotizacionSegmento
-from clientes.models import Cliente as ClienteModel, AsignacionCliente, Descuento
-from django.db.models import F, OuterRef, Subquery, Max
+from django.utils.functional import SimpleLazyObject
+from divisas.cache import obtener_snapshot
+from clientes.models import AsignacionCliente
 
-def simulador_context(request):
-    """
-    Context processor que provee tasas, lista de divisas y descuentos por segmento.
-    Excluye la divisa Guaraní (PYG) del listado.
-    """
+
+def _segmento_usuario(request):
     segmento_usuario = ''  # Asignación por defecto
     if request.user.is_authenticated:
         try:
@@ -19,50 +15,46 @@ def simulador_context(request):
                 segmento_usuario = asignacion.cliente.segmento.name
         except AsignacionCliente.DoesNotExist:
             pass
+    return segmento_usuario
+
 
+def _datos_simulador(snapshot):
+    """
+    Construye la lista de divisas del simulador a partir de un snapshot de
+    cotizaciones. Se calcula una vez por versión del snapshot (ver
+    :meth:`divisas.cache.SnapshotCotizaciones.derivado`).
+    """
     # Obtener la lista de divisas activas para el frontend, excluyendo el Guaraní (código 116)
-    divisas_activas = Divisa.objects.filter(is_active=True).exclude(code='116')
+    divisas_activas = [d for d in snapshot.divisas if d.code != '116']
     divisas_list = [
-        {'code': d.code, 'nombre': d.nombre, 'simbolo': d.simbolo} 
+        {'code': d.code, 'nombre': d.nombre, 'simbolo': d.simbolo}
         for d in divisas_activas
     ]
-    
-    # Obtener las cotizaciones más recientes para cada segmento y divisa
-    tasas_data = {}
-    
-    # Primero obtener todos los segmentos
-    from clientes.models import Segmento
-    segmentos = Segmento.objects.all()
-    
-    for segmento in segmentos:
-        segmento_key = segmento.name.lower()
-        tasas_data[segmento_key] = {}
-        
-        for divisa in divisas_activas:  # Usar divisas_activas que ya excluye el Guaraní
-            # Obtener la última cotización para esta divisa y segmento
-            cotizacion = CotizacionSegmento.objects.filter(
-                divisa=divisa, 
-                segmento=segmento
-            ).order_by('-fecha').first()
-            
-            if cotizacion:
-                tasas_data[segmento_key][divisa.code] = {
-                    'valor_compra': float(cotizacion.valor_compra_unit),
-                    'valor_venta': float(cotizacion.valor_venta_unit),
-                    'precio_base': float(cotizacion.precio_base),
-                    'porcentaje_descuento': float(cotizacion.porcentaje_descuento),
-                    'comision_compra': float(cotizacion.comision_compra_ajustada),
-                    'comision_venta': float(cotizacion.comision_venta_ajustada)
-                }
-
-    # Convertir datos a JSON para inyectarlos en el HTML
-    tasas_data_json = json.dumps(tasas_data)
-    divisas_list_json = json.dumps(divisas_list)
 
     return {
-        'segmento_usuario': segmento_usuario,
-        'tasas_data': tasas_data,
         'divisas_list': divisas_list,
-        'tasas_data_json': tasas_data_json,
-        'divisas_list_json': divisas_list_json,
+        # JSON ya serializado para inyectarlo en el HTML
+        'divisas_list_json': json.dumps(divisas_list),
+    }
+
+
+def simulador_context(request):
+    """
+    Provee la lista de divisas y el segmento del usuario para el simulador.
+    Excluye la divisa Guaraní (PYG) del listado. Las cotizaciones no se
+    incrustan en la página: el simulador las pide a ``simulador:cotizaciones_json``
+    (sólo las del segmento del usuario, cacheables por el navegador).
+
+    Los valores son perezosos: no se consulta nada hasta que una plantilla
+    usa alguna de las variables, y el JSON se serializa una sola vez por
+    versión del snapshot de cotizaciones. No está registrado globalmente en
+    ``TEMPLATES``; las vistas que muestran el simulador lo agregan a su contexto.
+    """
+    def dato(clave):
+        return SimpleLazyObject(lambda: obtener_snapshot().derivado('simulador', _datos_simulador)[clave])
+
+    return {
+        'segmento_usuario': SimpleLazyObject(lambda: _segmento_usuario(request)),
+        'divisas_list': dato('divisas_list'),
+        'divisas_list_json': dato('divisas_list_json'),
     }
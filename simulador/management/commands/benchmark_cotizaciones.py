@@ -0,0 +1,284 @@
+# simulador/management/commands/benchmark_cotizaciones.py
+"""
+Prueba de carga local del camino de cotización.
+
+Siembra un conjunto sintético (divisas, segmentos, clientes e historial de
+tasas), ejecuta concurrentemente los escenarios contra las vistas reales con
+el cliente de pruebas de Django y reporta latencias p50/p95/p99, throughput y
+consultas por solicitud en JSON::
+
+    python manage.py benchmark_cotizaciones --solicitudes 500 --concurrencia 8 --salida bench.json
+
+Los datos sembrados usan el prefijo ``BM-`` y se borran al terminar salvo que
+se pase ``--conservar``. Escribe en la base configurada: sólo se ejecuta con
+``DEBUG`` activo o con ``--forzar``.
+"""
+import json
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+PREFIJO = 'BM-'
+ESCENARIOS = ('simulacion', 'formulario', 'transaccion')
+
+
+def _percentil(valores, p):
+    """Percentil por rango más cercano sobre valores ya ordenados."""
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, -(-p * len(valores) // 100) - 1))
+    return valores[indice]
+
+
+def _resumen(muestras, errores, duracion, concurrencia):
+    latencias = sorted(m[0] for m in muestras)
+    consultas = [m[1] for m in muestras]
+    total = len(muestras) + errores
+    return {
+        'solicitudes': total,
+        'errores': errores,
+        'concurrencia': concurrencia,
+        'duracion_s': round(duracion, 4),
+        'throughput_rps': round(total / duracion, 2) if duracion else None,
+        'latencia_ms': {
+            'p50': _percentil(latencias, 50),
+            'p95': _percentil(latencias, 95),
+            'p99': _percentil(latencias, 99),
+            'media': round(statistics.fmean(latencias), 3) if latencias else None,
+            'max': latencias[-1] if latencias else None,
+        },
+        'consultas_por_solicitud': {
+            'media': round(statistics.fmean(consultas), 2) if consultas else None,
+            'max': max(consultas) if consultas else None,
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Siembra datos sintéticos y mide latencia, throughput y consultas del camino de cotización.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--divisas', type=int, default=5, help='Divisas sintéticas.')
+        parser.add_argument('--segmentos', type=int, default=3, help='Segmentos sintéticos.')
+        parser.add_argument('--clientes', type=int, default=50, help='Clientes sintéticos.')
+        parser.add_argument('--historial', type=int, default=100, help='Tasas históricas por divisa.')
+        parser.add_argument('--solicitudes', type=int, default=200, help='Solicitudes por escenario.')
+        parser.add_argument('--concurrencia', type=int, default=4, help='Hilos concurrentes.')
+        parser.add_argument('--escenarios', default=','.join(ESCENARIOS),
+                            help=f'Escenarios separados por coma: {", ".join(ESCENARIOS)}.')
+        parser.add_argument('--semilla', type=int, default=1, help='Semilla aleatoria.')
+        parser.add_argument('--salida', help='Archivo donde escribir el JSON (además de stdout).')
+        parser.add_argument('--conservar', action='store_true', help='No borrar los datos sembrados.')
+        parser.add_argument('--forzar', action='store_true', help='Ejecutar aunque DEBUG esté desactivado.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forzar']:
+            raise CommandError('Escribe datos en la base configurada; use --forzar fuera de DEBUG.')
+        escenarios = [e.strip() for e in options['escenarios'].split(',') if e.strip()]
+        desconocidos = set(escenarios) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f'Escenarios desconocidos: {", ".join(sorted(desconocidos))}')
+        concurrencia = max(1, options['concurrencia'])
+
+        random.seed(options['semilla'])
+        propio_entorno = False
+        try:
+            # El cliente de pruebas necesita 'testserver' en ALLOWED_HOSTS.
+            setup_test_environment()
+            propio_entorno = True
+        except RuntimeError:
+            pass  # ya configurado (p. ej. dentro de la suite de tests)
+
+        datos = None
+        try:
+            inicio = time.perf_counter()
+            datos = self._sembrar(options, concurrencia)
+            reporte = {
+                'configuracion': {
+                    clave: options[clave]
+                    for clave in ('divisas', 'segmentos', 'clientes', 'historial', 'solicitudes', 'semilla')
+                } | {'concurrencia': concurrencia, 'motor': connection.vendor},
+                'siembra_s': round(time.perf_counter() - inicio, 4),
+                'escenarios': {
+                    escenario: self._ejecutar(escenario, datos, options['solicitudes'], concurrencia)
+                    for escenario in escenarios
+                },
+            }
+        finally:
+            if datos is not None and not options['conservar']:
+                self._limpiar()
+            if propio_entorno:
+                teardown_test_environment()
+
+        salida = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(salida)
+        self.stdout.write(salida)
+
+    # ------------------------------------------------------------------
+    # Datos sintéticos
+    # ------------------------------------------------------------------
+    def _sembrar(self, options, concurrencia):
+        from django.contrib.auth import get_user_model
+        from clientes.models import AsignacionCliente, Cliente, ClienteMedioDePago, Segmento
+        from divisas.models import Divisa, TasaCambio
+        from divisas.services import recalcular_cotizaciones_segmentos
+        from medios_pago.models import MedioDePago
+
+        self._limpiar()
+        Divisa.objects.get_or_create(code='PYG', defaults={'nombre': 'Guaraní', 'simbolo': '₲', 'decimales': 0})
+
+        segmentos = [Segmento.objects.create(name=f'{PREFIJO}segmento-{i}') for i in range(options['segmentos'])]
+        divisas = Divisa.objects.bulk_create([
+            Divisa(code=f'{PREFIJO}{i:03d}', nombre=f'Divisa sintética {i}', simbolo='¤', is_active=True, decimales=2)
+            for i in range(options['divisas'])
+        ])
+        TasaCambio.objects.bulk_create([
+            TasaCambio(
+                divisa=divisa,
+                precio_base=Decimal(random.randint(5000, 9000)),
+                comision_compra=Decimal(random.randint(50, 300)),
+                comision_venta=Decimal(random.randint(50, 300)),
+            )
+            for divisa in divisas
+            for _ in range(max(1, options['historial']))
+        ], batch_size=1000)
+        recalcular_cotizaciones_segmentos(segmentos)
+
+        clientes = Cliente.objects.bulk_create([
+            Cliente(
+                cedula=f'{PREFIJO}{i:08d}',
+                nombre_completo=f'Cliente sintético {i}',
+                segmento=segmentos[i % len(segmentos)] if segmentos else None,
+            )
+            for i in range(max(options['clientes'], concurrencia))
+        ])
+        medio = MedioDePago.objects.create(nombre=f'{PREFIJO}efectivo', comision_porcentaje=Decimal('1'))
+
+        # Un usuario por hilo, cada uno con un único cliente asignado.
+        User = get_user_model()
+        trabajadores = []
+        for i in range(concurrencia):
+            usuario = User.objects.create_user(
+                username=f'{PREFIJO.lower()}usuario-{i}', email=f'{PREFIJO.lower()}usuario-{i}@example.com', password=None,
+            )
+            AsignacionCliente.objects.create(usuario=usuario, cliente=clientes[i])
+            medio_cliente = ClienteMedioDePago.objects.create(cliente=clientes[i], medio_de_pago=medio)
+            trabajadores.append({'usuario': usuario, 'cliente': clientes[i], 'medio': medio_cliente})
+
+        return {'divisas': divisas, 'trabajadores': trabajadores}
+
+    def _limpiar(self):
+        from django.contrib.auth import get_user_model
+        from clientes.models import Cliente, Segmento
+        from divisas.models import CotizacionSegmento, Divisa
+        from medios_pago.models import MedioDePago
+        from transacciones.models import Transaccion
+
+        divisas = Divisa.objects.filter(code__startswith=PREFIJO)
+        Transaccion.objects.filter(cliente__cedula__startswith=PREFIJO).delete()
+        CotizacionSegmento.objects.filter(divisa__in=divisas).delete()
+        CotizacionSegmento.objects.filter(segmento__name__startswith=PREFIJO).delete()
+        divisas.delete()
+        Cliente.objects.filter(cedula__startswith=PREFIJO).delete()
+        Segmento.objects.filter(name__startswith=PREFIJO).delete()
+        MedioDePago.objects.filter(nombre__startswith=PREFIJO).delete()
+        get_user_model().objects.filter(username__startswith=PREFIJO.lower()).delete()
+
+    # ------------------------------------------------------------------
+    # Escenarios
+    # ------------------------------------------------------------------
+    def _preparar_cliente(self, trabajador):
+        cliente_http = Client()
+        cliente_http.force_login(trabajador['usuario'])
+        sesion = cliente_http.session
+        sesion['cliente_id'] = trabajador['cliente'].id
+        sesion['cliente_activo_id'] = trabajador['cliente'].id
+        sesion.save()
+        return cliente_http
+
+    def _solicitud(self, escenario, cliente_http, trabajador, divisas):
+        """
+        Ejecuta los pasos previos (no medidos) y devuelve un callable con la
+        solicitud medida y el código de estado esperado.
+        """
+        divisa = random.choice(divisas)
+        if escenario == 'simulacion':
+            cuerpo = json.dumps({
+                'tipo_operacion': random.choice(('compra', 'venta')),
+                'monto': str(random.randint(1, 10000)),
+                'moneda': divisa.code,
+            })
+            return (lambda: cliente_http.post(reverse('simulador:calcular_simulacion_api'),
+                                              data=cuerpo, content_type='application/json')), 200
+        if escenario == 'formulario':
+            datos = {'divisa': divisa.id, 'monto': str(random.randint(1, 1000))}
+            return (lambda: cliente_http.post(reverse('divisas:venta'), datos)), 302
+
+        # transaccion: simular y confirmar (no medido), luego crear la transacción
+        cliente_http.post(reverse('divisas:venta'), {'divisa': divisa.id, 'monto': str(random.randint(1, 1000))})
+        cliente_http.post(reverse('divisas:venta_confirmacion'))
+        sesion = cliente_http.session
+        sesion['medio_seleccionado'] = {
+            'id': trabajador['medio'].id,
+            'nombre': trabajador['medio'].medio_de_pago.nombre,
+            'comision': str(trabajador['medio'].medio_de_pago.comision_porcentaje),
+        }
+        sesion.save()
+        return (lambda: cliente_http.post(reverse('transacciones:crear_desde_venta'))), 302
+
+    def _trabajar(self, escenario, trabajador, divisas, cantidad, muestras, errores, lock):
+        propias, fallidas = [], 0
+        try:
+            cliente_http = self._preparar_cliente(trabajador)
+            conexion = connections['default']
+            for _ in range(cantidad):
+                enviar, esperado = self._solicitud(escenario, cliente_http, trabajador, divisas)
+                with CaptureQueriesContext(conexion) as consultas:
+                    inicio = time.perf_counter()
+                    respuesta = enviar()
+                    latencia = (time.perf_counter() - inicio) * 1000
+                if respuesta.status_code != esperado or (
+                        escenario == 'transaccion'
+                        and 'confirmacion' not in respuesta.get('Location', '')):
+                    fallidas += 1
+                    continue
+                propias.append((round(latencia, 3), len(consultas.captured_queries)))
+        finally:
+            with lock:
+                muestras.extend(propias)
+                errores.append(fallidas)
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    def _ejecutar(self, escenario, datos, solicitudes, concurrencia):
+        muestras, errores, lock = [], [], threading.Lock()
+        por_hilo = [solicitudes // concurrencia + (1 if i < solicitudes % concurrencia else 0)
+                    for i in range(concurrencia)]
+        argumentos = [
+            (escenario, trabajador, datos['divisas'], cantidad, muestras, errores, lock)
+            for trabajador, cantidad in zip(datos['trabajadores'], por_hilo)
+        ]
+
+        inicio = time.perf_counter()
+        if concurrencia == 1:
+            self._trabajar(*argumentos[0])
+        else:
+            hilos = [threading.Thread(target=self._trabajar, args=args) for args in argumentos]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        return _resumen(muestras, sum(errores), duracion, concurrencia)
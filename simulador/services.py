@@ -0,0 +1,570 @@
+# simulador/services.py
+"""
+Servicio de cotización del simulador.
+
+Calcula el resultado de una operación de compra/venta de divisas a partir de
+una :class:`SolicitudSimulacion` tipada, sin pasar por HTTP ni JSON. Lo usan
+tanto la API del simulador como las vistas de compra y venta.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, asdict, field
+from decimal import Decimal, ROUND_CEILING
+
+from casa_de_cambios.telemetria import contar, medir
+from divisas.cache import obtener_snapshot
+from divisas.models import CotizacionSegmento, Divisa
+from divisas.tokens import firmar_cotizacion
+
+from .cache import cache_resultados
+
+TIPOS_OPERACION = ('compra', 'venta')
+
+
+class SimulacionError(Exception):
+    """
+    Error de negocio al simular una operación.
+
+    :param mensaje: Mensaje para el usuario.
+    :type mensaje: str
+    :param status: Código HTTP sugerido para la API.
+    :type status: int
+    """
+
+    def __init__(self, mensaje, status=400):
+        super().__init__(mensaje)
+        self.status = status
+
+
+@dataclass(frozen=True)
+class SolicitudSimulacion:
+    """
+    Datos de entrada de una simulación.
+
+    :param tipo_operacion: ``'compra'`` (el cliente compra divisa con Gs) o ``'venta'``.
+    :type tipo_operacion: str
+    :param monto: En compra, guaraníes; en venta, unidades de la divisa.
+    :type monto: Decimal
+    :param moneda: Código de la divisa extranjera.
+    :type moneda: str
+    """
+    tipo_operacion: str
+    monto: Decimal
+    moneda: str
+
+
+@dataclass(frozen=True)
+class ResultadoSimulacion:
+    """
+    Resultado de una simulación. Los nombres coinciden con las claves que
+    devuelve la API del simulador.
+    """
+    segmento: str
+    monto_original: Decimal
+    monto_resultado: Decimal
+    tasa_aplicada: Decimal
+    comision_aplicada: Decimal
+    porcentaje_descuento: Decimal
+    moneda_code: str
+    moneda_simbolo: str
+    moneda_nombre: str
+    token_cotizacion: str
+    cotizacion: CotizacionSegmento = field(repr=False, compare=False, default=None)
+
+    def como_dict(self):
+        """
+        Representación serializable (sin la instancia de cotización).
+
+        :rtype: dict
+        """
+        datos = asdict(self)
+        datos.pop('cotizacion')
+        return datos
+
+
+def cotizaciones_para(codigos, segmento):
+    """
+    Cotizaciones vigentes de varias divisas para un segmento, en una consulta.
+
+    Si el segmento no tiene cotización para una divisa se usa la más reciente
+    de cualquier segmento.
+
+    :param codigos: Códigos de divisa.
+    :type codigos: set
+    :param segmento: Segmento del cliente.
+    :type segmento: clientes.models.Segmento
+    :return: ``{codigo: CotizacionSegmento}`` sólo para divisas activas con cotización.
+    :rtype: dict
+    """
+    cotizaciones = {}
+    vigentes = (CotizacionSegmento.objects.vigentes()
+                .filter(divisa__code__in=codigos, divisa__is_active=True)
+                .select_related('divisa')
+                .order_by('fecha'))
+    for cot in vigentes:
+        actual = cotizaciones.get(cot.divisa.code)
+        if actual is None or actual.segmento_id != segmento.id:
+            cotizaciones[cot.divisa.code] = cot
+    return cotizaciones
+
+
+def _validar(solicitud):
+    if solicitud.tipo_operacion not in TIPOS_OPERACION:
+        raise SimulacionError('Tipo de operación inválido.')
+    monto = solicitud.monto
+    if not isinstance(monto, Decimal) or not monto.is_finite() or monto <= 0:
+        raise SimulacionError('El monto debe ser un número mayor a cero.')
+    # Restricción: No permitir operaciones con Guaraní
+    if solicitud.moneda == 'PYG':
+        raise SimulacionError('No se permiten operaciones con Guaraní (PYG) en el simulador.')
+
+
+def aplicar_cotizacion(solicitud, cotizacion, segmento):
+    """
+    Aplica una cotización ya obtenida a una solicitud.
+
+    :raises SimulacionError: Si la solicitud no es válida.
+    :rtype: ResultadoSimulacion
+    """
+    _validar(solicitud)
+    monto = solicitud.monto
+    if solicitud.tipo_operacion == 'compra':  # Cliente compra divisa (negocio vende)
+        tasa_aplicada = cotizacion.valor_venta_unit
+        resultado = monto / tasa_aplicada  # Monto en Gs → Divisa extranjera
+        comision_aplicada = cotizacion.comision_venta_ajustada
+    else:  # venta - Cliente vende divisa (negocio compra)
+        tasa_aplicada = cotizacion.valor_compra_unit
+        resultado = monto * tasa_aplicada  # Divisa extranjera → Gs
+        comision_aplicada = cotizacion.comision_compra_ajustada
+
+    return ResultadoSimulacion(
+        segmento=segmento.name,
+        monto_original=monto,
+        monto_resultado=resultado,
+        tasa_aplicada=tasa_aplicada,
+        comision_aplicada=comision_aplicada,
+        porcentaje_descuento=cotizacion.porcentaje_descuento,
+        moneda_code=solicitud.moneda,
+        moneda_simbolo=cotizacion.divisa.simbolo,
+        moneda_nombre=cotizacion.divisa.nombre,
+        token_cotizacion=firmar_cotizacion(cotizacion, solicitud.tipo_operacion, tasa_aplicada),
+        cotizacion=cotizacion,
+    )
+
+
+def calcular_simulacion(solicitud, segmento):
+    """
+    Calcula una simulación con la cotización vigente de la divisa para el
+    segmento (o, si no hay, la más reciente de cualquier segmento).
+
+    Los resultados se memoizan por época de cotizaciones (ver
+    :mod:`simulador.cache`): la misma solicitud para el mismo segmento no
+    vuelve a consultar la base hasta que se publique una cotización nueva o
+    venza la entrada.
+
+    :param solicitud: Datos de la operación.
+    :type solicitud: SolicitudSimulacion
+    :param segmento: Segmento del cliente (ver :func:`clientes.services.resolver_segmento`).
+    :type segmento: clientes.models.Segmento
+    :raises SimulacionError: Solicitud inválida (400), divisa inexistente o
+        inactiva, o sin cotizaciones (404).
+    :rtype: ResultadoSimulacion
+    """
+    _validar(solicitud)
+
+    cache = cache_resultados()
+    epoca = obtener_snapshot().epoca
+    # str(monto) y no el Decimal: 10 y 10.0 son iguales pero se devuelven distinto.
+    clave = (segmento.id, solicitud.moneda, solicitud.tipo_operacion, str(solicitud.monto))
+    resultado = cache.obtener(epoca, clave)
+    if resultado is not None:
+        contar('simulacion.cache', resultado='acierto')
+        return resultado
+    contar('simulacion.cache', resultado='fallo')
+
+    with medir('simulacion.cotizacion'):
+        cotizacion = cotizaciones_para({solicitud.moneda}, segmento).get(solicitud.moneda)
+    if cotizacion is None:
+        if not Divisa.objects.filter(code=solicitud.moneda, is_active=True).exists():
+            raise SimulacionError(f'Divisa {solicitud.moneda} no encontrada o no activa.', status=404)
+        raise SimulacionError(f'No hay cotizaciones disponibles para la divisa {solicitud.moneda}.', status=404)
+    with medir('simulacion.calculo', tipo=solicitud.tipo_operacion):
+        resultado = aplicar_cotizacion(solicitud, cotizacion, segmento)
+    cache.guardar(epoca, clave, resultado)
+    return resultado
+
+
+def reservar_cotizacion(solicitud, resultado, usuario=None):
+    """
+    Bloquea la tasa de un resultado durante ``COTIZACION_RESERVA_SEGUNDOS``
+    (ver :class:`transacciones.models.ReservaCotizacion`). La transacción que
+    se cree con esa reserva usa la tasa reservada aunque se publique una
+    nueva; la publicación sólo expira las reservas todavía no usadas.
+
+    :param solicitud: Solicitud simulada.
+    :type solicitud: SolicitudSimulacion
+    :param resultado: Resultado de :func:`calcular_simulacion`.
+    :type resultado: ResultadoSimulacion
+    :rtype: transacciones.models.ReservaCotizacion
+    """
+    from transacciones.models import ReservaCotizacion
+
+    return ReservaCotizacion.reservar(
+        resultado.cotizacion, solicitud.tipo_operacion, resultado.tasa_aplicada, usuario=usuario,
+    )
+
+
+# ------------------------------------------------------------------
+# Cotización inversa: monto a pagar para recibir un monto objetivo
+# ------------------------------------------------------------------
+DECIMALES_GUARANI = 0
+
+
+@dataclass(frozen=True)
+class CotizacionInversa:
+    """
+    Monto a pagar con un medio de pago para recibir un monto objetivo.
+
+    ``monto_base`` es lo que habría que pagar sin la comisión del medio y
+    ``comision_monto`` la diferencia; ambos en ``moneda_pago`` y redondeados
+    hacia arriba a sus decimales, de modo que pagar ``monto_a_pagar`` nunca
+    deja al cliente por debajo del objetivo.
+    """
+    medio_id: int
+    medio_nombre: str
+    comision_porcentaje: Decimal
+    monto_objetivo: Decimal
+    monto_base: Decimal
+    comision_monto: Decimal
+    monto_a_pagar: Decimal
+    moneda_pago: str
+    tasa_aplicada: Decimal
+
+    def como_dict(self):
+        """
+        Representación serializable.
+
+        :rtype: dict
+        """
+        return asdict(self)
+
+
+def _techo(valor, decimales):
+    return valor.quantize(Decimal(1).scaleb(-decimales), rounding=ROUND_CEILING)
+
+
+def _decimales_guarani(snapshot):
+    guarani = next((d for d in snapshot.divisas if d.code == 'PYG'), None)
+    return guarani.decimales if guarani is not None else DECIMALES_GUARANI
+
+
+def cotizar_inverso(solicitud, segmento, medios=()):
+    """
+    Para un monto objetivo a recibir, calcula el monto exacto a pagar con
+    cada medio de pago, combinando la cotización del segmento, los decimales
+    de la moneda de pago y la ``comision_porcentaje`` del medio.
+
+    - ``compra``: el objetivo son unidades de la divisa; se paga en
+      guaraníes ``objetivo × valor_venta × (1 + comisión)``.
+    - ``venta``: el objetivo son guaraníes a acreditar, netos de la comisión
+      del medio; se paga en la divisa ``objetivo / (valor_compra × (1 − comisión))``.
+
+    La cotización se obtiene una sola vez para todos los medios. Los medios
+    con comisión de 100% en venta se omiten (no hay monto que alcance).
+
+    :param solicitud: Operación; ``monto`` es el monto objetivo a recibir.
+    :type solicitud: SolicitudSimulacion
+    :param segmento: Segmento del cliente.
+    :type segmento: clientes.models.Segmento
+    :param medios: ``ClienteMedioDePago`` (con ``medio_de_pago`` cargado) o
+        ``MedioDePago``. Si se omite, se devuelve sólo la opción sin comisión.
+    :type medios: list
+    :raises SimulacionError: Igual que :func:`calcular_simulacion`.
+    :return: Una :class:`CotizacionInversa` por medio, en el mismo orden.
+    :rtype: list
+    """
+    _validar(solicitud)
+    cotizacion = cotizaciones_para({solicitud.moneda}, segmento).get(solicitud.moneda)
+    if cotizacion is None:
+        raise SimulacionError(f'No hay cotizaciones disponibles para la divisa {solicitud.moneda}.', status=404)
+
+    objetivo = solicitud.monto
+    if solicitud.tipo_operacion == 'compra':  # Cliente paga Gs para recibir divisa
+        tasa = cotizacion.valor_venta_unit
+        moneda_pago = 'PYG'
+        decimales = _decimales_guarani(obtener_snapshot())
+        bruto = objetivo * tasa
+    else:  # venta - Cliente paga divisa para recibir Gs
+        tasa = cotizacion.valor_compra_unit
+        moneda_pago = solicitud.moneda
+        decimales = cotizacion.divisa.decimales
+        bruto = objetivo / tasa
+    monto_base = _techo(bruto, decimales)
+
+    opciones = [(None, '', Decimal('0'))]
+    if medios:
+        opciones = []
+        for medio in medios:
+            medio_de_pago = getattr(medio, 'medio_de_pago', medio)
+            opciones.append((medio.pk, medio_de_pago.nombre, medio_de_pago.comision_porcentaje))
+
+    resultados = []
+    for medio_id, nombre, porcentaje in opciones:
+        comision = porcentaje / 100
+        if solicitud.tipo_operacion == 'compra':
+            total = _techo(bruto * (1 + comision), decimales)
+        else:
+            if comision >= 1:
+                continue
+            total = _techo(bruto / (1 - comision), decimales)
+        resultados.append(CotizacionInversa(
+            medio_id=medio_id,
+            medio_nombre=nombre,
+            comision_porcentaje=porcentaje,
+            monto_objetivo=objetivo,
+            monto_base=monto_base,
+            comision_monto=total - monto_base,
+            monto_a_pagar=total,
+            moneda_pago=moneda_pago,
+            tasa_aplicada=tasa,
+        ))
+    return resultados
+
+
+# ------------------------------------------------------------------
+# Cotización cruzada entre divisas usando el guaraní como pivote
+# ------------------------------------------------------------------
+GUARANI = 'PYG'
+
+
+@dataclass(frozen=True)
+class TramoCruce:
+    """
+    Un tramo de una conversión cruzada, siempre contra guaraníes.
+
+    :param tipo_operacion: ``'venta'`` (el cliente entrega la divisa y recibe
+        Gs) o ``'compra'`` (entrega Gs y recibe la divisa).
+    """
+    tipo_operacion: str
+    moneda: str
+    monto_entrada: Decimal
+    monto_salida: Decimal
+    tasa_aplicada: Decimal
+
+
+@dataclass(frozen=True)
+class ResultadoCruce:
+    """
+    Resultado de convertir ``monto_original`` de la primera moneda de la ruta
+    a la última. ``tasa_cruzada`` es unidades de destino por unidad de origen.
+    """
+    segmento: str
+    ruta: tuple
+    monto_original: Decimal
+    monto_resultado: Decimal
+    tasa_cruzada: Decimal
+    tramos: tuple
+
+    def como_dict(self):
+        """
+        Representación serializable.
+
+        :rtype: dict
+        """
+        datos = asdict(self)
+        datos['ruta'] = list(self.ruta)
+        datos['tramos'] = list(datos['tramos'])
+        return datos
+
+
+class MatrizCruzada:
+    """
+    Tasas cruzadas de un segmento: para cada par de monedas (incluido el
+    guaraní) cuántas unidades de destino se obtienen por unidad de origen,
+    vendiendo el origen al valor de compra de la casa y comprando el destino
+    a su valor de venta.
+
+    :param cotizaciones: ``{codigo: CotizacionSegmento}`` del segmento.
+    :type cotizaciones: dict
+    """
+
+    def __init__(self, cotizaciones):
+        self.cotizaciones = cotizaciones
+        # Gs obtenidos por unidad vendida y Gs necesarios por unidad comprada
+        self._a_guarani = {GUARANI: Decimal(1)}
+        self._desde_guarani = {GUARANI: Decimal(1)}
+        for code, cot in cotizaciones.items():
+            self._a_guarani[code] = cot.valor_compra_unit
+            self._desde_guarani[code] = cot.valor_venta_unit
+        self.tasas = {
+            (origen, destino): self._a_guarani[origen] / self._desde_guarani[destino]
+            for origen in self._a_guarani
+            for destino in self._desde_guarani
+            if origen != destino
+        }
+
+    @property
+    def monedas(self):
+        """Códigos con cotización, incluido el guaraní, ordenados."""
+        return sorted(self._a_guarani)
+
+    def tasa(self, origen, destino):
+        """
+        Unidades de ``destino`` por unidad de ``origen``.
+
+        :raises SimulacionError: Si alguna moneda no tiene cotización (404).
+        :rtype: Decimal
+        """
+        if origen == destino:
+            return Decimal(1)
+        try:
+            return self.tasas[(origen, destino)]
+        except KeyError:
+            faltante = origen if origen not in self._a_guarani else destino
+            raise SimulacionError(f'No hay cotizaciones disponibles para la divisa {faltante}.', status=404)
+
+    def tramos(self, origen, destino, monto):
+        """
+        Descompone la conversión ``origen → destino`` en sus tramos contra
+        guaraníes (uno si alguna de las dos es el guaraní, dos si no).
+
+        :rtype: list
+        """
+        self.tasa(origen, destino)  # valida ambas monedas
+        tramos = []
+        if origen != GUARANI:
+            tasa = self._a_guarani[origen]
+            guaranies = monto * tasa
+            tramos.append(TramoCruce('venta', origen, monto, guaranies, tasa))
+            monto = guaranies
+        if destino != GUARANI:
+            tasa = self._desde_guarani[destino]
+            tramos.append(TramoCruce('compra', destino, monto, monto / tasa, tasa))
+        return tramos
+
+
+def matriz_cruzada(segmento):
+    """
+    Matriz de tasas cruzadas del segmento a partir de las cotizaciones
+    vigentes. Se construye una vez por segmento y versión del snapshot (es
+    decir, por época de cotizaciones) y no consulta la base.
+
+    :param segmento: Segmento del cliente.
+    :type segmento: clientes.models.Segmento
+    :rtype: MatrizCruzada
+    """
+    def construir(snapshot):
+        cotizaciones = {}
+        for divisa in snapshot.divisas:
+            if divisa.code in (GUARANI, '116'):
+                continue
+            cot = _cotizacion_feed(snapshot, segmento.id, divisa.code)
+            if cot is not None:
+                cotizaciones[divisa.code] = cot
+        return MatrizCruzada(cotizaciones)
+
+    return obtener_snapshot().derivado(f'cruces:{segmento.id}', construir)
+
+
+def cotizar_cruce(ruta, monto, segmento):
+    """
+    Convierte ``monto`` a lo largo de ``ruta`` (p. ej. ``['USD', 'EUR']`` o
+    ``['USD', 'EUR', 'BRL']``) en una sola llamada. Cada salto pasa por el
+    guaraní con las cotizaciones del segmento; el resultado incluye todos los
+    tramos contra guaraníes que habría que liquidar.
+
+    :param ruta: Códigos de moneda, al menos dos, sin saltos a la misma moneda.
+    :type ruta: list
+    :param monto: Monto en la primera moneda de la ruta.
+    :type monto: Decimal
+    :param segmento: Segmento del cliente.
+    :type segmento: clientes.models.Segmento
+    :raises SimulacionError: Ruta o monto inválidos (400) o moneda sin cotización (404).
+    :rtype: ResultadoCruce
+    """
+    ruta = tuple(ruta or ())
+    if len(ruta) < 2 or not all(isinstance(code, str) and code for code in ruta):
+        raise SimulacionError('La ruta debe tener al menos dos monedas.')
+    if any(origen == destino for origen, destino in zip(ruta, ruta[1:])):
+        raise SimulacionError('La ruta no puede convertir una moneda en sí misma.')
+    if not isinstance(monto, Decimal) or not monto.is_finite() or monto <= 0:
+        raise SimulacionError('El monto debe ser un número mayor a cero.')
+
+    matriz = matriz_cruzada(segmento)
+    tramos = []
+    resultado = monto
+    for origen, destino in zip(ruta, ruta[1:]):
+        salto = matriz.tramos(origen, destino, resultado)
+        tramos.extend(salto)
+        resultado = salto[-1].monto_salida
+
+    return ResultadoCruce(
+        segmento=segmento.name,
+        ruta=ruta,
+        monto_original=monto,
+        monto_resultado=resultado,
+        tasa_cruzada=resultado / monto,
+        tramos=tuple(tramos),
+    )
+
+
+# ------------------------------------------------------------------
+# Feed compacto de cotizaciones para simular en el navegador
+# ------------------------------------------------------------------
+def _numero(valor):
+    # Decimal sin ceros de relleno ni notación científica: '7100', '0.5'
+    return format(valor.normalize(), 'f')
+
+
+def _cotizacion_feed(snapshot, segmento_id, code):
+    cotizacion = snapshot.cotizacion(segmento_id, code)
+    if cotizacion is None:
+        # Igual que cotizaciones_para: la más reciente de cualquier segmento
+        otras = [c for c in (snapshot.cotizacion(seg, code) for seg in snapshot.cotizaciones) if c]
+        cotizacion = max(otras, key=lambda c: (c.fecha, c.pk), default=None)
+    return cotizacion
+
+
+def _construir_feed(snapshot, segmento):
+    cotizaciones = {}
+    for divisa in snapshot.divisas:
+        if divisa.code in ('PYG', '116'):
+            continue
+        cot = _cotizacion_feed(snapshot, segmento.id, divisa.code)
+        if cot is None:
+            continue
+        cotizaciones[divisa.code] = {
+            'n': divisa.nombre,
+            's': divisa.simbolo,
+            'c': _numero(cot.valor_compra_unit),
+            'v': _numero(cot.valor_venta_unit),
+            'cc': _numero(cot.comision_compra_ajustada),
+            'cv': _numero(cot.comision_venta_ajustada),
+            'd': _numero(cot.porcentaje_descuento),
+        }
+    cuerpo = json.dumps(
+        {'e': snapshot.epoca, 'g': segmento.name, 'q': cotizaciones},
+        ensure_ascii=False, separators=(',', ':'), sort_keys=True,
+    ).encode('utf-8')
+    return hashlib.sha256(cuerpo).hexdigest()[:32], cuerpo
+
+
+def feed_cotizaciones(segmento):
+    """
+    Cotizaciones vigentes de un segmento en forma compacta, para que el
+    simulador calcule en el navegador con la misma regla que
+    :func:`aplicar_cotizacion`.
+
+    El cuerpo es ``{"e": época, "g": segmento, "q": {codigo: {...}}}`` donde
+    cada divisa trae ``n`` (nombre), ``s`` (símbolo), ``c``/``v`` (valor de
+    compra/venta unitario), ``cc``/``cv`` (comisiones ajustadas) y ``d``
+    (porcentaje de descuento), con los importes como texto decimal exacto.
+    Se serializa una vez por segmento y versión del snapshot.
+
+    :param segmento: Segmento del cliente.
+    :type segmento: clientes.models.Segmento
+    :return: ``(etag, cuerpo)``; el etag cambia si y sólo si cambia el cuerpo.
+    :rtype: tuple
+    """
+    snapshot = obtener_snapshot()
+    return snapshot.derivado(f'feed:{segmento.id}', lambda snap: _construir_feed(snap, segmento))
@@ -0,0 +1,27 @@
+#simulador
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from clientes.models import Segmento
+from divisas.models import CotizacionSegmento, Divisa
+from divisas.signals import cotizaciones_publicadas
+from .cache import vaciar_resultados
+
+
+@receiver(post_save, sender=CotizacionSegmento)
+@receiver(post_save, sender=Divisa)
+@receiver(post_save, sender=Segmento)
+@receiver(post_delete, sender=CotizacionSegmento)
+@receiver(post_delete, sender=Divisa)
+@receiver(post_delete, sender=Segmento)
+@receiver(cotizaciones_publicadas)
+def vaciar_resultados_simulacion(sender, **kwargs):
+    """
+    Descarta los resultados memoizados cuando cambia una cotización, una
+    divisa o un segmento. El cambio de época ya los invalida; esto lo hace
+    inmediato en el proceso aunque la época coincida (p. ej. ids reutilizados
+    tras un rollback) y cubre cambios de nombre o símbolo.
+    """
+    vaciar_resultados()
+    transaction.on_commit(vaciar_resultados)
@@ -122,6 +122,36 @@ class SimuladorViewTest(SimuladorBaseTestCase):
         
         print(f"Segmento detectado: {response.context['segmento_usuario']}")
 
+    def test_contexto_perezoso_sin_consultas(self):
+        """Test: El contexto del simulador no consulta hasta que se usa"""
+        print("Probando evaluación perezosa del contexto...")
+        from django.test import RequestFactory
+        from simulador.context_processors import simulador_context
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            contexto = simulador_context(request)
+
+        self.assertEqual(contexto['segmento_usuario'], 'Minorista')
+        divisas = json.loads(str(contexto['divisas_list_json']))
+        self.assertIn('USD', [d['code'] for d in divisas])
+        self.assertNotIn('tasas_data_json', contexto,
+                         "❌ Las cotizaciones no deberían incrustarse en la página")
+
+        print(f"Divisas serializadas: {[d['code'] for d in divisas]}")
+
+    def test_paginas_sin_simulador_no_reciben_contexto(self):
+        """Test: Páginas que no muestran el simulador no cargan su contexto"""
+        print("Probando alcance del contexto...")
+
+        response = self.client.get(reverse('contacto'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('divisas_list_json', response.context)
+
+        print(f"Acceso a contacto: status {response.status_code}")
+
 
 class SimuladorCalculoTest(SimuladorBaseTestCase):
     """Tests para los cálculos de conversión de divisas"""
@@ -560,6 +590,733 @@ class SimuladorBusinessLogicTest(SimuladorBaseTestCase):
         print("Precisión decimal mantenida")
 
 
+
+class SimuladorLoteTest(SimuladorBaseTestCase):
+    """Tests para la API de simulación por lote"""
+
+    def _post(self, lineas):
+        return self.client.post(
+            reverse('simulador:calcular_simulacion_lote_api'),
+            data=json.dumps({'lineas': lineas}),
+            content_type='application/json'
+        )
+
+    def test_lote_resultados_y_errores_por_linea(self):
+        """Test: Cada línea devuelve su resultado o su error"""
+        print("Probando lote con líneas válidas e inválidas...")
+
+        self.client.force_login(self.user)
+        response = self._post([
+            {'tipo_operacion': 'compra', 'monto': '7100', 'moneda': 'USD'},
+            {'tipo_operacion': 'venta', 'monto': '10', 'moneda': 'USD'},
+            {'tipo_operacion': 'compra', 'monto': '-5', 'moneda': 'USD'},
+            {'tipo_operacion': 'compra', 'monto': '100', 'moneda': 'PYG'},
+            {'tipo_operacion': 'compra', 'monto': '100', 'moneda': 'EUR'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(response.content)
+        resultados = content['resultados']
+        self.assertEqual(content['segmento'], 'Minorista')
+        self.assertEqual([r['success'] for r in resultados], [True, True, False, False, False])
+        self.assertEqual(Decimal(resultados[0]['monto_resultado']), Decimal('1'))
+        self.assertEqual(Decimal(resultados[1]['monto_resultado']), Decimal('67000'))
+
+        print(f"Resultados: {[(r['indice'], r['success']) for r in resultados]}")
+
+    def test_lote_moneda_mal_formada(self):
+        """Test: Una moneda que no es texto es un error de su línea, no un 500"""
+        print("Probando lote con monedas mal formadas...")
+
+        response = self._post([
+            {'tipo_operacion': 'compra', 'monto': '7100', 'moneda': ['USD']},
+            {'tipo_operacion': 'compra', 'monto': '7100', 'moneda': {'code': 'USD'}},
+            'USD',
+            {'tipo_operacion': 'compra', 'monto': '7100', 'moneda': 'USD'},
+        ])
+
+        self.assertEqual(response.status_code, 200, "❌ Una moneda mal formada no debe romper el lote")
+        resultados = json.loads(response.content)['resultados']
+        self.assertEqual([r['success'] for r in resultados], [False, False, False, True])
+        self.assertEqual(resultados[0]['error'], 'Debe indicar el código de la moneda.')
+
+        unica = self.client.post(
+            reverse('simulador:calcular_simulacion_api'),
+            data=json.dumps({'tipo_operacion': 'compra', 'monto': '7100', 'moneda': ['USD']}),
+            content_type='application/json',
+        )
+        self.assertEqual(unica.status_code, 400, "❌ La API de una línea debe rechazar la moneda con 400")
+
+        print(f"Resultados: {[(r['indice'], r['success']) for r in resultados]}")
+
+    def test_lote_consultas_constantes(self):
+        """Test: La cantidad de consultas no depende de la cantidad de líneas"""
+        print("Probando consultas del lote...")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_login(self.user)
+        linea = {'tipo_operacion': 'compra', 'monto': '7100', 'moneda': 'USD'}
+        self._post([linea])  # construye el snapshot de cotizaciones
+        with CaptureQueriesContext(connection) as chico:
+            self._post([linea])
+        con_una = len(chico.captured_queries)
+        with CaptureQueriesContext(connection) as grande:
+            self._post([linea] * 500)
+        con_quinientas = len(grande.captured_queries)
+
+        self.assertEqual(con_una, con_quinientas)
+        self.assertEqual(self._post([linea] * 5001).status_code, 400)
+
+        print(f"Consultas con 1 línea: {con_una}, con 500: {con_quinientas}")
+
+
+class SimuladorServiceTest(SimuladorBaseTestCase):
+    """Tests para el servicio de cotización tipado"""
+
+    def test_calcular_simulacion_tipado(self):
+        """Test: El servicio devuelve un resultado con Decimals"""
+        print("Probando servicio de simulación...")
+        from simulador.services import SolicitudSimulacion, calcular_simulacion
+
+        resultado = calcular_simulacion(
+            SolicitudSimulacion(tipo_operacion='venta', monto=Decimal('10'), moneda='USD'),
+            self.segmento_minorista,
+        )
+
+        self.assertEqual(resultado.monto_resultado, Decimal('67000'))
+        self.assertEqual(resultado.tasa_aplicada, Decimal('6700.00000000'))
+        self.assertEqual(resultado.segmento, 'Minorista')
+        self.assertNotIn('cotizacion', resultado.como_dict())
+
+        print(f"Resultado: {resultado.monto_resultado} PYG")
+
+    def test_errores_de_negocio(self):
+        """Test: Errores de negocio con su código HTTP"""
+        print("Probando errores del servicio...")
+        from simulador.services import SolicitudSimulacion, SimulacionError, calcular_simulacion
+
+        casos = [
+            (SolicitudSimulacion('compra', Decimal('100'), 'PYG'), 400),
+            (SolicitudSimulacion('compra', Decimal('0'), 'USD'), 400),
+            (SolicitudSimulacion('transferencia', Decimal('100'), 'USD'), 400),
+            (SolicitudSimulacion('compra', Decimal('100'), 'XYZ'), 404),
+        ]
+        for solicitud, status in casos:
+            with self.assertRaises(SimulacionError) as ctx:
+                calcular_simulacion(solicitud, self.segmento_minorista)
+            self.assertEqual(ctx.exception.status, status)
+
+        print(f"Casos verificados: {len(casos)}")
+
+    def test_venta_desde_formulario_sin_api(self):
+        """Test: La vista de venta usa el servicio y guarda el resultado en sesión"""
+        print("Probando vista de venta...")
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('divisas:venta'), {'divisa': self.divisa_usd.id, 'monto': '10'})
+
+        self.assertEqual(response.status_code, 302)
+        resultado = self.client.session['venta_resultado']
+        self.assertEqual(Decimal(resultado['monto_resultado']), Decimal('67000'))
+        self.assertTrue(resultado['token_cotizacion'])
+        self.assertTrue(resultado['reserva_id'], "❌ La simulación debería reservar la tasa")
+
+        print(f"Resultado en sesión: {resultado['monto_resultado']}")
+
+    def test_api_reserva_solo_autenticado(self):
+        """Test: La API pública sólo reserva tasas para usuarios autenticados"""
+        print("Probando reserva desde la API...")
+        from transacciones.models import ReservaCotizacion
+
+        def reservar():
+            return self.client.post(
+                reverse('simulador:calcular_simulacion_api'),
+                data=json.dumps({'tipo_operacion': 'venta', 'monto': '10', 'moneda': 'USD', 'reservar': True}),
+                content_type='application/json'
+            )
+
+        anonima = reservar()
+        self.assertEqual(anonima.status_code, 403, "❌ Un anónimo no debería poder reservar")
+        self.assertFalse(ReservaCotizacion.objects.exists(), "❌ Se creó una reserva anónima")
+
+        self.client.force_login(self.user)
+        autenticada = reservar()
+        self.assertEqual(autenticada.status_code, 200)
+        reserva = ReservaCotizacion.objects.get(pk=json.loads(autenticada.content)['reserva_id'])
+        self.assertEqual(reserva.usuario, self.user)
+
+        print(f"Anónimo: {anonima.status_code}, autenticado: {autenticada.status_code}")
+
+class SimuladorSegmentoSesionTest(SimuladorBaseTestCase):
+    """Tests para el segmento resuelto cacheado en la sesión"""
+
+    def _calcular(self):
+        response = self.client.post(
+            reverse('simulador:calcular_simulacion_api'),
+            data=json.dumps({'tipo_operacion': 'venta', 'monto': '10', 'moneda': 'USD'}),
+            content_type='application/json'
+        )
+        return json.loads(response.content)
+
+    def test_segundo_calculo_sin_consultas_de_segmento(self):
+        """Test: Con el segmento en sesión no se consultan clientes ni segmentos"""
+        print("Probando caché de segmento en sesión...")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_login(self.user)
+        self.assertEqual(self._calcular()['segmento'], 'Minorista')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._calcular()['segmento'], 'Minorista')
+        consultas = [q['sql'] for q in ctx.captured_queries]
+
+        # El middleware valida el cliente activo; la resolución del segmento
+        # (cliente, asignación o 'general') siempre lee clientes_segmento.
+        self.assertFalse(
+            [sql for sql in consultas if '"clientes_segmento"' in sql],
+            "❌ El segundo cálculo no debería resolver el segmento en la base"
+        )
+
+        print(f"Consultas en el segundo cálculo: {len(consultas)}")
+
+    def test_cambio_de_segmento_invalida_sesion(self):
+        """Test: Cambiar el segmento del cliente o la asignación invalida la caché"""
+        print("Probando invalidación del segmento en sesión...")
+
+        self.client.force_login(self.user)
+        self.assertEqual(self._calcular()['segmento'], 'Minorista')
+
+        self.cliente.segmento = self.segmento_empresarial
+        self.cliente.save()
+        self.assertEqual(self._calcular()['segmento'], 'Empresarial',
+                         "❌ El cambio de segmento del cliente debería verse de inmediato")
+
+        AsignacionCliente.objects.filter(usuario=self.user).delete()
+        self.assertEqual(self._calcular()['segmento'], 'general',
+                         "❌ Sin asignación debería usarse el segmento 'general'")
+
+        print("Segmento actualizado tras cada cambio")
+
+    def test_invalidacion_desde_otro_proceso(self):
+        """Test: La versión en la base invalida la sesión aunque el cambio venga de otro proceso"""
+        print("Probando invalidación compartida entre procesos...")
+        from django.db.models import F
+        from clientes.models import VersionSegmentos
+
+        self.client.force_login(self.user)
+        self.assertEqual(self._calcular()['segmento'], 'Minorista')
+
+        # Otro worker cambia el segmento: sus señales sólo tocan la base.
+        Cliente.objects.filter(pk=self.cliente.pk).update(segmento=self.segmento_empresarial)
+        VersionSegmentos.objects.filter(pk=VersionSegmentos.UNICA).update(valor=F('valor') + 1)
+
+        self.assertEqual(self._calcular()['segmento'], 'Empresarial',
+                         "❌ La versión guardada en la base debería invalidar la sesión")
+
+        print("Invalidación visible para todos los procesos")
+
+    def test_anonimo_no_crea_sesion(self):
+        """Test: Un visitante anónimo obtiene 'general' sin que se guarde su sesión"""
+        print("Probando segmento de visitante anónimo...")
+        from django.contrib.sessions.models import Session
+
+        self.assertEqual(self._calcular()['segmento'], 'general')
+        self.assertEqual(Session.objects.count(), 0,
+                         "❌ Resolver el segmento de un anónimo no debería crear sesiones")
+
+        print("Sin filas de sesión para anónimos")
+
+
+class SimuladorCacheResultadosTest(SimuladorBaseTestCase):
+    """Tests para la caché de resultados de simulación"""
+
+    def _calcular(self, monto='10'):
+        response = self.client.post(
+            reverse('simulador:calcular_simulacion_api'),
+            data=json.dumps({'tipo_operacion': 'venta', 'monto': monto, 'moneda': 'USD'}),
+            content_type='application/json'
+        )
+        return json.loads(response.content)
+
+    def test_solicitud_repetida_sin_consultar_cotizaciones(self):
+        """Test: La misma solicitud se responde desde la caché"""
+        print("Probando acierto de caché...")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from simulador.cache import cache_resultados
+
+        self.client.force_login(self.user)
+        primero = self._calcular()
+        aciertos = cache_resultados().estadisticas()['aciertos']
+        with CaptureQueriesContext(connection) as ctx:
+            segundo = self._calcular()
+        consultas = [q['sql'] for q in ctx.captured_queries]
+
+        self.assertEqual(primero['monto_resultado'], segundo['monto_resultado'])
+        self.assertFalse([sql for sql in consultas if '"divisas_cotizacionsegmento"' in sql],
+                         "❌ Una solicitud repetida no debería consultar cotizaciones")
+        self.assertEqual(cache_resultados().estadisticas()['aciertos'], aciertos + 1)
+        self.assertEqual(self._calcular('10.0')['monto_original'], '10.0',
+                         "❌ Montos iguales con distinta escala no deberían compartir entrada")
+
+        print(f"Consultas en la solicitud repetida: {len(consultas)}")
+
+    def test_cotizacion_nueva_invalida_resultados(self):
+        """Test: Una cotización nueva cambia la época y el resultado"""
+        print("Probando invalidación por época...")
+
+        self.client.force_login(self.user)
+        self.assertEqual(Decimal(self._calcular()['monto_resultado']), Decimal('67000'))
+
+        CotizacionSegmento.objects.create(
+            divisa=self.divisa_usd,
+            segmento=self.segmento_minorista,
+            precio_base=Decimal('7100.00000000'),
+            comision_compra=Decimal('300.00000000'),
+            comision_venta=Decimal('100.00000000'),
+            porcentaje_descuento=Decimal('0.00'),
+            valor_compra_unit=Decimal('6800.00000000'),
+            valor_venta_unit=Decimal('7200.00000000')
+        )
+
+        self.assertEqual(Decimal(self._calcular()['monto_resultado']), Decimal('68000'),
+                         "❌ El resultado debería usar la cotización nueva")
+
+        print("Resultado actualizado con la nueva cotización")
+
+    def test_lru_acotado_y_vencimiento(self):
+        """Test: La caché desaloja la entrada menos usada y respeta el TTL"""
+        print("Probando LRU y TTL...")
+        from simulador.cache import CacheResultados
+
+        cache = CacheResultados(maximo=2, ttl=60)
+        cache.guardar(1, 'a', 'A')
+        cache.guardar(1, 'b', 'B')
+        self.assertEqual(cache.obtener(1, 'a'), 'A')
+        cache.guardar(1, 'c', 'C')
+        self.assertIsNone(cache.obtener(1, 'b'), "❌ 'b' era la entrada menos usada")
+        self.assertEqual(cache.obtener(1, 'a'), 'A')
+        self.assertIsNone(cache.obtener(2, 'a'), "❌ Otra época no debería ver entradas viejas")
+
+        vencida = CacheResultados(maximo=2, ttl=0)
+        vencida.guardar(1, 'a', 'A')
+        self.assertIsNone(vencida.obtener(1, 'a'))
+
+        estadisticas = cache.estadisticas()
+        self.assertEqual((estadisticas['aciertos'], estadisticas['fallos']), (2, 2))
+        self.assertEqual(estadisticas['desalojos'], 1)
+        self.assertEqual(estadisticas['tasa_aciertos'], 0.5)
+
+        print(f"Estadísticas: {estadisticas}")
+
+    def test_estadisticas_solo_staff(self):
+        """Test: Los contadores solo son visibles para staff"""
+        print("Probando acceso a estadísticas...")
+        url = reverse('simulador:estadisticas_cache_api')
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('tasa_aciertos', json.loads(response.content))
+
+        print("Estadísticas accesibles para staff")
+
+
+class SimuladorCotizacionesFeedTest(SimuladorBaseTestCase):
+    """Tests para el feed de cotizaciones del simulador (quotes.json)"""
+
+    def test_feed_solo_segmento_del_usuario(self):
+        """Test: El feed trae sólo las cotizaciones del segmento del usuario"""
+        print("Probando feed de cotizaciones...")
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('simulador:cotizaciones_json'))
+
+        self.assertEqual(response.status_code, 200)
+        feed = json.loads(response.content)
+        self.assertEqual(feed['g'], 'Minorista')
+        self.assertEqual(feed['q']['USD']['c'], '6700')
+        self.assertEqual(feed['q']['USD']['v'], '7100')
+        self.assertNotIn('EUR', feed['q'], "❌ EUR no tiene cotizaciones")
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertFalse(response['ETag'].startswith('W/'), "❌ El ETag debería ser fuerte")
+
+        print(f"Feed: {len(response.content)} bytes, ETag {response['ETag']}")
+
+    def test_feed_revalidacion_por_etag(self):
+        """Test: If-None-Match responde 304 hasta que cambia una cotización"""
+        print("Probando revalidación por ETag...")
+
+        self.client.force_login(self.user)
+        url = reverse('simulador:cotizaciones_json')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertIn('private', response['Cache-Control'])
+
+        CotizacionSegmento.objects.create(
+            divisa=self.divisa_usd,
+            segmento=self.segmento_minorista,
+            precio_base=Decimal('7100.00000000'),
+            comision_compra=Decimal('300.00000000'),
+            comision_venta=Decimal('100.00000000'),
+            porcentaje_descuento=Decimal('0.00'),
+            valor_compra_unit=Decimal('6800.00000000'),
+            valor_venta_unit=Decimal('7200.00000000')
+        )
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200, "❌ Una cotización nueva debería cambiar el ETag")
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['q']['USD']['c'], '6800')
+
+        print(f"ETag nuevo: {response['ETag']}")
+
+    def test_feed_coincide_con_servicio(self):
+        """Test: Calcular con el feed da lo mismo que el servicio"""
+        print("Probando regla local contra el servicio...")
+        from simulador.services import SolicitudSimulacion, calcular_simulacion, feed_cotizaciones
+
+        _, cuerpo = feed_cotizaciones(self.segmento_minorista)
+        cot = json.loads(cuerpo)['q']['USD']
+        servidor = calcular_simulacion(
+            SolicitudSimulacion('compra', Decimal('71000'), 'USD'), self.segmento_minorista)
+
+        self.assertEqual(Decimal('71000') / Decimal(cot['v']), servidor.monto_resultado)
+        self.assertEqual(Decimal(cot['cv']), servidor.comision_aplicada)
+
+        print(f"Resultado: {servidor.monto_resultado} USD")
+
+
+class SimuladorCotizacionInversaTest(SimuladorBaseTestCase):
+    """Tests para la cotización inversa con comisión del medio de pago"""
+
+    def setUp(self):
+        super().setUp()
+        from medios_pago.models import MedioDePago
+        from clientes.models import ClienteMedioDePago
+
+        self.medios = [
+            ClienteMedioDePago.objects.create(
+                cliente=self.cliente,
+                medio_de_pago=MedioDePago.objects.create(nombre=nombre, comision_porcentaje=comision),
+                es_principal=principal,
+            )
+            for nombre, comision, principal in [
+                ('Efectivo', Decimal('0'), True),
+                ('Tarjeta', Decimal('2.5'), False),
+                ('Billetera', Decimal('3'), False),
+            ]
+        ]
+
+    def test_compra_total_en_guaranies_con_comision(self):
+        """Test: Compra - total en Gs por medio, redondeado hacia arriba"""
+        print("Probando cotización inversa de compra...")
+        from simulador.services import SolicitudSimulacion, cotizar_inverso
+
+        opciones = cotizar_inverso(
+            SolicitudSimulacion('compra', Decimal('10.01'), 'USD'), self.segmento_minorista, self.medios)
+
+        self.assertEqual([o.medio_nombre for o in opciones], ['Efectivo', 'Tarjeta', 'Billetera'])
+        self.assertEqual(opciones[0].monto_a_pagar, Decimal('71071'))
+        self.assertEqual(opciones[1].monto_a_pagar, Decimal('72848'),
+                         "❌ 71071 × 1.025 = 72847.775 debería redondearse hacia arriba")
+        self.assertEqual(opciones[1].comision_monto, Decimal('1777'))
+        for opcion in opciones:
+            self.assertEqual(opcion.moneda_pago, 'PYG')
+            neto = opcion.monto_a_pagar / (1 + opcion.comision_porcentaje / 100)
+            self.assertGreaterEqual(neto / Decimal('7100'), Decimal('10.01'),
+                                    "❌ Pagar el total debería alcanzar el objetivo")
+
+        print(f"Totales: {[(o.medio_nombre, o.monto_a_pagar) for o in opciones]}")
+
+    def test_venta_total_en_divisa_neto_de_comision(self):
+        """Test: Venta - divisa a entregar para acreditar el objetivo neto"""
+        print("Probando cotización inversa de venta...")
+        from simulador.services import SolicitudSimulacion, cotizar_inverso
+
+        opciones = cotizar_inverso(
+            SolicitudSimulacion('venta', Decimal('67000'), 'USD'), self.segmento_minorista, self.medios)
+
+        self.assertEqual(opciones[0].monto_a_pagar, Decimal('10.00'))
+        self.assertEqual(opciones[2].monto_a_pagar, Decimal('10.31'))
+        self.assertEqual(opciones[2].moneda_pago, 'USD')
+        self.assertGreaterEqual(Decimal('10.31') * Decimal('6700') * Decimal('0.97'), Decimal('67000'))
+        self.assertLess(Decimal('10.30') * Decimal('6700') * Decimal('0.97'), Decimal('67000'),
+                        "❌ El monto debería ser el mínimo que alcanza el objetivo")
+
+        print(f"Totales: {[(o.medio_nombre, o.monto_a_pagar) for o in opciones]}")
+
+    def test_api_todos_los_medios_en_una_llamada(self):
+        """Test: La API devuelve todos los medios del cliente con consultas constantes"""
+        print("Probando API de cotización inversa...")
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from medios_pago.models import MedioDePago
+        from clientes.models import ClienteMedioDePago
+
+        self.client.force_login(self.user)
+        url = reverse('simulador:calcular_inverso_api')
+        cuerpo = json.dumps({'tipo_operacion': 'compra', 'monto': '10', 'moneda': 'USD'})
+        self.client.post(url, data=cuerpo, content_type='application/json')  # snapshot y sesión
+
+        with CaptureQueriesContext(connection) as tres:
+            response = self.client.post(url, data=cuerpo, content_type='application/json')
+        con_tres = len(tres.captured_queries)
+        content = json.loads(response.content)
+        self.assertTrue(content['success'])
+        self.assertEqual({o['medio_nombre'] for o in content['opciones']}, {'Efectivo', 'Tarjeta', 'Billetera'})
+
+        for i in range(5):
+            ClienteMedioDePago.objects.create(
+                cliente=self.cliente,
+                medio_de_pago=MedioDePago.objects.create(nombre=f'Medio {i}', comision_porcentaje=Decimal('1')),
+            )
+        with CaptureQueriesContext(connection) as ocho:
+            response = self.client.post(url, data=cuerpo, content_type='application/json')
+        con_ocho = len(ocho.captured_queries)
+
+        self.assertEqual(len(json.loads(response.content)['opciones']), 8)
+        self.assertEqual(con_tres, con_ocho, "❌ Las consultas no deberían depender de la cantidad de medios")
+
+        print(f"Consultas con 3 medios: {con_tres}, con 8: {con_ocho}")
+
+
+class SimuladorCruceTest(SimuladorBaseTestCase):
+    """Tests para la conversión cruzada entre divisas vía guaraní"""
+
+    def setUp(self):
+        super().setUp()
+        self.cotizacion_eur = CotizacionSegmento.objects.create(
+            divisa=self.divisa_eur,
+            segmento=self.segmento_minorista,
+            precio_base=Decimal('7700.00000000'),
+            comision_compra=Decimal('200.00000000'),
+            comision_venta=Decimal('200.00000000'),
+            porcentaje_descuento=Decimal('0.00'),
+            valor_compra_unit=Decimal('7500.00000000'),
+            valor_venta_unit=Decimal('7900.00000000')
+        )
+
+    def test_matriz_cruzada_por_segmento(self):
+        """Test: La matriz usa compra del origen y venta del destino"""
+        print("Probando matriz cruzada...")
+        from simulador.services import matriz_cruzada
+
+        matriz = matriz_cruzada(self.segmento_minorista)
+
+        self.assertEqual(matriz.monedas, ['EUR', 'PYG', 'USD'])
+        self.assertEqual(matriz.tasa('USD', 'EUR'), Decimal('6700') / Decimal('7900'))
+        self.assertEqual(matriz.tasa('EUR', 'USD'), Decimal('7500') / Decimal('7100'))
+        self.assertEqual(matriz.tasa('USD', 'PYG'), Decimal('6700'))
+        self.assertEqual(matriz.tasa('PYG', 'USD'), 1 / Decimal('7100'))
+        with self.assertNumQueries(0):
+            self.assertIs(matriz_cruzada(self.segmento_minorista), matriz,
+                          "❌ La matriz debería reutilizarse dentro de la misma época")
+
+        print(f"USD→EUR: {matriz.tasa('USD', 'EUR')}")
+
+    def test_cruce_en_una_llamada(self):
+        """Test: USD→EUR se cotiza con sus dos tramos contra guaraníes"""
+        print("Probando cotización cruzada...")
+        from simulador.services import cotizar_cruce
+
+        resultado = cotizar_cruce(['USD', 'EUR'], Decimal('100'), self.segmento_minorista)
+
+        self.assertEqual(resultado.monto_resultado, Decimal('670000') / Decimal('7900'))
+        self.assertEqual([(t.tipo_operacion, t.moneda) for t in resultado.tramos],
+                         [('venta', 'USD'), ('compra', 'EUR')])
+        self.assertEqual(resultado.tramos[0].monto_salida, Decimal('670000'))
+
+        ida_y_vuelta = cotizar_cruce(['USD', 'EUR', 'USD'], Decimal('100'), self.segmento_minorista)
+        self.assertEqual(len(ida_y_vuelta.tramos), 4)
+        self.assertLess(ida_y_vuelta.monto_resultado, Decimal('100'), "❌ El spread debería aplicarse en cada tramo")
+
+        print(f"100 USD → {resultado.monto_resultado:.2f} EUR")
+
+    def test_nueva_epoca_recalcula_matriz(self):
+        """Test: Una cotización nueva cambia la matriz"""
+        print("Probando matriz por época...")
+        from simulador.services import matriz_cruzada
+
+        antes = matriz_cruzada(self.segmento_minorista).tasa('USD', 'EUR')
+        CotizacionSegmento.objects.create(
+            divisa=self.divisa_usd,
+            segmento=self.segmento_minorista,
+            precio_base=Decimal('7100.00000000'),
+            comision_compra=Decimal('300.00000000'),
+            comision_venta=Decimal('100.00000000'),
+            porcentaje_descuento=Decimal('0.00'),
+            valor_compra_unit=Decimal('6800.00000000'),
+            valor_venta_unit=Decimal('7200.00000000')
+        )
+        despues = matriz_cruzada(self.segmento_minorista).tasa('USD', 'EUR')
+
+        self.assertNotEqual(antes, despues)
+        self.assertEqual(despues, Decimal('6800') / Decimal('7900'))
+
+        print(f"USD→EUR antes: {antes:.6f}, después: {despues:.6f}")
+
+    def test_api_cruce_y_errores(self):
+        """Test: API de cruce con resultado y errores"""
+        print("Probando API de cruce...")
+        url = reverse('simulador:calcular_cruce_api')
+
+        def post(datos):
+            return self.client.post(url, data=json.dumps(datos), content_type='application/json')
+
+        response = post({'origen': 'EUR', 'destino': 'USD', 'monto': '71'})
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(response.content)
+        self.assertEqual(content['ruta'], ['EUR', 'USD'])
+        self.assertEqual(len(content['tramos']), 2)
+
+        self.assertEqual(post({'origen': 'USD', 'destino': 'USD', 'monto': '1'}).status_code, 400)
+        self.assertEqual(post({'origen': 'USD', 'destino': 'EUR', 'monto': '-1'}).status_code, 400)
+        self.assertEqual(post({'ruta': ['USD', 'GBP'], 'monto': '1'}).status_code, 404)
+
+        print(f"71 EUR → {Decimal(content['monto_resultado']):.2f} USD")
+
+
+class SimuladorBenchmarkTest(SimuladorBaseTestCase):
+    """Tests del comando de prueba de carga"""
+
+    def test_benchmark_reporta_json_y_limpia(self):
+        """Test: El comando reporta latencias por escenario y borra lo sembrado"""
+        print("Probando comando benchmark_cotizaciones...")
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as directorio:
+            salida = os.path.join(directorio, 'bench.json')
+            call_command(
+                'benchmark_cotizaciones', divisas=2, segmentos=1, clientes=2, historial=3,
+                solicitudes=3, concurrencia=1, forzar=True, salida=salida, stdout=StringIO(),
+            )
+            with open(salida, encoding='utf-8') as archivo:
+                reporte = json.load(archivo)
+
+        self.assertEqual(set(reporte['escenarios']), {'simulacion', 'formulario', 'transaccion'},
+                         "❌ Faltan escenarios en el reporte")
+        simulacion = reporte['escenarios']['simulacion']
+        self.assertEqual(simulacion['solicitudes'], 3, "❌ Cantidad de solicitudes incorrecta")
+        self.assertEqual(simulacion['errores'], 0, "❌ La simulación no debería fallar")
+        self.assertEqual(set(simulacion['latencia_ms']), {'p50', 'p95', 'p99', 'media', 'max'},
+                         "❌ Percentiles incompletos")
+        self.assertGreater(simulacion['consultas_por_solicitud']['max'], 0, "❌ No se midieron consultas")
+        self.assertFalse(Divisa.objects.filter(code__startswith='BM-').exists(),
+                         "❌ Quedaron divisas sembradas")
+        self.assertFalse(Cliente.objects.filter(cedula__startswith='BM-').exists(),
+                         "❌ Quedaron clientes sembrados")
+
+        print(f"Simulación p50: {simulacion['latencia_ms']['p50']} ms, "
+              f"{simulacion['consultas_por_solicitud']['media']} consultas/solicitud")
+
+
+class SimuladorTelemetriaTest(SimuladorBaseTestCase):
+    """Tests de la telemetría del camino de cotización"""
+
+    def setUp(self):
+        super().setUp()
+        from casa_de_cambios.telemetria import BackendMemoria, usar_backend
+        self.telemetria = BackendMemoria()
+        anterior = usar_backend(self.telemetria)
+        self.addCleanup(usar_backend, anterior)
+
+    def _calcular(self, moneda='USD'):
+        return self.client.post(
+            reverse('simulador:calcular_simulacion_api'),
+            data=json.dumps({'tipo_operacion': 'venta', 'monto': '13', 'moneda': moneda}),
+            content_type='application/json'
+        )
+
+    def test_api_registra_spans_y_contadores(self):
+        """Test: La API mide segmento, cotización y cálculo"""
+        print("Probando spans de la API...")
+        self.client.force_login(self.user)
+        self.assertEqual(self._calcular().status_code, 200)
+        self.assertEqual(self._calcular('XXX').status_code, 404)
+
+        spans = self.telemetria.nombres_spans()
+        for nombre in ('segmento.resolver', 'simulacion.cotizacion', 'simulacion.calculo', 'simulacion.api'):
+            self.assertIn(nombre, spans, f"❌ Falta el span {nombre}")
+        self.assertEqual(self.telemetria.total('simulacion.solicitudes', status=200), 1)
+        self.assertEqual(self.telemetria.total('simulacion.solicitudes', status=404), 1)
+        self.assertEqual(self.telemetria.total('segmento.sesion', resultado='acierto'), 1,
+                         "❌ La segunda solicitud debería reutilizar el segmento de la sesión")
+
+        print(f"Spans registrados: {spans}")
+
+    def test_eventos_muestreados(self):
+        """Test: Los eventos respetan TELEMETRIA_MUESTREO_EVENTOS"""
+        print("Probando muestreo de eventos...")
+        from django.test import override_settings
+        from casa_de_cambios.telemetria import evento
+
+        with override_settings(TELEMETRIA_MUESTREO_EVENTOS=0):
+            self.assertFalse(evento('prueba', valor=1))
+        with override_settings(TELEMETRIA_MUESTREO_EVENTOS=1):
+            self.assertTrue(evento('prueba', valor=2))
+        self.assertEqual(self.telemetria.eventos, [('prueba', {'valor': 2})],
+                         "❌ Sólo el evento muestreado debería registrarse")
+
+    def test_limites_sin_print(self):
+        """Test: verificar_limites mide y cuenta rechazos sin escribir en stdout"""
+        print("Probando telemetría de límites...")
+        import io
+        from contextlib import redirect_stdout
+        from django.utils import timezone
+        from clientes.models import LimiteDiario
+        from clientes.services import verificar_limites
+
+        LimiteDiario.objects.create(fecha=timezone.localdate(), monto=Decimal('100'),
+                                    inicio_vigencia=timezone.now())
+        salida = io.StringIO()
+        with redirect_stdout(salida):
+            ok, _ = verificar_limites(self.cliente, Decimal('500'))
+
+        self.assertFalse(ok)
+        self.assertEqual(salida.getvalue(), '', "❌ verificar_limites no debería imprimir")
+        self.assertIn('limites.verificar', self.telemetria.nombres_spans())
+        self.assertEqual(self.telemetria.total('limites.rechazos', tipo='diario'), 1)
+
+    def test_exportacion_prometheus(self):
+        """Test: BackendPrometheus exporta contadores y sumas de spans"""
+        print("Probando exportación Prometheus...")
+        from casa_de_cambios.telemetria import BackendPrometheus, usar_backend
+
+        prometheus = BackendPrometheus()
+        usar_backend(prometheus)
+        self.client.force_login(self.user)
+        self._calcular()
+        self._calcular()
+
+        texto = prometheus.exportar()
+        self.assertIn('# TYPE casa_de_cambios_simulacion_solicitudes_total counter', texto)
+        self.assertIn('casa_de_cambios_simulacion_solicitudes_total{status="200"} 2', texto)
+        self.assertIn('casa_de_cambios_simulacion_api_segundos_count 2', texto)
+
+        self.assertEqual(self.client.get(reverse('simulador:metricas_telemetria')).status_code, 302,
+                         "❌ Las métricas deberían ser sólo para staff")
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('simulador:metricas_telemetria'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('casa_de_cambios_simulacion_api_segundos_sum', response.content.decode())
+
+        print(texto)
+
+
 # Función para ejecutar tests esenciales del simulador
 def run_simulador_tests():
     """Ejecuta todos los tests esenciales del simulador"""
@@ -576,7 +1333,16 @@ def run_simulador_tests():
         SimuladorViewTest,
         SimuladorCalculoTest,
         SimuladorErrorTest,
-        SimuladorBusinessLogicTest
+        SimuladorBusinessLogicTest,
+        SimuladorLoteTest,
+        SimuladorServiceTest,
+        SimuladorSegmentoSesionTest,
+        SimuladorCacheResultadosTest,
+        SimuladorCotizacionesFeedTest,
+        SimuladorCotizacionInversaTest,
+        SimuladorCruceTest,
+        SimuladorBenchmarkTest,
+        SimuladorTelemetriaTest
     ]
     
     for test_class in test_classes:
@@ -7,4 +7,16 @@ urlpatterns = [
     path('', views.simulador_view, name='simulador'),
     # Nueva URL para la API
     path('calcular/', views.calcular_simulacion_api, name='calcular_simulacion_api'),
+    # Varias simulaciones en una sola solicitud
+    path('calcular/lote/', views.calcular_simulacion_lote_api, name='calcular_simulacion_lote_api'),
+    # Monto a pagar con cada medio para recibir un objetivo
+    path('calcular/inverso/', views.calcular_inverso_api, name='calcular_inverso_api'),
+    # Conversión entre divisas pasando por el guaraní
+    path('calcular/cruce/', views.calcular_cruce_api, name='calcular_cruce_api'),
+    # Cotizaciones del segmento para simular en el navegador
+    path('quotes.json', views.cotizaciones_json, name='cotizaciones_json'),
+    # Contadores de la caché de resultados (staff)
+    path('cache/estadisticas/', views.estadisticas_cache_api, name='estadisticas_cache_api'),
+    # Métricas de telemetría del proceso (staff)
+    path('metricas/', views.metricas_telemetria, name='metricas_telemetria'),
 ]
\ No newline at end of file
@@ -1,14 +1,22 @@
 #simulador
 from django.shortcuts import render
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.http import JsonResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_POST, require_GET
+from django.contrib.auth.decorators import user_passes_test
 from django.views.decorators.csrf import csrf_exempt
 import json
-from decimal import Decimal
-from divisas.models import Divisa, TasaCambio, CotizacionSegmento
-from clientes.models import AsignacionCliente, Segmento, Cliente  # ### CAMBIO: import Cliente
-from django.db.models import ObjectDoesNotExist
+from decimal import Decimal, InvalidOperation
 from .context_processors import simulador_context as get_simulador_context
+from clientes.services import resolver_segmento
+from .services import (
+    SolicitudSimulacion, SimulacionError,
+    calcular_simulacion, cotizaciones_para, aplicar_cotizacion, feed_cotizaciones,
+    cotizar_inverso, cotizar_cruce, reservar_cotizacion,
+)
+from .cache import cache_resultados
+from casa_de_cambios.telemetria import backend as telemetria, contar, medir
 from django.core.serializers.json import DjangoJSONEncoder
 
 
@@ -28,6 +36,23 @@ def simulador_view(request):
     return render(request, 'simulador/simulador.html', context)
 
 
+
+def _solicitud_desde(data):
+    """Arma una :class:`SolicitudSimulacion` desde un dict JSON."""
+    try:
+        monto = Decimal(str(data.get('monto')))
+    except (InvalidOperation, ValueError, TypeError):
+        raise SimulacionError('El monto debe ser un número mayor a cero.')
+    moneda = data.get('moneda')
+    if not isinstance(moneda, str) or not moneda:
+        raise SimulacionError('Debe indicar el código de la moneda.')
+    return SolicitudSimulacion(
+        tipo_operacion=data.get('tipo_operacion'),
+        monto=monto,
+        moneda=moneda,
+    )
+
+
 @csrf_exempt
 @require_POST
 def calcular_simulacion_api(request):
@@ -36,137 +61,272 @@ def calcular_simulacion_api(request):
 
     Procesa una solicitud POST con los detalles de una operación de cambio
     (tipo, monto y moneda) y devuelve un resultado calculado en formato JSON.
+    El cálculo lo hace :func:`simulador.services.calcular_simulacion`; esta
+    vista sólo traduce JSON y errores HTTP.
 
     Flujo de cálculo:
     1. Deserializa los datos JSON de la solicitud.
-    2. Valida la operación, prohibiendo el uso del Guaraní (PYG).
-    3. Determina el segmento del cliente basado en la sesión, la asignación de usuario
+    2. Determina el segmento del cliente basado en la sesión, la asignación de usuario
        o, por defecto, el segmento 'general'.
-    4. Obtiene la cotización de la divisa más reciente para el segmento del cliente.
-    5. Realiza el cálculo de la conversión y la comisión ajustada según el tipo de operación.
-    6. Formatea el resultado en un diccionario JSON y lo devuelve como respuesta.
+    3. Calcula la simulación (rechaza Guaraní, divisas inactivas o sin cotización).
+    4. Si se envía ``"reservar": true``, bloquea la tasa y agrega ``reserva_id``
+       y ``reserva_vence`` (ver :func:`simulador.services.reservar_cotizacion`).
+       Sólo usuarios autenticados pueden reservar (403 en otro caso).
+    5. Devuelve el resultado como JSON.
 
     :param request: El objeto HttpRequest con datos JSON en el cuerpo.
     :type request: django.http.HttpRequest
     :return: Un objeto JsonResponse con el resultado de la simulación o un error.
     :rtype: django.http.JsonResponse
-    :raises json.JSONDecodeError: Si el cuerpo de la solicitud no es un JSON válido.
-    :raises Divisa.DoesNotExist: Si la divisa especificada no se encuentra o está inactiva.
-    :raises ObjectDoesNotExist: Si el segmento 'general' no existe en la base de datos.
-    :raises Exception: Para manejar cualquier otro error inesperado.
     """
+    with medir('simulacion.api'):
+        try:
+            data = json.loads(request.body)
+            solicitud = _solicitud_desde(data)
+            if data.get('reservar') and not request.user.is_authenticated:
+                raise SimulacionError('Debe iniciar sesión para reservar una cotización.', status=403)
+            segmento = resolver_segmento(request.session, request.user)
+            resultado = calcular_simulacion(solicitud, segmento)
+            datos = resultado.como_dict()
+            if data.get('reservar'):
+                reserva = reservar_cotizacion(solicitud, resultado, request.user)
+                datos.update(reserva_id=str(reserva.pk), reserva_vence=reserva.vence)
+        except json.JSONDecodeError:
+            response = JsonResponse({'success': False, 'error': 'Formato JSON inválido.'}, status=400)
+        except SimulacionError as e:
+            response = JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+        except Exception as e:
+            response = JsonResponse({'success': False, 'error': f'Error inesperado: {str(e)}'}, status=500)
+        else:
+            response = JsonResponse({'success': True, **datos}, encoder=DjangoJSONEncoder)
+
+    contar('simulacion.solicitudes', status=response.status_code)
+    return response
+
+
+@csrf_exempt
+@require_POST
+def calcular_simulacion_lote_api(request):
+    """
+    API endpoint para calcular muchas simulaciones en una sola solicitud.
+
+    Recibe ``{"lineas": [{"tipo_operacion", "monto", "moneda"}, ...]}`` (hasta
+    ``SIMULADOR_LOTE_MAX`` líneas). El segmento se resuelve una vez y todas las
+    cotizaciones necesarias se cargan en una sola consulta; cada línea
+    devuelve su resultado o su propio error, en el mismo orden recibido.
+
+    :param request: El objeto HttpRequest con datos JSON en el cuerpo.
+    :type request: django.http.HttpRequest
+    :return: ``{"success", "segmento", "resultados": [...]}``
+    :rtype: django.http.JsonResponse
+    """
+    from django.conf import settings
+
     try:
         data = json.loads(request.body)
-        tipo_operacion = data.get('tipo_operacion')
-        monto = Decimal(str(data.get('monto')))
-        moneda_code = data.get('moneda')
-
-        # Restricción: No permitir operaciones con Guaraní (código 116)
-        if moneda_code == 'PYG':
-            return JsonResponse({
-                'success': False,
-                'error': 'No se permiten operaciones con Guaraní (PYG) en el simulador.'
-            }, status=400)
-
-        # 1. Obtener el segmento desde cliente activo en sesión
-        segmento_obj = None
-        cliente_id = request.session.get("cliente_id")
-
-        if cliente_id:
-            try:
-                cliente_activo = Cliente.objects.get(id=cliente_id, esta_activo=True)
-                if cliente_activo.segmento:
-                    segmento_obj = cliente_activo.segmento
-                    print(f"Usando segmento desde cliente activo: {segmento_obj.name}")
-            except Cliente.DoesNotExist:
-                pass
-
-        # 2. Si no hay cliente en sesión, tomar primera asignación como fallback
-        if not segmento_obj and request.user.is_authenticated:
-            asignacion = AsignacionCliente.objects.select_related("cliente__segmento").filter(
-                usuario=request.user).first()
-            if asignacion and asignacion.cliente and asignacion.cliente.segmento:
-                segmento_obj = asignacion.cliente.segmento
-                print(f"Usando segmento de asignación: {segmento_obj.name}")
-
-        # 3. Si aún no hay segmento, usar 'general'
-        if not segmento_obj:
-            try:
-                segmento_obj, _ = Segmento.objects.get_or_create(name="general")
-                print(f"Usando segmento por defecto: {segmento_obj.name}")
-            except ObjectDoesNotExist:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Segmento "general" no encontrado. Favor, crear el segmento.'
-                }, status=500)
-
-        # 4. Obtener la divisa
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Formato JSON inválido.'}, status=400)
+
+    lineas = data.get('lineas') if isinstance(data, dict) else data
+    maximo = getattr(settings, 'SIMULADOR_LOTE_MAX', 5000)
+    if not isinstance(lineas, list) or not lineas:
+        return JsonResponse({'success': False, 'error': 'Debe enviar una lista "lineas" no vacía.'}, status=400)
+    if len(lineas) > maximo:
+        return JsonResponse({'success': False, 'error': f'Se permiten hasta {maximo} líneas por lote.'}, status=400)
+
+    # Primero se interpreta cada línea: las mal formadas quedan con su error y
+    # no participan de la búsqueda de cotizaciones.
+    solicitudes = []
+    for linea in lineas:
         try:
-            divisa_obj = Divisa.objects.get(code=moneda_code, is_active=True)
-            print(f"Divisa encontrada: {divisa_obj.code} - {divisa_obj.nombre}")
-        except Divisa.DoesNotExist:
-            return JsonResponse({
-                'success': False,
-                'error': f'Divisa {moneda_code} no encontrada o no activa.'
-            }, status=404)
-
-        # 5. Obtener la cotización más reciente para la divisa y el segmento
-        cotizacion = CotizacionSegmento.objects.ultima_para(
-            divisa=divisa_obj,
-            segmento=segmento_obj
-        )
-
-        if not cotizacion:
-            # Intentar obtener cualquier cotización para la divisa
-            cotizaciones = CotizacionSegmento.objects.filter(
-                divisa=divisa_obj
-            ).order_by('-fecha')[:1]
-
-            if cotizaciones:
-                cotizacion = cotizaciones[0]
-                print(
-                    f"Usando cotización general para {divisa_obj.code} ya que no hay para el segmento {segmento_obj.name}")
-            else:
-                return JsonResponse({
-                    'success': False,
-                    'error': f'No hay cotizaciones disponibles para la divisa {divisa_obj.code}.'
-                }, status=404)
-
-        print(f"Cotización encontrada: {cotizacion}")
-        print(f"Valor compra: {cotizacion.valor_compra_unit}, Valor venta: {cotizacion.valor_venta_unit}")
-        print(f"Descuento aplicado: {cotizacion.porcentaje_descuento}%")
-
-        resultado = Decimal('0.00')
-        tasa_aplicada = Decimal('0.00')
-        comision_aplicada = Decimal('0.00')
-
-        if tipo_operacion == 'compra':  # Cliente compra divisa (negocio vende)
-            tasa_aplicada = cotizacion.valor_venta_unit
-            resultado = monto / tasa_aplicada  # Monto en Gs → Divisa extranjera
-            comision_aplicada = cotizacion.comision_venta_ajustada
-        else:  # venta - Cliente vende divisa (negocio compra)
-            tasa_aplicada = cotizacion.valor_compra_unit
-            resultado = monto * tasa_aplicada  # Divisa extranjera → Gs
-            comision_aplicada = cotizacion.comision_compra_ajustada
-
-        # 6. Formatear y devolver la respuesta JSON usando DjangoJSONEncoder
-        return JsonResponse({
-            'success': True,
-            'segmento': segmento_obj.name,
-            'monto_original': monto,
-            'monto_resultado': resultado,
-            'tasa_aplicada': tasa_aplicada,
-            'comision_aplicada': comision_aplicada,
-            'porcentaje_descuento': cotizacion.porcentaje_descuento,
-            'moneda_code': moneda_code,
-            'moneda_simbolo': cotizacion.divisa.simbolo,
-            'moneda_nombre': cotizacion.divisa.nombre
-        }, encoder=DjangoJSONEncoder)
+            if not isinstance(linea, dict):
+                raise SimulacionError('Línea inválida.')
+            solicitudes.append(_solicitud_desde(linea))
+        except SimulacionError as e:
+            solicitudes.append(e)
 
+    segmento = resolver_segmento(request.session, request.user)
+    cotizaciones = cotizaciones_para(
+        {s.moneda for s in solicitudes if not isinstance(s, SimulacionError)}, segmento
+    )
+
+    resultados = []
+    for indice, solicitud in enumerate(solicitudes):
+        try:
+            if isinstance(solicitud, SimulacionError):
+                raise solicitud
+            cotizacion = cotizaciones.get(solicitud.moneda)
+            if cotizacion is None and solicitud.moneda != 'PYG':
+                raise SimulacionError(f'No hay cotizaciones disponibles para la divisa {solicitud.moneda}.')
+            resultado = aplicar_cotizacion(solicitud, cotizacion, segmento)
+        except SimulacionError as e:
+            resultados.append({'indice': indice, 'success': False, 'error': str(e)})
+            continue
+        datos = resultado.como_dict()
+        del datos['segmento']
+        resultados.append({'indice': indice, 'success': True, **datos})
+
+    return JsonResponse({
+        'success': True,
+        'segmento': segmento.name,
+        'resultados': resultados,
+    }, encoder=DjangoJSONEncoder)
+
+
+def medios_del_cliente(request):
+    """
+    Medios de pago activos del cliente activo en sesión (si está asignado al
+    usuario), con ``medio_de_pago`` cargado, en una consulta.
+
+    :rtype: list
+    """
+    from clientes.models import ClienteMedioDePago
+
+    cliente_id = request.session.get('cliente_activo_id') or request.session.get('cliente_id')
+    if not cliente_id or not request.user.is_authenticated:
+        return []
+    return list(
+        ClienteMedioDePago.objects.filter(
+            cliente_id=cliente_id,
+            cliente__asignacioncliente__usuario=request.user,
+            es_activo=True,
+        ).select_related('medio_de_pago').order_by('-es_principal', '-fecha_actualizacion')
+    )
+
+
+@csrf_exempt
+@require_POST
+def calcular_inverso_api(request):
+    """
+    API endpoint para la cotización inversa: dado el monto que el cliente
+    quiere recibir, devuelve cuánto debe pagar con cada uno de sus medios de
+    pago (ver :func:`simulador.services.cotizar_inverso`).
+
+    Recibe ``{"tipo_operacion", "monto", "moneda"}`` donde ``monto`` es el
+    objetivo a recibir. Sin cliente activo se devuelve sólo la opción sin
+    comisión de medio.
+
+    :param request: El objeto HttpRequest con datos JSON en el cuerpo.
+    :type request: django.http.HttpRequest
+    :return: ``{"success", "segmento", "opciones": [...]}``
+    :rtype: django.http.JsonResponse
+    """
+    try:
+        data = json.loads(request.body)
+        solicitud = _solicitud_desde(data)
+        segmento = resolver_segmento(request.session, request.user)
+        opciones = cotizar_inverso(solicitud, segmento, medios_del_cliente(request))
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Formato JSON inválido.'}, status=400)
-    except (Divisa.DoesNotExist, ObjectDoesNotExist) as e:
-        return JsonResponse({'success': False, 'error': f'Error en la base de datos: {str(e)}'}, status=404)
-    except Exception as e:
-        print(f"Error inesperado: {str(e)}")
-        return JsonResponse({'success': False, 'error': f'Error inesperado: {str(e)}'}, status=500)
+    except SimulacionError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+
+    return JsonResponse({
+        'success': True,
+        'segmento': segmento.name,
+        'opciones': [opcion.como_dict() for opcion in opciones],
+    }, encoder=DjangoJSONEncoder)
+
+
+@csrf_exempt
+@require_POST
+def calcular_cruce_api(request):
+    """
+    API endpoint para convertir entre dos divisas extranjeras (o a lo largo
+    de una ruta de varias) en una sola llamada, pasando por el guaraní (ver
+    :func:`simulador.services.cotizar_cruce`).
+
+    Recibe ``{"origen", "destino", "monto"}`` o ``{"ruta": [...], "monto"}``,
+    con ``monto`` en la moneda de origen.
+
+    :param request: El objeto HttpRequest con datos JSON en el cuerpo.
+    :type request: django.http.HttpRequest
+    :return: ``{"success", "segmento", "ruta", "monto_resultado", "tasa_cruzada", "tramos": [...]}``
+    :rtype: django.http.JsonResponse
+    """
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise SimulacionError('Solicitud inválida.')
+        ruta = data.get('ruta') or [data.get('origen'), data.get('destino')]
+        if not isinstance(ruta, list):
+            raise SimulacionError('La ruta debe tener al menos dos monedas.')
+        try:
+            monto = Decimal(str(data.get('monto')))
+        except (InvalidOperation, ValueError, TypeError):
+            raise SimulacionError('El monto debe ser un número mayor a cero.')
+        segmento = resolver_segmento(request.session, request.user)
+        resultado = cotizar_cruce(ruta, monto, segmento)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Formato JSON inválido.'}, status=400)
+    except SimulacionError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+
+    return JsonResponse({'success': True, **resultado.como_dict()}, encoder=DjangoJSONEncoder)
+
+
+@require_GET
+def cotizaciones_json(request):
+    """
+    Cotizaciones vigentes del segmento del usuario en forma compacta (ver
+    :func:`simulador.services.feed_cotizaciones`), para que el simulador
+    calcule en el navegador y sólo consulte al servidor al confirmar.
+
+    La respuesta lleva un ETag fuerte y ``Cache-Control: private`` con
+    ``SIMULADOR_COTIZACIONES_MAX_AGE``; si el navegador revalida con
+    ``If-None-Match`` y nada cambió se responde ``304`` sin cuerpo.
+
+    :param request: El objeto HttpRequest.
+    :type request: django.http.HttpRequest
+    :rtype: django.http.HttpResponse
+    """
+    from django.conf import settings
+
+    segmento = resolver_segmento(request.session, request.user)
+    etag, cuerpo = feed_cotizaciones(segmento)
+
+    response = HttpResponse(cuerpo, content_type='application/json')
+    response['ETag'] = quote_etag(etag)
+    # Depende del segmento de la sesión: no debe guardarse en cachés compartidas.
+    patch_cache_control(response, private=True,
+                        max_age=getattr(settings, 'SIMULADOR_COTIZACIONES_MAX_AGE', 30))
+    patch_vary_headers(response, ('Cookie',))
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+def _es_staff(user):
+    return user.is_authenticated and (user.is_staff or user.is_superuser)
+
+
+@require_GET
+@user_passes_test(_es_staff)
+def estadisticas_cache_api(request):
+    """
+    Contadores de la caché de resultados del simulador en este proceso
+    (aciertos, fallos, tasa de aciertos, desalojos), para dimensionarla con
+    ``SIMULADOR_CACHE_MAXIMO`` y ``SIMULADOR_CACHE_TTL``.
+
+    Solo accesible para staff y superusuarios.
+
+    :param request: El objeto HttpRequest.
+    :type request: django.http.HttpRequest
+    :rtype: django.http.JsonResponse
+    """
+    return JsonResponse(cache_resultados().estadisticas())
+
+
+@require_GET
+@user_passes_test(_es_staff)
+def metricas_telemetria(request):
+    """
+    Métricas acumuladas por el backend de telemetría de este proceso (ver
+    :mod:`casa_de_cambios.telemetria`). Con ``BackendPrometheus`` devuelve el
+    formato de texto de Prometheus; otros backends devuelven un cuerpo vacío.
+
+    Solo accesible para staff y superusuarios.
+
+    :param request: El objeto HttpRequest.
+    :type request: django.http.HttpRequest
+    :rtype: django.http.HttpResponse
+    """
+    return HttpResponse(telemetria().exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
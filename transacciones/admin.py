@@ -1,3 +1,54 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-# Register your models here.
+from .models import Transaccion
+
+
+def _accion_cambiar_estado(nuevo_estado, descripcion):
+    """
+    Acción de admin que pasa las transacciones seleccionadas a ``nuevo_estado``
+    en bloque (ver :meth:`Transaccion.cambiar_estado_en_bloque`).
+    """
+    def accion(modeladmin, request, queryset):
+        resultado = Transaccion.cambiar_estado_en_bloque(
+            list(queryset.values_list('id', flat=True)),
+            nuevo_estado,
+            f'Cambio masivo desde el admin por {request.user}',
+            request.user,
+        )
+        if resultado['cambiadas']:
+            modeladmin.message_user(
+                request, f"{len(resultado['cambiadas'])} transacciones pasaron a {nuevo_estado}.",
+                messages.SUCCESS,
+            )
+        rechazadas = resultado['rechazadas']
+        if rechazadas:
+            detalle = ', '.join(
+                f"{r['numero_transaccion']} ({r['estado']})" for r in rechazadas[:20]
+            )
+            if len(rechazadas) > 20:
+                detalle += f' y {len(rechazadas) - 20} más'
+            modeladmin.message_user(
+                request, f'{len(rechazadas)} transacciones no admiten el cambio: {detalle}.',
+                messages.WARNING,
+            )
+
+    accion.__name__ = f'marcar_{nuevo_estado}'
+    accion.short_description = descripcion
+    return accion
+
+
+@admin.register(Transaccion)
+class TransaccionAdmin(admin.ModelAdmin):
+    list_display = ('numero_transaccion', 'tipo_operacion', 'cliente', 'divisa_origen', 'divisa_destino',
+                    'monto_origen', 'monto_destino', 'estado', 'fecha_creacion')
+    list_filter = ('estado', 'tipo_operacion', 'fecha_creacion')
+    search_fields = ('numero_transaccion', 'cliente__nombre_completo', 'cliente__cedula')
+    list_select_related = ('cliente', 'divisa_origen', 'divisa_destino')
+    readonly_fields = ('numero_transaccion', 'estado', 'reserva', 'fecha_creacion', 'fecha_actualizacion')
+    date_hierarchy = 'fecha_creacion'
+    actions = [
+        _accion_cambiar_estado('pagada', 'Marcar como pagadas'),
+        _accion_cambiar_estado('completado', 'Marcar como completadas'),
+        _accion_cambiar_estado('cancelada', 'Cancelar'),
+        _accion_cambiar_estado('anulada', 'Anular'),
+    ]
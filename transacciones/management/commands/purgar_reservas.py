@@ -0,0 +1,28 @@
+# transacciones/management/commands/purgar_reservas.py
+"""
+Purga de reservas de cotización que ya no sirven (ver
+:meth:`transacciones.models.ReservaCotizacion.purgar`)::
+
+    python manage.py purgar_reservas --dias 7
+
+Es el único camino que purga: se programa periódicamente (cron), fuera de
+las solicitudes y de la publicación de tasas.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from transacciones.models import ReservaCotizacion
+
+
+class Command(BaseCommand):
+    help = 'Borra las reservas de cotización vencidas, expiradas y las consumidas hace más de N días.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help='Días que se conservan las reservas consumidas '
+                                 '(por defecto COTIZACION_RESERVA_RETENCION_DIAS).')
+
+    def handle(self, *args, **options):
+        if options['dias'] is not None and options['dias'] < 0:
+            raise CommandError('--dias no puede ser negativo.')
+        borradas = ReservaCotizacion.purgar(retencion_dias=options['dias'])
+        self.stdout.write(f'Reservas purgadas: {borradas}')
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0002_initial'),
+        ('divisas', '0002_initial'),
+        ('transacciones', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['divisa_origen'], name='trx_pendiente_origen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['divisa_destino'], name='trx_pendiente_destino_idx'),
+        ),
+    ]
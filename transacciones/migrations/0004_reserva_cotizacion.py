@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:12
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('divisas', '0005_indice_tasa_fecha_id'),
+        ('transacciones', '0003_indices_pendientes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaCotizacion',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tipo_operacion', models.CharField(choices=[('compra', 'Compra de Divisa'), ('venta', 'Venta de Divisa')], max_length=10, verbose_name='Tipo de Operación')),
+                ('tasa', models.DecimalField(decimal_places=8, max_digits=20, verbose_name='Tasa Reservada')),
+                ('estado', models.CharField(choices=[('activa', 'Activa'), ('consumida', 'Consumida'), ('expirada', 'Expirada')], default='activa', max_length=10, verbose_name='Estado')),
+                ('creada', models.DateTimeField(auto_now_add=True, verbose_name='Creada')),
+                ('vence', models.DateTimeField(verbose_name='Vence')),
+                ('consumida_en', models.DateTimeField(blank=True, null=True, verbose_name='Consumida')),
+                ('cotizacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='divisas.cotizacionsegmento')),
+                ('divisa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_cotizacion', to='divisas.divisa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservas_cotizacion', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reserva de Cotización',
+                'verbose_name_plural': 'Reservas de Cotización',
+            },
+        ),
+        migrations.AddField(
+            model_name='transaccion',
+            name='reserva',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transaccion', to='transacciones.reservacotizacion'),
+        ),
+        migrations.AddIndex(
+            model_name='reservacotizacion',
+            index=models.Index(condition=models.Q(('estado', 'activa')), fields=['divisa'], name='reserva_activa_divisa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservacotizacion',
+            index=models.Index(condition=models.Q(('estado', 'activa')), fields=['vence'], name='reserva_activa_vence_idx'),
+        ),
+    ]
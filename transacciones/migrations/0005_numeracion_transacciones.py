@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:22
+
+from django.db import migrations, models
+
+
+def crear_secuencia(apps, schema_editor):
+    """Crea la secuencia de números (PostgreSQL) o la fila del contador."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE SEQUENCE IF NOT EXISTS transacciones_numero_seq')
+    else:
+        SecuenciaTransaccion = apps.get_model('transacciones', 'SecuenciaTransaccion')
+        SecuenciaTransaccion.objects.using(schema_editor.connection.alias).get_or_create(nombre='transacciones')
+
+
+def borrar_secuencia(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP SEQUENCE IF EXISTS transacciones_numero_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transacciones', '0004_reserva_cotizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaTransaccion',
+            fields=[
+                ('nombre', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Transacciones',
+                'verbose_name_plural': 'Secuencias de Transacciones',
+            },
+        ),
+        migrations.RunPython(crear_secuencia, borrar_secuencia),
+    ]
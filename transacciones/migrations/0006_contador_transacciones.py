@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def poblar_contadores(apps, schema_editor):
+    """Carga los contadores con una sola agregación sobre las transacciones existentes."""
+    Transaccion = apps.get_model('transacciones', 'Transaccion')
+    ContadorTransacciones = apps.get_model('transacciones', 'ContadorTransacciones')
+    ContadorTransacciones.objects.bulk_create([
+        ContadorTransacciones(tipo_operacion=fila['tipo_operacion'], estado=fila['estado'], cantidad=fila['cantidad'])
+        for fila in Transaccion.objects.order_by().values('tipo_operacion', 'estado').annotate(cantidad=Count('id'))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transacciones', '0005_numeracion_transacciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorTransacciones',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_operacion', models.CharField(choices=[('compra', 'Compra de Divisa'), ('venta', 'Venta de Divisa')], max_length=10)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('pagada', 'Pagada'), ('cancelada', 'Cancelada'), ('anulada', 'Anulada'), ('completado', 'completado')], max_length=15)),
+                ('cantidad', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador de Transacciones',
+                'verbose_name_plural': 'Contadores de Transacciones',
+                'constraints': [models.UniqueConstraint(fields=('tipo_operacion', 'estado'), name='contador_trx_tipo_estado_uniq')],
+            },
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0002_initial'),
+        ('divisas', '0005_indice_tasa_fecha_id'),
+        ('transacciones', '0006_contador_transacciones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['cliente', 'estado', 'fecha_creacion', 'id'], name='trx_cliente_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['estado', 'fecha_creacion', 'id'], name='trx_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaccion',
+            index=models.Index(fields=['tipo_operacion', 'fecha_creacion', 'id'], name='trx_tipo_fecha_idx'),
+        ),
+    ]
@@ -1,21 +1,35 @@
 # transacciones/models.py
 from django.db import models
 from django.utils import timezone
+from django.conf import settings
 import json
+import uuid
+from datetime import timedelta
 from django.core.exceptions import ValidationError
 from clientes.services import verificar_limites
-from django.db import transaction # Necesario para transacciones atómicas
+from casa_de_cambios.telemetria import medir
+from django.db import transaction, connection # Necesario para transacciones atómicas
 import logging # Para registrar la acción
 from django.db.models.signals import post_save # Para la señal
 from django.dispatch import receiver # Para la señal
 from django.db.models import Q # Para filtros complejos en la señal
+from django.db.models import Count, F
+from django.db.models.signals import post_delete
+from django.db import IntegrityError
+from collections import Counter
 from decimal import Decimal, ROUND_HALF_UP
 
 # ASUMIDO: Divisa y CotizacionSegmento están disponibles en la app 'divisas'
 from divisas.models import CotizacionSegmento # Importar el modelo de tasa
+from divisas.signals import cotizaciones_publicadas
 
 logger = logging.getLogger(__name__)
 
+
+class TransicionInvalida(ValidationError):
+    """El estado actual de la transacción no admite el cambio pedido."""
+
+
 class Transaccion(models.Model):
     """
     Modelo principal para las transacciones de compra y venta de divisas
@@ -33,6 +47,19 @@ class Transaccion(models.Model):
         ('completado', 'completado'),
     ]
 
+    # Estados a los que se puede pasar desde cada estado (ver transicionar).
+    # Como siempre, cualquier estado puede pasar a cualquier otro, incluso a
+    # sí mismo (queda en el historial); 'a_retirar' es un estado heredado (sin
+    # choice) que se acepta sólo como origen.
+    TRANSICIONES = {
+        'pendiente': {'pendiente', 'pagada', 'cancelada', 'anulada', 'completado'},
+        'pagada': {'pendiente', 'pagada', 'cancelada', 'anulada', 'completado'},
+        'cancelada': {'pendiente', 'pagada', 'cancelada', 'anulada', 'completado'},
+        'anulada': {'pendiente', 'pagada', 'cancelada', 'anulada', 'completado'},
+        'completado': {'pendiente', 'pagada', 'cancelada', 'anulada', 'completado'},
+        'a_retirar': {'pendiente', 'pagada', 'cancelada', 'anulada', 'completado'},
+    }
+
     # Identificación de la transacción
     numero_transaccion = models.CharField(
         'Número de Transacción', 
@@ -129,6 +156,15 @@ class Transaccion(models.Model):
         related_name='transacciones_procesadas'
     )
 
+    # Reserva de cotización consumida al crear la transacción (tasa bloqueada)
+    reserva = models.OneToOneField(
+        'ReservaCotizacion',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='transaccion'
+    )
+
     class Meta:
         verbose_name = 'Transacción'
         verbose_name_plural = 'Transacciones'
@@ -138,6 +174,17 @@ class Transaccion(models.Model):
             models.Index(fields=['tipo_operacion', 'estado']),
             models.Index(fields=['numero_transaccion']),
             models.Index(fields=['fecha_creacion']),
+            # Historiales paginados por cursor sobre (fecha_creacion, id)
+            # (casa_de_cambios.paginacion) con los filtros que se usan juntos
+            models.Index(fields=['cliente', 'estado', 'fecha_creacion', 'id'], name='trx_cliente_estado_fecha_idx'),
+            models.Index(fields=['estado', 'fecha_creacion', 'id'], name='trx_estado_fecha_idx'),
+            models.Index(fields=['tipo_operacion', 'fecha_creacion', 'id'], name='trx_tipo_fecha_idx'),
+            # Índices parciales para la cancelación por tasa: sólo cubren las
+            # filas pendientes, así que no crecen con el historial.
+            models.Index(fields=['divisa_origen'], condition=Q(estado='pendiente'),
+                         name='trx_pendiente_origen_idx'),
+            models.Index(fields=['divisa_destino'], condition=Q(estado='pendiente'),
+                         name='trx_pendiente_destino_idx'),
         ]
 
     def redondear_monto(self, monto, codigo_divisa):
@@ -220,27 +267,35 @@ class Transaccion(models.Model):
         if errors:
             raise ValidationError(errors)
 
+    @medir('transaccion.guardar')
     def save(self, *args, **kwargs):
-        print(">>> Entrando en save() de Transaccion")
-        
-        # Aplicar redondeo antes de cualquier validación
-        self.aplicar_redondeo_montos()
-        
-        try:
-            self.full_clean()  # 👈 esto llama a clean()
-        except ValidationError as e:
-            raise
+        # Las escrituras parciales (update_fields) no tocan montos ni divisas:
+        # no se redondea ni se valida de nuevo (full_clean consulta las FKs).
+        if self._state.adding or kwargs.get('update_fields') is None:
+            # Aplicar redondeo antes de cualquier validación
+            self.aplicar_redondeo_montos()
+
+            try:
+                self.full_clean()  # 👈 esto llama a clean()
+            except ValidationError as e:
+                raise
         
         if not self.numero_transaccion:
             self.numero_transaccion = self._generate_transaction_number()
         
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+
+        # Alta: el contador de estadísticas se actualiza en la misma transacción
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            ContadorTransacciones.sumar({(self.tipo_operacion, self.estado): 1})
 
     def _generate_transaction_number(self):
-        """Generar número único de transacción"""
-        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-        prefix = 'TRX'
-        return f"{prefix}{timestamp}"
+        """Generar número único de transacción (ver :mod:`transacciones.numeracion`)"""
+        from .numeracion import siguiente_numero
+        return siguiente_numero(self._state.db or 'default')
 
     def __str__(self):
         return f"{self.numero_transaccion} - {self.cliente.nombre_completo} - {self.get_tipo_operacion_display()}"
@@ -265,6 +320,13 @@ class Transaccion(models.Model):
         """True si la transacción puede anularse"""
         return self.estado in ['pagada', 'a_retirar']
 
+    @property
+    def estados_siguientes(self):
+        """``(valor, etiqueta)`` de los estados a los que puede pasar, sin el actual"""
+        siguientes = self.TRANSICIONES.get(self.estado, ())
+        return [(valor, etiqueta) for valor, etiqueta in self.ESTADO_CHOICES
+                if valor in siguientes and valor != self.estado]
+
     def get_medio_pago_info(self):
         """Obtener información del medio de pago de forma segura"""
         try:
@@ -279,34 +341,177 @@ class Transaccion(models.Model):
         else:
             self.medio_pago_datos = {}
 
+    @classmethod
+    def transicionar(cls, ids, nuevo_estado, observacion='', usuario=None, desde=None, anotar=True):
+        """
+        Cambia de estado varias transacciones sin cargarlas ni validarlas.
+
+        Por cada estado de origen permitido (ver ``TRANSICIONES``, restringido
+        a ``desde`` si se indica) ejecuta un
+        ``UPDATE ... WHERE estado=<origen> AND id IN (...) RETURNING``: sólo
+        cambian las filas que siguen en ese estado, así que dos cambios
+        concurrentes no pisan el uno al otro. El historial se inserta en bloque
+        dentro de la misma transacción de base de datos, junto con
+        :class:`ContadorTransacciones`.
+
+        :param ids: Ids de las transacciones.
+        :type ids: list
+        :param nuevo_estado: Estado destino.
+        :type nuevo_estado: str
+        :param observacion: Motivo; queda en ``observacion``, en
+            ``observaciones`` (con fecha, si ``anotar``) y en el historial.
+        :type observacion: str
+        :param usuario: Usuario que hace el cambio (opcional).
+        :param desde: Estados de origen esperados (p. ej. el estado que se leyó
+            de la fila); las transacciones en otro estado no cambian.
+        :type desde: list | None
+        :param anotar: Si es ``False`` no se agrega la nota a
+            ``observaciones`` (como en las cancelaciones automáticas, ver
+            :func:`cancelar_pendientes_por_divisa`).
+        :type anotar: bool
+        :raises ValidationError: Si ``nuevo_estado`` no es un estado válido.
+        :return: ``{id: (estado_anterior, numero_transaccion)}`` de las
+            transacciones que cambiaron.
+        :rtype: dict
+        """
+        if nuevo_estado not in dict(cls.ESTADO_CHOICES):
+            raise ValidationError(f'Estado "{nuevo_estado}" no es válido')
+
+        ids = list(dict.fromkeys(ids))
+        origenes = sorted(
+            origen for origen, destinos in cls.TRANSICIONES.items()
+            if nuevo_estado in destinos and (desde is None or origen in desde)
+        )
+        if not ids or not origenes:
+            return {}
+
+        ahora = timezone.now()
+        nota = f"[{ahora}] {observacion}" if observacion else ''
+        tabla = connection.ops.quote_name(cls._meta.db_table)
+        asignaciones = ['estado = %s', 'fecha_actualizacion = %s']
+        valores = [nuevo_estado, ahora]
+        if observacion:
+            asignaciones.append('observacion = %s')
+            valores.append(observacion)
+        if observacion and anotar:
+            asignaciones.append(
+                "observaciones = CASE WHEN observaciones = '' THEN %s ELSE observaciones || %s END")
+            valores += [nota, f"\n{nota}"]
+
+        cambiadas = {}
+        deltas = Counter()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for origen in origenes:
+                    for inicio in range(0, len(ids), 500):
+                        lote = ids[inicio:inicio + 500]
+                        cursor.execute(
+                            f"""
+                            UPDATE {tabla}
+                               SET {', '.join(asignaciones)}
+                             WHERE estado = %s
+                               AND id IN ({', '.join(['%s'] * len(lote))})
+                            RETURNING id, numero_transaccion, tipo_operacion
+                            """,
+                            [*valores, origen, *lote],
+                        )
+                        for trx_id, numero, tipo in cursor.fetchall():
+                            cambiadas[trx_id] = (origen, numero)
+                            deltas[(tipo, origen)] -= 1
+                            deltas[(tipo, nuevo_estado)] += 1
+
+            HistorialTransaccion.objects.bulk_create([
+                HistorialTransaccion(
+                    transaccion_id=trx_id,
+                    estado_anterior=origen,
+                    estado_nuevo=nuevo_estado,
+                    observaciones=observacion or f'Cambio de estado de {origen} a {nuevo_estado}',
+                    modificado_por=usuario,
+                )
+                for trx_id, (origen, _) in cambiadas.items()
+            ])
+            ContadorTransacciones.sumar(deltas)
+
+        return cambiadas
+
+    @classmethod
+    def cambiar_estado_en_bloque(cls, ids, nuevo_estado, observacion='', usuario=None):
+        """
+        Cambia de estado un conjunto de transacciones (ver :meth:`transicionar`)
+        e informa qué pasó con cada una de las que no cambiaron.
+
+        :param ids: Ids de las transacciones.
+        :type ids: list
+        :param nuevo_estado: Estado destino.
+        :type nuevo_estado: str
+        :param observacion: Motivo del cambio.
+        :type observacion: str
+        :param usuario: Usuario que hace el cambio (opcional).
+        :raises ValidationError: Si ``nuevo_estado`` no es un estado válido.
+        :return: ``{"cambiadas": [numero, ...], "rechazadas": [{"id",
+            "numero_transaccion", "estado", "motivo"}, ...]}``
+        :rtype: dict
+        """
+        ids = list(dict.fromkeys(ids))
+        with transaction.atomic():
+            # Las que ya están en el destino se informan en lugar de repetir el cambio
+            origenes = [estado for estado in cls.TRANSICIONES if estado != nuevo_estado]
+            cambiadas = cls.transicionar(ids, nuevo_estado, observacion, usuario, desde=origenes)
+            restantes = [trx_id for trx_id in ids if trx_id not in cambiadas]
+            actuales = {
+                trx_id: (numero, estado)
+                for trx_id, numero, estado in cls.objects.filter(pk__in=restantes)
+                .values_list('id', 'numero_transaccion', 'estado')
+            } if restantes else {}
+
+        destino = dict(cls.ESTADO_CHOICES)[nuevo_estado]
+        etiquetas = dict(cls.ESTADO_CHOICES)
+        rechazadas = []
+        for trx_id in restantes:
+            if trx_id not in actuales:
+                rechazadas.append({'id': trx_id, 'numero_transaccion': None, 'estado': None,
+                                   'motivo': 'No existe'})
+                continue
+            numero, estado = actuales[trx_id]
+            rechazadas.append({
+                'id': trx_id,
+                'numero_transaccion': numero,
+                'estado': estado,
+                'motivo': f'Ya está en {destino}' if estado == nuevo_estado
+                else f'No se puede pasar de {etiquetas.get(estado, estado)} a {destino}',
+            })
+        return {
+            'cambiadas': [numero for _, numero in cambiadas.values()],
+            'rechazadas': rechazadas,
+        }
+
     def cambiar_estado(self, nuevo_estado, observacion=None, usuario=None):
         """
-        Cambiar el estado de la transacción con validaciones
+        Cambiar el estado de la transacción con validaciones (ver
+        :meth:`transicionar`). No vuelve a validar ni guardar la fila entera.
+
+        :raises TransicionInvalida: Si el estado actual no admite el cambio o
+            la transacción cambió de estado en otra solicitud.
         """
         estados_validos = dict(self.ESTADO_CHOICES).keys()
         
         if nuevo_estado not in estados_validos:
             raise ValidationError(f'Estado "{nuevo_estado}" no es válido')
 
-        estado_anterior = self.estado
-        self.estado = nuevo_estado
-        
-        if observacion:
-            if self.observaciones:
-                self.observaciones += f"\n[{timezone.now()}] {observacion}"
-            else:
-                self.observaciones = f"[{timezone.now()}] {observacion}"
-
-        # Crear historial del cambio
-        HistorialTransaccion.objects.create(
-            transaccion=self,
-            estado_anterior=estado_anterior,
-            estado_nuevo=nuevo_estado,
-            observaciones=observacion or f'Cambio de estado de {estado_anterior} a {nuevo_estado}',
-            modificado_por=usuario
-        )
+        if nuevo_estado not in self.TRANSICIONES.get(self.estado, ()):
+            raise TransicionInvalida(
+                f'No se puede pasar de {self.get_estado_display()} a {dict(self.ESTADO_CHOICES)[nuevo_estado]}'
+            )
+
+        # Sólo cambia si la fila sigue en el estado que tiene esta instancia
+        cambiadas = self.transicionar([self.pk], nuevo_estado, observacion or '', usuario, desde=[self.estado])
+        if self.pk not in cambiadas:
+            self.refresh_from_db(fields=['estado', 'observacion', 'observaciones', 'fecha_actualizacion'])
+            raise TransicionInvalida(
+                f'La transacción {self.numero_transaccion} cambió a {self.get_estado_display()} mientras tanto'
+            )
 
-        self.save()
+        self.refresh_from_db(fields=['estado', 'observacion', 'observaciones', 'fecha_actualizacion'])
 
     def get_comision_aplicada(self):
         """Obtener la comisión aplicada desde los datos del medio de pago"""
@@ -350,26 +555,16 @@ class Transaccion(models.Model):
         if self.estado != 'pendiente':
             return False
 
-        estado_anterior = self.estado
         observacion_completa = f"CANCELACIÓN AUTOMÁTICA POR TASA: {razon}"
 
         with transaction.atomic():
-            self.estado = 'cancelada' # Usar 'cancelada'
-            self.observacion = f"CANCELACIÓN AUTOMÁTICA POR TASA: {razon}"
-
-            # Solo actualizar los campos modificados
-            self.save(update_fields=['estado', 'observacion'])
-
-             # 💡 PASO CLAVE: Crear el registro de historial con el motivo
-            HistorialTransaccion.objects.create(
-                transaccion=self,
-                fecha_cambio=timezone.now(),
-                estado_anterior=estado_anterior,
-                estado_nuevo=self.estado,
-                observaciones=observacion_completa,
-                # El campo 'usuario' puede ser nulo o apuntar a un usuario de sistema
-                modificado_por=None,
-            )
+            # Sólo cambia si sigue pendiente; el historial se escribe en la misma
+            # transacción. Como en la cancelación en bloque, sólo se toca 'observacion'.
+            if self.pk not in self.transicionar([self.pk], 'cancelada', observacion_completa,
+                                                desde=['pendiente'], anotar=False):
+                return False
+            self.estado = 'cancelada'
+            self.observacion = observacion_completa
 
             # Enviar notificación (ver helper abajo)
             self._enviar_notificacion_cancelacion(razon)
@@ -378,6 +573,283 @@ class Transaccion(models.Model):
 
             return True
 
+class ReservaVencida(Exception):
+    """La reserva de cotización no existe, venció, fue usada o expiró por una nueva tasa."""
+
+
+class ReservaCotizacion(models.Model):
+    """
+    Reserva de corta duración de una cotización: bloquea la tasa simulada
+    durante ``COTIZACION_RESERVA_SEGUNDOS`` para que la transacción se cree con
+    ella. Al crear la transacción se consume en una sola sentencia
+    condicional; al publicarse una tasa nueva se expiran en bloque las
+    reservas activas de la divisa, sin tocar transacciones.
+    """
+    ESTADO_CHOICES = [
+        ('activa', 'Activa'),
+        ('consumida', 'Consumida'),
+        ('expirada', 'Expirada'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    cotizacion = models.ForeignKey(
+        CotizacionSegmento,
+        on_delete=models.CASCADE,
+        related_name='reservas'
+    )
+
+    divisa = models.ForeignKey(
+        'divisas.Divisa',
+        on_delete=models.CASCADE,
+        related_name='reservas_cotizacion'
+    )
+
+    tipo_operacion = models.CharField(
+        'Tipo de Operación',
+        max_length=10,
+        choices=Transaccion.TIPO_OPERACION_CHOICES
+    )
+
+    tasa = models.DecimalField('Tasa Reservada', max_digits=20, decimal_places=8)
+
+    usuario = models.ForeignKey(
+        'users.CustomUser',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reservas_cotizacion'
+    )
+
+    estado = models.CharField('Estado', max_length=10, choices=ESTADO_CHOICES, default='activa')
+    creada = models.DateTimeField('Creada', auto_now_add=True)
+    vence = models.DateTimeField('Vence')
+    consumida_en = models.DateTimeField('Consumida', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Reserva de Cotización'
+        verbose_name_plural = 'Reservas de Cotización'
+        indexes = [
+            # Sólo las reservas activas se buscan (expiración en bloque y
+            # purga); las consumidas quedan como historial sin costo de índice.
+            models.Index(fields=['divisa'], condition=Q(estado='activa'),
+                         name='reserva_activa_divisa_idx'),
+            models.Index(fields=['vence'], condition=Q(estado='activa'),
+                         name='reserva_activa_vence_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.pk} - {self.divisa_id} {self.tipo_operacion} @ {self.tasa} ({self.estado})"
+
+    @property
+    def vigente(self):
+        """True si la reserva sigue activa y no venció."""
+        return self.estado == 'activa' and self.vence > timezone.now()
+
+    @classmethod
+    def reservar(cls, cotizacion, tipo_operacion, tasa, usuario=None, segundos=None):
+        """
+        Crea una reserva activa para la cotización y la tasa dadas.
+
+        :param cotizacion: Cotización usada en la simulación.
+        :type cotizacion: divisas.models.CotizacionSegmento
+        :param tipo_operacion: ``'compra'`` o ``'venta'``.
+        :type tipo_operacion: str
+        :param tasa: Tasa aplicada que queda bloqueada.
+        :type tasa: Decimal
+        :param segundos: Vigencia; por defecto ``COTIZACION_RESERVA_SEGUNDOS``.
+        :type segundos: int
+        :rtype: ReservaCotizacion
+        """
+        if segundos is None:
+            segundos = getattr(settings, 'COTIZACION_RESERVA_SEGUNDOS', 120)
+        usuario = usuario if getattr(usuario, 'is_authenticated', False) else None
+        return cls.objects.create(
+            cotizacion=cotizacion,
+            divisa_id=cotizacion.divisa_id,
+            tipo_operacion=tipo_operacion,
+            tasa=tasa,
+            usuario=usuario,
+            vence=timezone.now() + timedelta(seconds=segundos),
+        )
+
+    @classmethod
+    def consumir(cls, reserva_id, divisa_code, tipo_operacion):
+        """
+        Marca la reserva como consumida si sigue vigente y corresponde a la
+        divisa y operación. Es un único ``UPDATE`` condicional: dos intentos
+        concurrentes no pueden consumir la misma reserva. Debe llamarse dentro
+        de la misma transacción que crea la :class:`Transaccion`.
+
+        :raises ReservaVencida: Si la reserva no se pudo consumir.
+        :rtype: ReservaCotizacion
+        """
+        ahora = timezone.now()
+        try:
+            consumidas = cls.objects.filter(
+                pk=reserva_id,
+                estado='activa',
+                vence__gt=ahora,
+                divisa__code__iexact=divisa_code,
+                tipo_operacion=tipo_operacion,
+            ).update(estado='consumida', consumida_en=ahora)
+        except (ValueError, ValidationError):
+            consumidas = 0
+        if not consumidas:
+            raise ReservaVencida(
+                'La cotización reservada venció o fue actualizada. Por favor, vuelva a simular la operación.'
+            )
+        return cls.objects.get(pk=reserva_id)
+
+    @classmethod
+    def expirar_por_divisa(cls, divisa):
+        """
+        Expira en una sola sentencia las reservas activas de la divisa.
+
+        :return: Cantidad de reservas expiradas.
+        :rtype: int
+        """
+        return cls.objects.filter(divisa=divisa, estado='activa').update(estado='expirada')
+
+    @classmethod
+    def purgar(cls, antes_de=None, retencion_dias=None, lote=1000):
+        """
+        Borra las reservas no consumidas vencidas o expiradas y las consumidas
+        hace más de ``retencion_dias``. La transacción conserva la tasa
+        aplicada; su referencia a la reserva queda en ``NULL``. Las reservas de
+        transacciones todavía pendientes no se tocan: sin reserva, la próxima
+        publicación de tasa las cancelaría.
+
+        Borra por lotes de ``lote`` ids, sin cargar las reservas. Se ejecuta
+        con el comando ``purgar_reservas``.
+
+        :param antes_de: Momento de referencia (por defecto, ahora).
+        :type antes_de: datetime
+        :param retencion_dias: Días que se conservan las reservas consumidas;
+            por defecto ``COTIZACION_RESERVA_RETENCION_DIAS``.
+        :type retencion_dias: int
+        :param lote: Reservas borradas por sentencia.
+        :type lote: int
+        :return: Cantidad de reservas borradas.
+        :rtype: int
+        """
+        antes_de = antes_de or timezone.now()
+        if retencion_dias is None:
+            retencion_dias = getattr(settings, 'COTIZACION_RESERVA_RETENCION_DIAS', 7)
+        candidatas = cls.objects.filter(
+            Q(estado='expirada')
+            | Q(estado='activa', vence__lte=antes_de)
+            | Q(estado='consumida', consumida_en__lte=antes_de - timedelta(days=retencion_dias))
+        ).exclude(transaccion__estado='pendiente')
+
+        borradas = 0
+        while True:
+            ids = list(candidatas.values_list('pk', flat=True)[:lote])
+            if not ids:
+                return borradas
+            with transaction.atomic():
+                # SET_NULL a mano (como haría el ORM) y DELETE directo, sin
+                # cargar filas; sólo se borran las que quedaron sin transacción.
+                Transaccion.objects.filter(reserva_id__in=ids).exclude(estado='pendiente').update(reserva=None)
+                sueltas = cls.objects.filter(pk__in=ids, transaccion__isnull=True)
+                borradas += sueltas._raw_delete(sueltas.db)
+
+
+class ContadorTransacciones(models.Model):
+    """
+    Cantidad de transacciones por tipo de operación y estado, mantenida en
+    cada alta (:meth:`Transaccion.save`), cambio de estado
+    (:meth:`Transaccion.transicionar`, :func:`cancelar_pendientes_por_divisa`)
+    y borrado, para que las estadísticas globales no recorran la tabla de
+    transacciones. :meth:`recalcular` la reconstruye desde cero.
+    """
+    tipo_operacion = models.CharField(max_length=10, choices=Transaccion.TIPO_OPERACION_CHOICES)
+    estado = models.CharField(max_length=15, choices=Transaccion.ESTADO_CHOICES)
+    cantidad = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Contador de Transacciones'
+        verbose_name_plural = 'Contadores de Transacciones'
+        constraints = [
+            models.UniqueConstraint(fields=['tipo_operacion', 'estado'], name='contador_trx_tipo_estado_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo_operacion}/{self.estado}: {self.cantidad}"
+
+    @classmethod
+    def sumar(cls, deltas):
+        """
+        Aplica incrementos con ``UPDATE ... SET cantidad = cantidad + n``.
+
+        :param deltas: ``{(tipo_operacion, estado): n}``; se ignoran los ceros.
+        :type deltas: dict
+        """
+        for (tipo, estado), delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            fila = cls.objects.filter(tipo_operacion=tipo, estado=estado)
+            if not fila.update(cantidad=F('cantidad') + delta):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(tipo_operacion=tipo, estado=estado, cantidad=delta)
+                except IntegrityError:
+                    # Otra solicitud creó la fila entre el UPDATE y el INSERT
+                    fila.update(cantidad=F('cantidad') + delta)
+
+    @classmethod
+    def recalcular(cls):
+        """
+        Reconstruye los contadores con una sola agregación sobre las
+        transacciones.
+        """
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create([
+                cls(tipo_operacion=fila['tipo_operacion'], estado=fila['estado'], cantidad=fila['cantidad'])
+                for fila in Transaccion.objects.order_by()
+                .values('tipo_operacion', 'estado').annotate(cantidad=Count('id'))
+            ])
+
+    @classmethod
+    def resumen(cls):
+        """
+        Totales para el tablero del historial administrativo, leídos de los
+        contadores (una consulta sobre a lo sumo una fila por tipo y estado).
+
+        :return: ``{"total", "compras", "ventas", "pendientes", "pagadas"}``
+        :rtype: dict
+        """
+        resumen = {'total': 0, 'compras': 0, 'ventas': 0, 'pendientes': 0, 'pagadas': 0}
+        for tipo, estado, cantidad in cls.objects.values_list('tipo_operacion', 'estado', 'cantidad'):
+            resumen['total'] += cantidad
+            resumen['compras' if tipo == 'compra' else 'ventas'] += cantidad
+            if estado == 'pendiente':
+                resumen['pendientes'] += cantidad
+            elif estado == 'pagada':
+                resumen['pagadas'] += cantidad
+        return resumen
+
+
+class SecuenciaTransaccion(models.Model):
+    """
+    Contador de números de transacción para motores sin secuencias nativas
+    (ver :mod:`transacciones.numeracion`). En PostgreSQL se usa la secuencia
+    ``transacciones_numero_seq`` y esta tabla queda sin uso.
+    """
+    TRANSACCIONES = 'transacciones'
+
+    nombre = models.CharField(max_length=50, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Secuencia de Transacciones'
+        verbose_name_plural = 'Secuencias de Transacciones'
+
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
+
 # ... (El resto del código de HistorialTransaccion, ConfiguracionTransaccion y señales permanece igual)
 
 class HistorialTransaccion(models.Model):
@@ -510,31 +982,113 @@ class ConfiguracionTransaccion(models.Model):
 # --- SEÑAL PARA CANCELACIÓN AUTOMÁTICA DE TRANSACCIONES ---
 # ----------------------------------------------------------------------
 
-@receiver(post_save, sender=CotizacionSegmento)
-def cancelar_transacciones_pendientes_por_tasa(sender, instance, created, **kwargs):
-    """
-    Se ejecuta CADA VEZ que se guarda una CotizacionSegmento.
-    Busca transacciones pendientes con la misma divisa y las cancela.
+def cancelar_pendientes_por_divisa(divisa_actualizada, razon_cancelacion):
     """
+    Cancela en una sola pasada las transacciones PENDIENTES que involucran a la
+    divisa actualizada. Las creadas a partir de una :class:`ReservaCotizacion`
+    conservan la tasa reservada y no se cancelan.
+
+    Usa un único ``UPDATE ... WHERE estado='pendiente' RETURNING`` (el filtro
+    por estado hace que dos publicaciones concurrentes no cancelen dos veces la
+    misma fila), inserta el historial en bloque y encola las notificaciones
+    para después del commit. El costo crece con la cantidad de transacciones
+    afectadas, no con la cantidad de segmentos.
 
-    # 1. Validación de la divisa base
+    :return: Lista de ``(id, numero_transaccion)`` canceladas.
+    :rtype: list
+    """
     # Si la cotización actualizada es del Guaraní (PYG o código '116'), no hacemos nada.
-    if instance.divisa.code in ['PYG', '116']:
-         return
+    if divisa_actualizada.code in ['PYG', '116']:
+        return []
+
+    observacion_completa = f"CANCELACIÓN AUTOMÁTICA POR TASA: {razon_cancelacion}"
+    tabla = connection.ops.quote_name(Transaccion._meta.db_table)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {tabla}
+                   SET estado = %s, observacion = %s, fecha_actualizacion = %s
+                 WHERE estado = %s
+                   AND reserva_id IS NULL
+                   AND (divisa_origen_id = %s OR divisa_destino_id = %s)
+                RETURNING id, numero_transaccion, tipo_operacion
+                """,
+                ['cancelada', observacion_completa, timezone.now(),
+                 'pendiente', divisa_actualizada.pk, divisa_actualizada.pk],
+            )
+            filas = cursor.fetchall()
+
+        if not filas:
+            return []
 
-    divisa_actualizada = instance.divisa
+        canceladas = [(trx_id, numero) for trx_id, numero, _ in filas]
+        deltas = Counter()
+        for _, _, tipo in filas:
+            deltas[(tipo, 'pendiente')] -= 1
+            deltas[(tipo, 'cancelada')] += 1
+        ContadorTransacciones.sumar(deltas)
+
+        HistorialTransaccion.objects.bulk_create([
+            HistorialTransaccion(
+                transaccion_id=trx_id,
+                estado_anterior='pendiente',
+                estado_nuevo='cancelada',
+                observaciones=observacion_completa,
+                modificado_por=None,
+            )
+            for trx_id, _ in canceladas
+        ])
+
+        ids = [trx_id for trx_id, _ in canceladas]
+        transaction.on_commit(lambda: _notificar_cancelaciones(ids, razon_cancelacion))
+
+    logger.info(
+        f"{len(canceladas)} transacciones canceladas automáticamente por: {razon_cancelacion}"
+    )
+    return canceladas
+
+
+def _notificar_cancelaciones(ids, razon):
+    """
+    Envía (simula) las notificaciones de cancelación una vez confirmada la
+    transacción, cargando todas las transacciones en una sola consulta.
+    """
+    for trx in Transaccion.objects.filter(pk__in=ids).select_related('cliente'):
+        trx._enviar_notificacion_cancelacion(razon)
 
-    # 2. Encontrar transacciones PENDIENTES afectadas
-    transacciones_a_cancelar = Transaccion.objects.filter(
-        Q(divisa_origen=divisa_actualizada) | Q(divisa_destino=divisa_actualizada),
-        estado='pendiente'
-    ).select_related('cliente', 'divisa_origen', 'divisa_destino')
 
+@receiver(post_save, sender=CotizacionSegmento)
+def cancelar_transacciones_pendientes_por_tasa(sender, instance, created, **kwargs):
+    """
+    Se ejecuta CADA VEZ que se guarda una CotizacionSegmento individual.
+    Expira las reservas activas de la divisa y cancela las transacciones
+    pendientes sin reserva.
+    """
+    ReservaCotizacion.expirar_por_divisa(instance.divisa)
     razon_cancelacion = (
-        f"Cotización de {divisa_actualizada.code} ha sido actualizada en el sistema. "
+        f"Cotización de {instance.divisa.code} ha sido actualizada en el sistema. "
         f"(Segmento: {instance.segmento.name})"
     )
+    cancelar_pendientes_por_divisa(instance.divisa, razon_cancelacion)
+
+
+@receiver(cotizaciones_publicadas)
+def cancelar_transacciones_por_publicacion(sender, divisa, tasa, cotizaciones, **kwargs):
+    """
+    Se ejecuta UNA VEZ por publicación en bloque de cotizaciones (todos los
+    segmentos de una divisa), en lugar de una vez por fila.
+    """
+    ReservaCotizacion.expirar_por_divisa(divisa)
+    razon_cancelacion = (
+        f"Cotización de {divisa.code} ha sido actualizada en el sistema. "
+        f"(Segmentos: {len(cotizaciones)})"
+    )
+    cancelar_pendientes_por_divisa(divisa, razon_cancelacion)
+
 
-    # 3. Cancelar cada transacción
-    for transaccion in transacciones_a_cancelar:
-        transaccion.cancelar_automaticamente(razon=razon_cancelacion)
\ No newline at end of file
+@receiver(post_delete, sender=Transaccion)
+def descontar_transaccion_borrada(sender, instance, **kwargs):
+    """Mantiene :class:`ContadorTransacciones` al borrar transacciones."""
+    ContadorTransacciones.sumar({(instance.tipo_operacion, instance.estado): -1})
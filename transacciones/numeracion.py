@@ -0,0 +1,131 @@
+# transacciones/numeracion.py
+"""
+Numeración de transacciones sin colisiones.
+
+Los números tienen la forma ``TRX`` + fecha local (``AAAAMMDD``) + un
+correlativo global de 9 dígitos, p. ej. ``TRX20261017000004217``. El
+correlativo no depende del reloj, así que dos transacciones creadas en el
+mismo segundo (o en procesos distintos) nunca comparten número.
+
+Cada proceso reserva los correlativos por bloques de
+``TRANSACCION_NUMERO_BLOQUE`` para no ir a la base en cada transacción:
+
+* En PostgreSQL salen de la secuencia ``transacciones_numero_seq``. ``nextval``
+  no participa de la transacción que lo llama, así que un bloque reservado
+  nunca vuelve a entregarse aunque esa transacción se revierta.
+* En otros motores salen de la fila de :class:`SecuenciaTransaccion`,
+  incrementada dentro de la transacción en curso, de a uno: si la
+  transacción se revierte, el número vuelve a estar libre junto con la
+  transacción que lo usaba.
+
+Dentro de un proceso los números son crecientes; entre procesos sólo se
+garantiza que son únicos.
+"""
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+SECUENCIA_PG = 'transacciones_numero_seq'
+PREFIJO = 'TRX'
+DIGITOS = 9
+
+
+def formatear_numero(correlativo, fecha=None):
+    """
+    Arma el número de transacción visible.
+
+    :param correlativo: Valor de la secuencia.
+    :type correlativo: int
+    :param fecha: Fecha del número (por defecto, hoy en la zona local).
+    :type fecha: datetime.date | None
+    :rtype: str
+    """
+    fecha = fecha or timezone.localdate()
+    return f'{PREFIJO}{fecha:%Y%m%d}{correlativo % 10 ** DIGITOS:0{DIGITOS}d}'
+
+
+class Numerador:
+    """
+    Entrega correlativos únicos, reservados por bloques.
+
+    :param bloque: Correlativos reservados por viaje a la base (PostgreSQL).
+    :type bloque: int
+    """
+
+    def __init__(self, bloque):
+        self.bloque = max(1, bloque)
+        self._pendientes = deque()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def siguiente(self, using='default'):
+        """
+        Próximo correlativo de este proceso.
+
+        :param using: Alias de la base de datos.
+        :type using: str
+        :rtype: int
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # Proceso hijo (fork): el bloque heredado también lo tiene el padre.
+                self._pendientes.clear()
+                self._pid = os.getpid()
+            if not self._pendientes:
+                self._pendientes.extend(self._reservar(using))
+            return self._pendientes.popleft()
+
+    def _reservar(self, using):
+        conexion = connections[using]
+        if conexion.vendor == 'postgresql':
+            with conexion.cursor() as cursor:
+                cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [SECUENCIA_PG, self.bloque])
+                return sorted(fila[0] for fila in cursor.fetchall())
+        return [self._reservar_en_tabla(using)]
+
+    @staticmethod
+    def _reservar_en_tabla(using):
+        from .models import SecuenciaTransaccion
+
+        secuencias = SecuenciaTransaccion.objects.using(using).filter(nombre=SecuenciaTransaccion.TRANSACCIONES)
+        with transaction.atomic(using=using):
+            # El UPDATE toma el bloqueo de escritura antes de leer el valor.
+            if not secuencias.update(valor=F('valor') + 1):
+                SecuenciaTransaccion.objects.using(using).get_or_create(nombre=SecuenciaTransaccion.TRANSACCIONES)
+                secuencias.update(valor=F('valor') + 1)
+            return secuencias.values_list('valor', flat=True).get()
+
+
+_lock = threading.Lock()
+_numerador = None
+
+
+def numerador():
+    """
+    Numerador del proceso, creado con ``TRANSACCION_NUMERO_BLOQUE`` la primera
+    vez que se usa.
+
+    :rtype: Numerador
+    """
+    global _numerador
+    if _numerador is None:
+        with _lock:
+            if _numerador is None:
+                _numerador = Numerador(getattr(settings, 'TRANSACCION_NUMERO_BLOQUE', 100))
+    return _numerador
+
+
+def siguiente_numero(using='default'):
+    """
+    Próximo número de transacción (ver :func:`formatear_numero`).
+
+    :param using: Alias de la base de datos.
+    :type using: str
+    :rtype: str
+    """
+    return formatear_numero(numerador().siguiente(using))
@@ -1,5 +1,6 @@
 from decimal import Decimal
-from django.test import TestCase, Client
+import json
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from transacciones.models import Transaccion, HistorialTransaccion
@@ -78,11 +79,94 @@ class TransaccionesModelsTest(TestCase):
                          f"❌ Estado esperado='cancelada', obtenido='{t.estado}'")
         self.assertIn("CANCELACIÓN AUTOMÁTICA", t.observacion,
                       f"❌ Observación inválida: {t.observacion}")
+        self.assertEqual(t.observaciones, "",
+                         "❌ Como la cancelación en bloque, sólo debería escribirse 'observacion'")
         self.assertTrue(
             HistorialTransaccion.objects.filter(transaccion=t, estado_nuevo="cancelada").exists(),
             "❌ No se encontró historial con estado_nuevo='cancelada'"
         )
 
+    def _transaccion(self, estado="pendiente"):
+        return Transaccion.objects.create(
+            tipo_operacion="venta",
+            cliente=self.cliente,
+            divisa_origen=self.divisa_usd,
+            divisa_destino=self.divisa_pyg,
+            monto_origen=Decimal("100"),
+            monto_destino=Decimal("730000"),
+            tasa_de_cambio_aplicada=Decimal("7300"),
+            estado=estado,
+            procesado_por=self.user,
+            medio_pago_datos={"test": "ok"},
+        )
+
+    def test_transicion_sin_validar_la_fila(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        t = self._transaccion()
+
+        with CaptureQueriesContext(connection) as ctx:
+            t.cambiar_estado("pagada", observacion="Pago confirmado", usuario=self.user)
+        consultas = [q["sql"] for q in ctx.captured_queries]
+
+        self.assertFalse([sql for sql in consultas if '"divisas_divisa"' in sql],
+                         "❌ Un cambio de estado no debería volver a validar las divisas")
+        self.assertEqual(t.estado, "pagada")
+        self.assertIn("Pago confirmado", t.observaciones)
+        self.assertEqual(t.observacion, "Pago confirmado")
+
+    def test_transiciones_invalidas(self):
+        from django.core.exceptions import ValidationError
+        from transacciones.models import TransicionInvalida
+        t = self._transaccion()
+        # Como siempre, pasar al mismo estado se permite y queda en el historial
+        t.cambiar_estado("pendiente")
+        self.assertEqual(HistorialTransaccion.objects.filter(transaccion=t).count(), 1,
+                         "❌ pendiente → pendiente debería registrarse en el historial")
+        with self.assertRaises(ValidationError, msg="❌ Un estado desconocido no debería aceptarse"):
+            t.cambiar_estado("inexistente")
+
+        otra_copia = Transaccion.objects.get(pk=t.pk)
+        t.cambiar_estado("cancelada")
+        with self.assertRaises(TransicionInvalida, msg="❌ Una copia vieja no debería pisar la cancelación"):
+            otra_copia.cambiar_estado("pagada")
+        self.assertEqual(otra_copia.estado, "cancelada")
+        self.assertEqual(HistorialTransaccion.objects.filter(transaccion=t).count(), 2)
+        self.assertEqual([valor for valor, _ in t.estados_siguientes],
+                         ["pendiente", "pagada", "anulada", "completado"])
+
+    def test_transiciones_de_siempre(self):
+        """Se conservan los cambios de estado que ya se permitían, incluido 'a_retirar'."""
+        t = self._transaccion()
+        t.cambiar_estado("anulada")
+        t.cambiar_estado("completado")
+        self.assertEqual(t.estado, "completado")
+
+        retiro = self._transaccion()
+        Transaccion.objects.filter(pk=retiro.pk).update(estado="a_retirar")
+        retiro.refresh_from_db()
+        self.assertTrue(retiro.puede_anularse, "❌ Una transacción a retirar debería poder anularse")
+        self.assertFalse(retiro.puede_cancelarse)
+        retiro.cambiar_estado("anulada")
+        self.assertEqual(retiro.estado, "anulada")
+
+    def test_transicionar_en_bloque(self):
+        pendientes = [self._transaccion() for _ in range(3)]
+        pagada = self._transaccion(estado="pagada")
+
+        cambiadas = Transaccion.transicionar(
+            [t.pk for t in pendientes] + [pagada.pk], "cancelada", "Cierre de caja", self.user, desde=["pendiente"]
+        )
+
+        self.assertEqual(set(cambiadas), {t.pk for t in pendientes},
+                         "❌ Sólo las pendientes deberían cancelarse")
+        self.assertEqual(Transaccion.objects.filter(estado="cancelada").count(), 3)
+        self.assertEqual(
+            HistorialTransaccion.objects.filter(estado_anterior="pendiente", estado_nuevo="cancelada",
+                                                modificado_por=self.user).count(), 3)
+        pagada.refresh_from_db()
+        self.assertEqual(pagada.estado, "pagada")
+
 
 # ============================================================
 # SIGNALS
@@ -131,6 +215,260 @@ class TransaccionesSignalsTest(TestCase):
             "❌ No se encontró historial con estado_nuevo='cancelada'"
         )
 
+    def test_publicacion_cancela_pendientes_en_una_pasada(self):
+        from divisas.models import TasaCambio
+        from divisas.services import generar_cotizaciones_por_segmento
+        Segmento.objects.create(name="vip")
+        pendientes = [
+            Transaccion.objects.create(
+                numero_transaccion=f"TRXPUB{i}",
+                tipo_operacion="venta",
+                cliente=self.cliente,
+                divisa_origen=self.divisa_usd,
+                divisa_destino=self.divisa_pyg,
+                monto_origen=Decimal("100"),
+                monto_destino=Decimal("730000"),
+                tasa_de_cambio_aplicada=Decimal("7300"),
+                procesado_por=self.user,
+                medio_pago_datos={"test": "ok"},
+            )
+            for i in range(3)
+        ]
+        pagada = pendientes.pop()
+        Transaccion.objects.filter(pk=pagada.pk).update(estado="pagada")
+
+        tasa = TasaCambio.objects.create(divisa=self.divisa_usd, precio_base=Decimal("7400"))
+        generar_cotizaciones_por_segmento(self.divisa_usd, tasa, self.user)
+
+        for t in pendientes:
+            t.refresh_from_db()
+            self.assertEqual(t.estado, "cancelada",
+                             f"❌ Estado esperado='cancelada', obtenido='{t.estado}'")
+            self.assertEqual(
+                HistorialTransaccion.objects.filter(transaccion=t, estado_nuevo="cancelada").count(), 1,
+                "❌ Se esperaba exactamente un historial de cancelación por transacción"
+            )
+        pagada.refresh_from_db()
+        self.assertEqual(pagada.estado, "pagada", "❌ Se canceló una transacción que no estaba pendiente")
+
+class TransaccionesReservaTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="u3", password="1234")
+        self.cliente = Cliente.objects.create(nombre_completo="Cliente R", esta_activo=True)
+        self.divisa_usd = Divisa.objects.create(code="USD", nombre="Dólar", decimales=2)
+        self.divisa_pyg = Divisa.objects.create(code="PYG", nombre="Guaraní", decimales=0)
+        self.segmento = Segmento.objects.create(name="general")
+        self.cotizacion = self._cotizar(Decimal("7300"))
+
+    def _cotizar(self, precio):
+        return CotizacionSegmento.objects.create(
+            divisa=self.divisa_usd,
+            segmento=self.segmento,
+            precio_base=precio,
+            comision_compra=Decimal("10"),
+            comision_venta=Decimal("10"),
+            porcentaje_descuento=Decimal("0"),
+            valor_compra_unit=precio - 10,
+            valor_venta_unit=precio + 10,
+            creado_por=self.user,
+        )
+
+    def _transaccion(self, reserva=None, numero="TRXRES1"):
+        return Transaccion.objects.create(
+            numero_transaccion=numero,
+            reserva=reserva,
+            tipo_operacion="venta",
+            cliente=self.cliente,
+            divisa_origen=self.divisa_usd,
+            divisa_destino=self.divisa_pyg,
+            monto_origen=Decimal("100"),
+            monto_destino=Decimal("729000"),
+            tasa_de_cambio_aplicada=Decimal("7290"),
+            procesado_por=self.user,
+            medio_pago_datos={"test": "ok"},
+        )
+
+    def test_reserva_se_consume_una_sola_vez(self):
+        from transacciones.models import ReservaCotizacion, ReservaVencida
+        reserva = ReservaCotizacion.reservar(self.cotizacion, "venta", Decimal("7290"), usuario=self.user)
+
+        with self.assertNumQueries(2):
+            consumida = ReservaCotizacion.consumir(reserva.pk, "usd", "venta")
+        self.assertEqual(consumida.estado, "consumida")
+        self.assertIsNotNone(consumida.consumida_en)
+
+        with self.assertRaises(ReservaVencida, msg="❌ Una reserva no debería consumirse dos veces"):
+            ReservaCotizacion.consumir(reserva.pk, "USD", "venta")
+
+    def test_reserva_vencida_o_de_otra_operacion(self):
+        from transacciones.models import ReservaCotizacion, ReservaVencida
+        vencida = ReservaCotizacion.reservar(self.cotizacion, "venta", Decimal("7290"), segundos=0)
+        otra = ReservaCotizacion.reservar(self.cotizacion, "compra", Decimal("7310"))
+
+        for reserva_id, divisa, tipo in [
+            (vencida.pk, "USD", "venta"),
+            (otra.pk, "USD", "venta"),
+            (otra.pk, "EUR", "compra"),
+            ("no-es-un-uuid", "USD", "compra"),
+        ]:
+            with self.assertRaises(ReservaVencida, msg=f"❌ No debería consumirse {reserva_id} {divisa} {tipo}"):
+                ReservaCotizacion.consumir(reserva_id, divisa, tipo)
+
+        self.assertEqual(ReservaCotizacion.consumir(otra.pk, "USD", "compra").pk, otra.pk)
+
+    def test_tasa_nueva_expira_reservas_sin_cancelar_reservadas(self):
+        from transacciones.models import ReservaCotizacion, ReservaVencida
+        usada = ReservaCotizacion.reservar(self.cotizacion, "venta", Decimal("7290"))
+        libre = ReservaCotizacion.reservar(self.cotizacion, "venta", Decimal("7290"))
+        con_reserva = self._transaccion(ReservaCotizacion.consumir(usada.pk, "USD", "venta"))
+        sin_reserva = self._transaccion(numero="TRXRES2")
+
+        self._cotizar(Decimal("7400"))
+
+        libre.refresh_from_db()
+        self.assertEqual(libre.estado, "expirada", "❌ La tasa nueva debería expirar las reservas activas")
+        with self.assertRaises(ReservaVencida):
+            ReservaCotizacion.consumir(libre.pk, "USD", "venta")
+
+        con_reserva.refresh_from_db()
+        sin_reserva.refresh_from_db()
+        self.assertEqual(con_reserva.estado, "pendiente",
+                         "❌ Una transacción con tasa reservada no debería cancelarse")
+        self.assertEqual(sin_reserva.estado, "cancelada")
+
+        self.assertEqual(ReservaCotizacion.purgar(), 1, "❌ Sólo la reserva expirada debería purgarse")
+        self.assertTrue(ReservaCotizacion.objects.filter(pk=usada.pk).exists())
+
+    def test_purgar_reservas_vencidas_expiradas_y_consumidas(self):
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from transacciones.models import ReservaCotizacion
+
+        def reservar(**kwargs):
+            return ReservaCotizacion.reservar(self.cotizacion, "venta", Decimal("7290"), **kwargs)
+
+        vigente = reservar()
+        reciente = reservar()
+        vieja = reservar()
+        vencida = reservar(segundos=0)
+        expirada = reservar()
+        ReservaCotizacion.objects.filter(pk=expirada.pk).update(estado="expirada")
+        ReservaCotizacion.consumir(reciente.pk, "USD", "venta")
+        trx = self._transaccion(ReservaCotizacion.consumir(vieja.pk, "USD", "venta"))
+        Transaccion.objects.filter(pk=trx.pk).update(estado="completado")
+        ReservaCotizacion.objects.filter(pk=vieja.pk).update(consumida_en=timezone.now() - timedelta(days=8))
+
+        salida = StringIO()
+        call_command("purgar_reservas", stdout=salida)
+        print(salida.getvalue().strip())
+        self.assertIn("Reservas purgadas: 3", salida.getvalue())
+        self.assertEqual(
+            set(ReservaCotizacion.objects.values_list("pk", flat=True)), {vigente.pk, reciente.pk},
+            "❌ Debían quedar sólo la reserva vigente y la consumida reciente",
+        )
+        self.assertFalse(ReservaCotizacion.objects.filter(pk__in=[vencida.pk, expirada.pk, vieja.pk]).exists())
+        trx.refresh_from_db()
+        self.assertIsNone(trx.reserva_id, "❌ La transacción debía soltar la reserva purgada")
+
+    def test_purgar_conserva_reserva_de_pendiente(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from divisas.signals import cotizaciones_publicadas
+        from transacciones.models import ReservaCotizacion
+        reservas = [ReservaCotizacion.reservar(self.cotizacion, "venta", Decimal("7290")) for _ in range(3)]
+        pendiente = self._transaccion(ReservaCotizacion.consumir(reservas[0].pk, "USD", "venta"))
+        for reserva in reservas[1:]:
+            ReservaCotizacion.consumir(reserva.pk, "USD", "venta")
+        ReservaCotizacion.objects.update(consumida_en=timezone.now() - timedelta(days=8))
+
+        self.assertEqual(ReservaCotizacion.purgar(lote=1), 2, "❌ Debían purgarse las dos reservas sueltas")
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.reserva_id, reservas[0].pk, "❌ La pendiente no debía perder su reserva")
+
+        cotizaciones_publicadas.send(sender=CotizacionSegmento, divisa=self.divisa_usd, tasa=None, cotizaciones=[])
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, "pendiente", "❌ Una pendiente con tasa reservada no debía cancelarse")
+
+
+class TransaccionesNumeracionTest(TransactionTestCase):
+    """Se usa TransactionTestCase para que los hilos vean los datos commiteados."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="u4", password="1234")
+        self.cliente = Cliente.objects.create(nombre_completo="Cliente N", esta_activo=True)
+        self.divisa_usd = Divisa.objects.create(code="USD", nombre="Dólar", decimales=2)
+        self.divisa_pyg = Divisa.objects.create(code="PYG", nombre="Guaraní", decimales=0)
+
+    def _transaccion(self):
+        return Transaccion.objects.create(
+            tipo_operacion="venta",
+            cliente=self.cliente,
+            divisa_origen=self.divisa_usd,
+            divisa_destino=self.divisa_pyg,
+            monto_origen=Decimal("1"),
+            monto_destino=Decimal("7300"),
+            tasa_de_cambio_aplicada=Decimal("7300"),
+            procesado_por=self.user,
+            medio_pago_datos={"test": "ok"},
+        )
+
+    def test_numeros_unicos_en_el_mismo_segundo(self):
+        import re
+        from django.utils import timezone
+        numeros = [self._transaccion().numero_transaccion for _ in range(30)]
+
+        self.assertEqual(len(set(numeros)), 30, "❌ Números repetidos en el mismo segundo")
+        self.assertEqual(numeros, sorted(numeros), "❌ Los números deberían ser crecientes en el proceso")
+        hoy = timezone.localdate().strftime("%Y%m%d")
+        for numero in numeros:
+            self.assertRegex(numero, rf"^TRX{hoy}\d{{9}}$", f"❌ Formato inesperado: {numero}")
+
+    def test_creacion_concurrente(self):
+        import threading
+        from django.db import connection, OperationalError
+        from transacciones.numeracion import Numerador
+
+        hilos, por_hilo = 8, 25
+        errores, lock = [], threading.Lock()
+
+        def crear():
+            try:
+                creadas = 0
+                while creadas < por_hilo:
+                    try:
+                        self._transaccion()
+                        creadas += 1
+                    except OperationalError:
+                        # La base en memoria de SQLite (caché compartida) no
+                        # espera los bloqueos: se reintenta. Una colisión de
+                        # número sería IntegrityError y falla el test.
+                        if connection.vendor != "sqlite":
+                            raise
+            except Exception as e:
+                with lock:
+                    errores.append(e)
+            finally:
+                connection.close()
+
+        trabajadores = [threading.Thread(target=crear) for _ in range(hilos)]
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+
+        self.assertEqual(errores, [], f"❌ Errores al crear en paralelo: {errores[:3]}")
+        numeros = list(Transaccion.objects.values_list("numero_transaccion", flat=True))
+        self.assertEqual(len(numeros), hilos * por_hilo)
+        self.assertEqual(len(set(numeros)), hilos * por_hilo, "❌ Números repetidos en paralelo")
+
+        # Dos numeradores (como dos procesos) nunca entregan el mismo correlativo
+        a, b = Numerador(10), Numerador(10)
+        correlativos = [n.siguiente() for _ in range(15) for n in (a, b)]
+        self.assertEqual(len(set(correlativos)), 30, "❌ Dos numeradores compartieron un correlativo")
+
+
 # ============================================================
 # VIEWS
 # ============================================================
@@ -161,3 +499,239 @@ class TransaccionesViewsTest(TestCase):
                          f"❌ Respuesta esperada=200, obtenida={resp.status_code}")
         self.assertIn(t.numero_transaccion, resp.content.decode(),
                       f"❌ Número {t.numero_transaccion} no aparece en la vista")
+
+
+class TransaccionesCambioMasivoTest(TestCase):
+    def setUp(self):
+        self.staff_user = User.objects.create_user(username="staff2", password="1234", is_staff=True,
+                                                   is_superuser=True, email="staff2@example.com")
+        self.client = Client()
+        self.client.force_login(self.staff_user)
+        self.cliente = Cliente.objects.create(nombre_completo="Cliente M", esta_activo=True)
+        self.divisa_usd = Divisa.objects.create(code="USD", nombre="Dólar", decimales=2)
+        self.divisa_pyg = Divisa.objects.create(code="PYG", nombre="Guaraní", decimales=0)
+        self.pendientes = [self._transaccion() for _ in range(4)]
+        self.cancelada = self._transaccion(estado="cancelada")
+
+    def _transaccion(self, estado="pendiente", tipo="venta"):
+        return Transaccion.objects.create(
+            tipo_operacion=tipo,
+            cliente=self.cliente,
+            divisa_origen=self.divisa_usd if tipo == "venta" else self.divisa_pyg,
+            divisa_destino=self.divisa_pyg if tipo == "venta" else self.divisa_usd,
+            monto_origen=Decimal("100"),
+            monto_destino=Decimal("730000"),
+            tasa_de_cambio_aplicada=Decimal("7300"),
+            estado=estado,
+            procesado_por=self.staff_user,
+            medio_pago_datos={"test": "ok"},
+        )
+
+    def _post(self, datos):
+        return self.client.post(reverse("transacciones:cambiar_estado_masivo"),
+                                data=json.dumps(datos), content_type="application/json")
+
+    def test_cambio_por_numeros_informa_rechazadas(self):
+        numeros = [t.numero_transaccion for t in self.pendientes] + [self.cancelada.numero_transaccion, "TRXNOEXISTE"]
+        resp = self._post({"nuevo_estado": "cancelada", "numeros": numeros, "observaciones": "Cierre"})
+        datos = resp.json()
+
+        self.assertEqual(resp.status_code, 200, f"❌ Respuesta inesperada: {datos}")
+        self.assertEqual(sorted(datos["cambiadas"]), sorted(t.numero_transaccion for t in self.pendientes))
+        rechazadas = {r["numero_transaccion"]: r for r in datos["rechazadas"]}
+        self.assertEqual(set(rechazadas), {self.cancelada.numero_transaccion, "TRXNOEXISTE"},
+                         "❌ Deberían informarse la ya cancelada y la inexistente")
+        self.assertEqual(rechazadas[self.cancelada.numero_transaccion]["estado"], "cancelada")
+        self.assertEqual(Transaccion.objects.filter(estado="cancelada").count(), 5)
+        self.assertEqual(HistorialTransaccion.objects.filter(estado_nuevo="cancelada").count(), 4)
+
+    def test_cambio_por_filtros(self):
+        compra = self._transaccion(tipo="compra")
+        resp = self._post({"nuevo_estado": "cancelada", "filtros": {"tipo": "compra"}})
+
+        self.assertEqual(resp.json()["cambiadas"], [compra.numero_transaccion],
+                         "❌ Sólo debería cancelarse la compra filtrada")
+        self.assertEqual(Transaccion.objects.filter(estado="pendiente").count(), 4)
+
+    def test_maximo_sin_traer_toda_la_seleccion(self):
+        from django.db import connection
+        from django.test import override_settings
+        from django.test.utils import CaptureQueriesContext
+        with override_settings(TRANSACCIONES_CAMBIO_MASIVO_MAX=3):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self._post({"nuevo_estado": "pagada", "filtros": {"estado": "pendiente"}})
+            consulta_ids = [q["sql"] for q in ctx.captured_queries if '"transacciones_transaccion"' in q["sql"]]
+            por_numeros = self._post({"nuevo_estado": "pagada",
+                                      "numeros": [t.numero_transaccion for t in self.pendientes]})
+
+        self.assertEqual(resp.status_code, 400, "❌ Cuatro pendientes superan el máximo de 3")
+        self.assertEqual(por_numeros.status_code, 400)
+        self.assertTrue(consulta_ids and all("LIMIT 4" in sql for sql in consulta_ids),
+                        f"❌ Los ids deberían traerse con LIMIT máximo + 1: {consulta_ids}")
+        self.assertFalse(Transaccion.objects.filter(estado="pagada").exists())
+
+    def test_errores_y_permisos(self):
+        self.assertEqual(self._post({"nuevo_estado": "volando", "numeros": ["X"]}).status_code, 400)
+        self.assertEqual(self._post({"nuevo_estado": "pagada"}).status_code, 400)
+
+        normal = User.objects.create_user(username="normal", password="1234", email="normal@example.com")
+        self.client.force_login(normal)
+        resp = self._post({"nuevo_estado": "pagada", "numeros": [self.pendientes[0].numero_transaccion]})
+        self.assertNotEqual(resp.status_code, 200, "❌ Un usuario sin staff no debería cambiar estados")
+        self.assertFalse(Transaccion.objects.filter(estado="pagada").exists())
+
+    def test_accion_admin(self):
+        url = reverse("admin:transacciones_transaccion_changelist")
+        seleccion = [t.pk for t in self.pendientes[:2]] + [self.cancelada.pk]
+        resp = self.client.post(url, {"action": "marcar_cancelada", "_selected_action": seleccion}, follow=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Transaccion.objects.filter(estado="cancelada").count(), 3)
+        mensajes = [str(m) for m in resp.context["messages"]]
+        self.assertTrue(any(self.cancelada.numero_transaccion in m for m in mensajes),
+                        f"❌ La ya cancelada debería informarse: {mensajes}")
+        resp = self.client.post(url, {"action": "marcar_pagada", "_selected_action": seleccion}, follow=True)
+        self.assertEqual(Transaccion.objects.filter(estado="pagada").count(), 3)
+
+
+class TransaccionesEstadisticasTest(TestCase):
+    def setUp(self):
+        self.staff_user = User.objects.create_user(username="staff3", password="1234", is_staff=True,
+                                                   email="staff3@example.com")
+        self.client = Client()
+        self.client.force_login(self.staff_user)
+        self.cliente = Cliente.objects.create(nombre_completo="Cliente E", esta_activo=True)
+        self.divisa_usd = Divisa.objects.create(code="USD", nombre="Dólar", decimales=2)
+        self.divisa_pyg = Divisa.objects.create(code="PYG", nombre="Guaraní", decimales=0)
+
+    def _transaccion(self, tipo="venta"):
+        return Transaccion.objects.create(
+            tipo_operacion=tipo,
+            cliente=self.cliente,
+            divisa_origen=self.divisa_usd if tipo == "venta" else self.divisa_pyg,
+            divisa_destino=self.divisa_pyg if tipo == "venta" else self.divisa_usd,
+            monto_origen=Decimal("100"),
+            monto_destino=Decimal("730000"),
+            tasa_de_cambio_aplicada=Decimal("7300"),
+            procesado_por=self.staff_user,
+            medio_pago_datos={"test": "ok"},
+        )
+
+    def _contadores(self):
+        from transacciones.models import ContadorTransacciones
+        return {(c.tipo_operacion, c.estado): c.cantidad
+                for c in ContadorTransacciones.objects.exclude(cantidad=0)}
+
+    def test_contadores_siguen_altas_cambios_y_borrados(self):
+        from transacciones.models import ContadorTransacciones, cancelar_pendientes_por_divisa
+        ventas = [self._transaccion() for _ in range(3)]
+        compras = [self._transaccion("compra") for _ in range(2)]
+        ventas[0].cambiar_estado("pagada")
+        Transaccion.transicionar([compras[0].pk], "cancelada")
+        cancelar_pendientes_por_divisa(self.divisa_usd, "Tasa nueva")
+        compras[1].refresh_from_db()
+        compras[1].delete()
+
+        incrementales = self._contadores()
+        self.assertEqual(incrementales, {("venta", "pagada"): 1, ("venta", "cancelada"): 2,
+                                         ("compra", "cancelada"): 1})
+        ContadorTransacciones.recalcular()
+        self.assertEqual(self._contadores(), incrementales,
+                         "❌ Los contadores incrementales no coinciden con el recálculo")
+
+    def test_historial_admin_no_cuenta_la_tabla(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self._transaccion()
+        self._transaccion("compra").cambiar_estado("pagada")
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("transacciones:historial_admin"))
+        conteos = [q["sql"] for q in ctx.captured_queries
+                   if "COUNT(" in q["sql"] and '"transacciones_transaccion"' in q["sql"]]
+
+        self.assertEqual(resp.context["estadisticas"],
+                         {"total": 2, "compras": 1, "ventas": 1, "pendientes": 1, "pagadas": 1})
+        self.assertLessEqual(len(conteos), 1,
+                             f"❌ Sólo el paginador debería contar transacciones: {conteos}")
+
+    def test_estadisticas_cliente_una_consulta(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from clientes.models import AsignacionCliente
+        AsignacionCliente.objects.create(usuario=self.staff_user, cliente=self.cliente)
+        self._transaccion()
+        self._transaccion("compra")
+        sesion = self.client.session
+        sesion["cliente_id"] = self.cliente.id
+        sesion.save()
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse("transacciones:historial_cliente"))
+        agregados = [q["sql"] for q in ctx.captured_queries
+                     if "COUNT(" in q["sql"] and '"transacciones_transaccion"' in q["sql"]]
+
+        self.assertEqual(resp.context["estadisticas"],
+                         {"total_transacciones": 2, "total_compras": 1, "total_ventas": 1, "pendientes": 2})
+        self.assertLessEqual(len(agregados), 2,
+                             f"❌ Estadísticas y paginador deberían ser a lo sumo dos conteos: {agregados}")
+
+
+class TransaccionesPaginacionTest(TestCase):
+    def setUp(self):
+        self.staff_user = User.objects.create_user(username="staff4", password="1234", is_staff=True,
+                                                   email="staff4@example.com")
+        self.client = Client()
+        self.client.force_login(self.staff_user)
+        self.cliente = Cliente.objects.create(nombre_completo="Cliente P", esta_activo=True)
+        self.divisa_usd = Divisa.objects.create(code="USD", nombre="Dólar", decimales=2)
+        self.divisa_pyg = Divisa.objects.create(code="PYG", nombre="Guaraní", decimales=0)
+        # Todas en el mismo instante: el orden lo desempata el id
+        self.numeros = [
+            Transaccion.objects.create(
+                tipo_operacion="venta",
+                cliente=self.cliente,
+                divisa_origen=self.divisa_usd,
+                divisa_destino=self.divisa_pyg,
+                monto_origen=Decimal("100"),
+                monto_destino=Decimal("730000"),
+                tasa_de_cambio_aplicada=Decimal("7300"),
+                procesado_por=self.staff_user,
+                medio_pago_datos={"test": "ok"},
+            ).numero_transaccion
+            for _ in range(60)
+        ]
+        Transaccion.objects.update(fecha_creacion=Transaccion.objects.first().fecha_creacion)
+
+    def test_historial_admin_por_cursor(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse("transacciones:historial_admin")
+        vistos, siguiente, paginas = [], url, 0
+
+        while siguiente:
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(siguiente if siguiente.startswith("/") else url + siguiente)
+            self.assertFalse([q["sql"] for q in ctx.captured_queries if "OFFSET" in q["sql"]],
+                             "❌ La paginación no debería usar OFFSET")
+            pagina = resp.context["pagina"]
+            vistos += [t.numero_transaccion for t in pagina]
+            siguiente = pagina.url_siguiente
+            paginas += 1
+
+        self.assertEqual(paginas, 3)
+        self.assertEqual(vistos, list(reversed(self.numeros)),
+                         "❌ Las páginas deberían recorrer todo el historial sin repetir ni saltear")
+
+    def test_filtros_se_conservan_en_el_cursor(self):
+        Transaccion.transicionar(
+            list(Transaccion.objects.order_by("id").values_list("id", flat=True)[:30]), "pagada"
+        )
+        resp = self.client.get(reverse("transacciones:historial_admin"), {"estado": "pagada"})
+        pagina = resp.context["pagina"]
+
+        self.assertIn("estado=pagada", pagina.url_siguiente)
+        resp = self.client.get(reverse("transacciones:historial_admin") + pagina.url_siguiente)
+        segunda = list(resp.context["pagina"])
+        self.assertEqual(len(segunda), 5)
+        self.assertTrue(all(t.estado == "pagada" for t in segunda))
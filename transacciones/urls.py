@@ -22,6 +22,7 @@ urlpatterns = [
     
     # Gestión de estados (admin)
     path('cambiar-estado/<str:numero_transaccion>/', views.cambiar_estado_transaccion, name='cambiar_estado'),
+    path('cambiar-estado-masivo/', views.cambiar_estado_masivo, name='cambiar_estado_masivo'),
     
     # Cancelar transacción (cliente)
     path('cancelar/<str:numero_transaccion>/', views.cancelar_transaccion, name='cancelar'),
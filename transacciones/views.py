@@ -3,20 +3,22 @@ from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView
-from django.db.models import Q
-from django.core.paginator import Paginator
+from django.db.models import Count, Q
+from casa_de_cambios.paginacion import paginar_request
 from django.http import JsonResponse
 from django.db import transaction
 from datetime import datetime, timedelta
 from .models import HistorialTransaccion
 from clientes.models import Cliente
 from divisas.models import Divisa
+from divisas.tokens import verificar_cotizacion
 from clientes.views import get_medio_acreditacion_seleccionado, get_medio_pago_seleccionado
 from decimal import Decimal
+import json
 import logging
 from django.contrib import messages
 from django.shortcuts import render, redirect
-from transacciones.models import Transaccion
+from transacciones.models import Transaccion, ContadorTransacciones, ReservaCotizacion, ReservaVencida
 logger = logging.getLogger(__name__)
 from clientes.services import verificar_limites
 from decimal import Decimal, ROUND_HALF_UP
@@ -79,6 +81,15 @@ def crear_transaccion_desde_venta(request):
         if not codigo_divisa:
             messages.error(request, "No se encontró el código de divisa en la operación.")
             return redirect('divisas:venta_sumario')
+
+        # Sin reserva (operaciones iniciadas antes de las reservas), verificar
+        # en memoria que el precio simulado siga vigente
+        reserva_id = operacion.get('reserva_id')
+        if not reserva_id:
+            vigente, motivo = verificar_cotizacion(operacion.get('token_cotizacion'), codigo_divisa)
+            if not vigente:
+                messages.error(request, motivo)
+                return redirect('divisas:venta')
         
         # Buscar divisas con manejo de errores más específico
         try:
@@ -124,9 +135,13 @@ def crear_transaccion_desde_venta(request):
         # Preparar datos del medio
         medio_datos = preparar_datos_medio(medio_inst)
 
-        # Crear transacción
+        # Crear transacción consumiendo la reserva en la misma transacción
         with transaction.atomic():
+            reserva = None
+            if reserva_id:
+                reserva = ReservaCotizacion.consumir(reserva_id, codigo_divisa, 'venta')
             transaccion = Transaccion.objects.create(
+                reserva=reserva,
                 tipo_operacion='venta',
                 cliente=cliente,
                 divisa_origen=divisa_origen,
@@ -154,6 +169,9 @@ def crear_transaccion_desde_venta(request):
         messages.success(request, f'Transacción {transaccion.numero_transaccion} creada exitosamente.')
         return redirect('transacciones:confirmacion_operacion', numero_transaccion=transaccion.numero_transaccion)
 
+    except ReservaVencida as e:
+        messages.error(request, str(e))
+        return redirect('divisas:venta')
     except Exception as e:
         logger.error(f"Error al crear transacción de venta: {e}")
         messages.error(request, f"Error al procesar la transacción: {str(e)}")
@@ -197,6 +215,15 @@ def crear_transaccion_desde_compra(request):
         if not codigo_divisa:
             messages.error(request, "No se encontró el código de divisa en la operación.")
             return redirect('divisas:compra_sumario')
+
+        # Sin reserva (operaciones iniciadas antes de las reservas), verificar
+        # en memoria que el precio simulado siga vigente
+        reserva_id = operacion.get('reserva_id')
+        if not reserva_id:
+            vigente, motivo = verificar_cotizacion(operacion.get('token_cotizacion'), codigo_divisa)
+            if not vigente:
+                messages.error(request, motivo)
+                return redirect('divisas:compra')
                 
         # Obtener divisas - Para compra: origen=PYG, destino=divisa comprada
         try:
@@ -279,9 +306,13 @@ def crear_transaccion_desde_compra(request):
         # Preparar datos del medio
         medio_datos = preparar_datos_medio(medio_inst)
         
-        # Crear la transacción
+        # Crear la transacción consumiendo la reserva en la misma transacción
         with transaction.atomic():
+            reserva = None
+            if reserva_id:
+                reserva = ReservaCotizacion.consumir(reserva_id, codigo_divisa, 'compra')
             transaccion = Transaccion.objects.create(
+                reserva=reserva,
                 tipo_operacion='compra',
                 cliente=cliente,
                 divisa_origen=divisa_origen,
@@ -312,6 +343,9 @@ def crear_transaccion_desde_compra(request):
         # Redirigir a la página de confirmación
         return redirect('transacciones:confirmacion_operacion', numero_transaccion=transaccion.numero_transaccion)
         
+    except ReservaVencida as e:
+        messages.error(request, str(e))
+        return redirect('divisas:compra')
     except Exception as e:
         logger.error(f"Error al crear transacción de compra: {e}")
         messages.error(request, f"Error al procesar la transacción: {str(e)}")
@@ -405,7 +439,7 @@ class HistorialTransaccionesClienteView(LoginRequiredMixin, ListView):
     model = Transaccion
     template_name = 'historial_cliente.html'
     context_object_name = 'transacciones'
-    paginate_by = 20
+    por_pagina = 20
 
     def get_queryset(self):
         # Obtener cliente activo de la sesión
@@ -456,6 +490,11 @@ class HistorialTransaccionesClienteView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+
+        # Paginación por cursor sobre (fecha_creacion, id)
+        pagina = paginar_request(self.request, self.object_list, ['-fecha_creacion', '-id'], self.por_pagina)
+        context['pagina'] = pagina
+        context['transacciones'] = pagina.object_list
         
         cliente_id = self.request.session.get('cliente_id')
         if cliente_id:
@@ -467,12 +506,13 @@ class HistorialTransaccionesClienteView(LoginRequiredMixin, ListView):
         # Estadísticas del cliente
         if context.get('cliente_activo'):
             cliente = context['cliente_activo']
-            context['estadisticas'] = {
-                'total_transacciones': Transaccion.objects.filter(cliente=cliente).count(),
-                'total_compras': Transaccion.objects.filter(cliente=cliente, tipo_operacion='compra').count(),
-                'total_ventas': Transaccion.objects.filter(cliente=cliente, tipo_operacion='venta').count(),
-                'pendientes': Transaccion.objects.filter(cliente=cliente, estado='pendiente').count(),
-            }
+            # Una sola pasada con agregación condicional
+            context['estadisticas'] = Transaccion.objects.filter(cliente=cliente).aggregate(
+                total_transacciones=Count('id'),
+                total_compras=Count('id', filter=Q(tipo_operacion='compra')),
+                total_ventas=Count('id', filter=Q(tipo_operacion='venta')),
+                pendientes=Count('id', filter=Q(estado='pendiente')),
+            )
         
         # Mantener valores de filtros en el contexto
         context['filtros'] = {
@@ -493,32 +533,32 @@ def is_staff_or_admin(user):
     return user.is_authenticated and (user.is_staff or user.is_superuser)
 
 
-@user_passes_test(is_staff_or_admin)
-def historial_admin(request):
+def filtrar_transacciones_admin(transacciones, filtros):
     """
-    Vista administrativa para ver todas las transacciones
+    Aplica los filtros del historial administrativo (cliente, tipo, estado,
+    rango de fechas y búsqueda) a un queryset de transacciones.
+
+    :param transacciones: Queryset base.
+    :type transacciones: django.db.models.QuerySet
+    :param filtros: ``request.GET`` o un dict con las mismas claves.
+    :type filtros: dict
+    :rtype: django.db.models.QuerySet
     """
-    # Filtros base
-    transacciones = Transaccion.objects.select_related(
-        'cliente', 'divisa_origen', 'divisa_destino', 'procesado_por'
-    ).order_by('-fecha_creacion')
-    
-    # Aplicar filtros
-    cliente_id = request.GET.get('cliente')
+    cliente_id = filtros.get('cliente')
     if cliente_id:
         transacciones = transacciones.filter(cliente_id=cliente_id)
     
-    tipo_filtro = request.GET.get('tipo')
+    tipo_filtro = filtros.get('tipo')
     if tipo_filtro in ['compra', 'venta']:
         transacciones = transacciones.filter(tipo_operacion=tipo_filtro)
     
-    estado_filtro = request.GET.get('estado')
+    estado_filtro = filtros.get('estado')
     if estado_filtro:
         transacciones = transacciones.filter(estado=estado_filtro)
     
     # Filtros de fecha
-    fecha_desde = request.GET.get('fecha_desde')
-    fecha_hasta = request.GET.get('fecha_hasta')
+    fecha_desde = filtros.get('fecha_desde')
+    fecha_hasta = filtros.get('fecha_hasta')
     
     if fecha_desde:
         try:
@@ -535,32 +575,46 @@ def historial_admin(request):
             pass
     
     # Búsqueda por número de transacción o nombre de cliente
-    busqueda = request.GET.get('busqueda')
+    busqueda = filtros.get('busqueda')
     if busqueda:
         transacciones = transacciones.filter(
             Q(numero_transaccion__icontains=busqueda) |
             Q(cliente__nombre_completo__icontains=busqueda) |
             Q(cliente__cedula__icontains=busqueda)
         )
+
+    return transacciones
+
+
+@user_passes_test(is_staff_or_admin)
+def historial_admin(request):
+    """
+    Vista administrativa para ver todas las transacciones
+    """
+    # Filtros base
+    transacciones = Transaccion.objects.select_related(
+        'cliente', 'divisa_origen', 'divisa_destino', 'procesado_por'
+    ).order_by('-fecha_creacion')
     
-    # Paginación
-    paginator = Paginator(transacciones, 25)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Aplicar filtros
+    transacciones = filtrar_transacciones_admin(transacciones, request.GET)
+    cliente_id = request.GET.get('cliente')
+    tipo_filtro = request.GET.get('tipo')
+    estado_filtro = request.GET.get('estado')
+    fecha_desde = request.GET.get('fecha_desde')
+    fecha_hasta = request.GET.get('fecha_hasta')
+    busqueda = request.GET.get('busqueda')
     
-    # Estadísticas generales
-    total_transacciones = Transaccion.objects.count()
-    estadisticas = {
-        'total': total_transacciones,
-        'compras': Transaccion.objects.filter(tipo_operacion='compra').count(),
-        'ventas': Transaccion.objects.filter(tipo_operacion='venta').count(),
-        'pendientes': Transaccion.objects.filter(estado='pendiente').count(),
-        'pagadas': Transaccion.objects.filter(estado='pagada').count(),
-    }
+    # Paginación por cursor sobre (fecha_creacion, id): cada página cuesta lo
+    # mismo que la primera, con total estimado
+    pagina = paginar_request(request, transacciones, ['-fecha_creacion', '-id'], 25)
+    
+    # Estadísticas generales (contadores mantenidos en cada alta y cambio de estado)
+    estadisticas = ContadorTransacciones.resumen()
     
     context = {
-        'page_obj': page_obj,
-        'transacciones': page_obj,
+        'pagina': pagina,
+        'transacciones': pagina.object_list,
         'clientes': Cliente.objects.filter(esta_activo=True).order_by('nombre_completo'),
         'estadisticas': estadisticas,
         'filtros': {
@@ -647,6 +701,84 @@ def cambiar_estado_transaccion(request, numero_transaccion):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+def _excede_maximo(maximo):
+    return JsonResponse({
+        'success': False,
+        'error': f'Se seleccionaron más de {maximo} transacciones; el máximo por solicitud es {maximo}.',
+    }, status=400)
+
+
+@login_required
+@user_passes_test(is_staff_or_admin)
+def cambiar_estado_masivo(request):
+    """
+    Cambia el estado de muchas transacciones en una sola transacción de base
+    de datos (solo admin), p. ej. al cierre del día.
+
+    Recibe JSON con ``nuevo_estado``, ``observaciones`` (opcional) y, o bien
+    ``numeros`` (lista de números de transacción), o bien ``filtros`` con las
+    mismas claves que el historial administrativo. Hasta
+    ``TRANSACCIONES_CAMBIO_MASIVO_MAX`` transacciones por solicitud.
+
+    Las transacciones en un estado que no admite el cambio (o inexistentes)
+    no se modifican y se informan en ``rechazadas`` con su estado y motivo.
+
+    :param request: El objeto HttpRequest con datos JSON en el cuerpo.
+    :type request: django.http.HttpRequest
+    :return: ``{"success", "cambiadas": [numero, ...], "rechazadas": [...]}``
+    :rtype: django.http.JsonResponse
+    """
+    from django.conf import settings
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Formato JSON inválido.'}, status=400)
+
+    nuevo_estado = data.get('nuevo_estado')
+    if nuevo_estado not in dict(Transaccion.ESTADO_CHOICES):
+        return JsonResponse({'success': False, 'error': 'Estado no válido'}, status=400)
+
+    maximo = getattr(settings, 'TRANSACCIONES_CAMBIO_MASIVO_MAX', 2000)
+    numeros = data.get('numeros')
+    filtros = data.get('filtros')
+    if isinstance(numeros, list) and numeros:
+        numeros = list(dict.fromkeys(str(numero) for numero in numeros))
+        if len(numeros) > maximo:
+            return _excede_maximo(maximo)
+        encontradas = dict(
+            Transaccion.objects.filter(numero_transaccion__in=numeros).values_list('numero_transaccion', 'id')
+        )
+        ids = [encontradas[numero] for numero in numeros if numero in encontradas]
+        faltantes = [numero for numero in numeros if numero not in encontradas]
+    elif isinstance(filtros, dict) and filtros:
+        # Se trae a lo sumo un id de más: alcanza para saber si se pasa del máximo
+        ids = list(filtrar_transacciones_admin(Transaccion.objects.all(), filtros)
+                   .order_by('id').values_list('id', flat=True)[:maximo + 1])
+        if len(ids) > maximo:
+            return _excede_maximo(maximo)
+        faltantes = []
+    else:
+        return JsonResponse({'success': False, 'error': 'Indique "numeros" o "filtros".'}, status=400)
+
+    resultado = Transaccion.cambiar_estado_en_bloque(
+        ids, nuevo_estado, data.get('observaciones', ''), request.user
+    )
+    rechazadas = resultado['rechazadas'] + [
+        {'id': None, 'numero_transaccion': numero, 'estado': None, 'motivo': 'No existe'}
+        for numero in faltantes
+    ]
+    return JsonResponse({
+        'success': True,
+        'nuevo_estado': nuevo_estado,
+        'cambiadas': resultado['cambiadas'],
+        'rechazadas': rechazadas,
+    })
+
+
 @login_required
 def cancelar_transaccion(request, numero_transaccion):
     """